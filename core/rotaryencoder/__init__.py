@@ -16,6 +16,10 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-__all__ = ('RotaryEncoder', 'test',)
+__all__ = ('RotaryEncoder', 'TRANSITION_TABLE', 'INVALID', 'test',
+           'decodeSamples', 'decodeEdges', 'decodeRecording',
+           'VelocityEstimator',)
 
-from .rotary_encoder import RotaryEncoder, test
+from .rotary_encoder import RotaryEncoder, TRANSITION_TABLE, INVALID, test
+from .decoder import (
+    decodeSamples, decodeEdges, decodeRecording, VelocityEstimator)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#
+# core/rotaryencoder/benchmarks.py
+#
+
+"""
+Benchmarks for the rotary encoder decoder driven by a simulated edge source.
+
+Run with: python -m core.rotaryencoder.benchmarks
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, sys, time, tempfile
+
+from core.utils import GPIO, SimBackend
+from core.utils.events import Event
+from core.utils.fakesysfs import FakeSysfs
+from core.utils.recorder import EdgeRecorder, EdgeReplayer
+from core.rotaryencoder import RotaryEncoder, VelocityEstimator, decoder
+
+_CYCLE = ((0, 0), (0, 1), (1, 1), (1, 0))
+
+
+def simulatedEdges(count, skipEvery=0):
+    """
+    Yield count (A, B) samples turning forward, every skipEvery sample is
+    dropped to simulate a lost edge.
+    """
+    for idx in range(1, count + 1):
+        if skipEvery and not idx % skipEvery:
+            continue
+
+        yield _CYCLE[idx % 4]
+
+
+def _fractions(decoded, steps, skipEvery=0):
+    """
+    Return a dict of the fraction of the generated steps decoded and the
+    fraction expected, a skipped sample loses its own step and the next
+    unless it is the last. lostEdges is only a lower bound, these show what
+    was really missed.
+    """
+    expected = 1.0
+
+    if skipEvery:
+        skipped = steps // skipEvery
+        lost = 2 * skipped - (1 if skipped and not steps % skipEvery else 0)
+        expected = (steps - lost) / steps
+
+    return {'decoded_fraction': decoded / steps,
+            'expected_fraction': expected}
+
+
+def _warnLossy(name, result, out=sys.stderr):
+    """
+    Warn when a run decoded fewer steps than it should have, its rates are
+    then not for a working decoder.
+    """
+    if result['decoded_fraction'] < result['expected_fraction']:
+        print("WARNING {}: decoded {:.1%} of the steps, expected {:.1%}, "
+              "the rates are of a run that lost steps.".format(
+                  name, result['decoded_fraction'],
+                  result['expected_fraction']), file=out)
+        return True
+
+    return False
+
+
+def benchDecode(count=200000, skipEvery=1000):
+    """
+    Samples per second decoded, the edges counted as lost and the fraction
+    of the generated steps decoded.
+    """
+    samples = list(simulatedEdges(count, skipEvery))
+
+    with FakeSysfs(pins=(66, 67)):
+        re = RotaryEncoder('GPIO2_2', 'GPIO2_3')
+        re.initEncoder()
+        update = re.update
+        start = time.perf_counter()
+
+        for a, b in samples:
+            update(a, b)
+
+        elapsed = time.perf_counter() - start
+        result = {'samples_per_sec': len(samples) / elapsed,
+                  'edges': re.edges, 'lost_edges': re.lostEdges,
+                  'position': re.encodeRead_1()}
+        result.update(_fractions(re.edges, count, skipEvery))
+        re.resetPins()
+
+    return result
+
+
+def benchReplay(count=50000, rate=20000):
+    """
+    Records per second written, decoded when a recording is replayed as
+    fast as possible through Event dispatch, and the mean lateness of
+    records replayed at their original timing.
+    """
+    period = int(1e9 / rate)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'encoder.edges')
+        samples = list(simulatedEdges(count))
+        previous = (0, 0)
+        start = time.perf_counter()
+
+        with EdgeRecorder(path) as recorder:
+            for idx, sample in enumerate(samples):
+                # Only the phase that changed is recorded.
+                gpioId = 66 if sample[0] != previous[0] else 67
+                recorder.record(gpioId, sample[gpioId - 66], idx * period)
+                previous = sample
+
+        recordRate = count / (time.perf_counter() - start)
+        sim = SimBackend(128)
+
+        for gpioId in (66, 67):
+            sim.setMode(gpioId, direction=GPIO.IN, edge=GPIO.BOTH)
+
+        re = RotaryEncoder('P8_7', 'P8_8', gpio=GPIO(backend=sim))
+        re.initEncoder()
+
+        with Event() as event:
+            for pin in re.pins:
+                event.register(pin)
+
+            sample = re.sample
+            start = time.perf_counter()
+            EdgeReplayer(sim, path, speed=0).play(
+                event, lambda pin, mask: sample())
+            replayRate = count / (time.perf_counter() - start)
+
+        timed = EdgeReplayer(sim, path, speed=1.0, count=rate // 10)
+        timed.play()
+        result = {'record_per_sec': recordRate,
+                  'replay_per_sec': replayRate,
+                  'position': re.position, 'lost_edges': re.lostEdges,
+                  'timed_lateness_us': timed.lateness / 1000}
+        result.update(_fractions(re.edges, count))
+        re.resetPins()
+        sim.close()
+
+    return result
+
+
+def benchBatchDecode(count=200000, skipEvery=1000):
+    """
+    Samples per second decoded in a batch with NumPy, if installed, and in
+    Python, and steps per second through the streaming velocity estimator.
+    """
+    samples = list(simulatedEdges(count, skipEvery))
+    times = list(range(0, len(samples) * 1000, 1000))
+    a, b = [s[0] for s in samples], [s[1] for s in samples]
+    result = {}
+
+    if decoder.numpy is not None:
+        numpy = decoder.numpy
+        arrays = (numpy.array(times, dtype=numpy.int64),
+                  numpy.array(a, dtype=numpy.int8),
+                  numpy.array(b, dtype=numpy.int8))
+        start = time.perf_counter()
+        decoded = decoder._decodeNumpy(*arrays, initial=(0, 0))
+        result['numpy_per_sec'] = len(samples) / (
+            time.perf_counter() - start)
+
+    start = time.perf_counter()
+    decoded = decoder._decodePython(times, a, b, (0, 0))
+    result['python_per_sec'] = len(samples) / (time.perf_counter() - start)
+    estimator = VelocityEstimator()
+    update = estimator.update
+    start = time.perf_counter()
+
+    for t, position in zip(times, decoded['positions']):
+        update(t, position)
+
+    result['velocity_per_sec'] = len(samples) / (time.perf_counter() - start)
+    result.update(position=decoded['position'], invalid=decoded['invalid'])
+    result.update(_fractions(decoded['edges'], count, skipEvery))
+    return result
+
+
+def main():
+    lossy = False
+    result = benchDecode()
+    print("Decoded: {:,.0f} samples/sec, {:.1%} of the steps".format(
+        result['samples_per_sec'], result['decoded_fraction']))
+    print("Edges: {edges}, lost edges: {lost_edges}, position: "
+          "{position}".format(**result))
+    lossy |= _warnLossy('decode', result)
+    result = benchReplay()
+    print("Recorded: {:,.0f} records/sec, replayed: {:,.0f} samples/sec, "
+          "{:.1%} of the steps".format(result['record_per_sec'],
+                                       result['replay_per_sec'],
+                                       result['decoded_fraction']))
+    print("Replayed position: {position}, lost edges: {lost_edges}, "
+          "timed lateness: {timed_lateness_us:.1f}us".format(**result))
+    lossy |= _warnLossy('replay', result)
+    result = benchBatchDecode()
+
+    if 'numpy_per_sec' in result:
+        print("Batch decoded with NumPy: {:,.0f} samples/sec".format(
+            result['numpy_per_sec']))
+
+    print("Batch decoded in Python: {:,.0f} samples/sec, velocity: {:,.0f} "
+          "updates/sec".format(result['python_per_sec'],
+                               result['velocity_per_sec']))
+    print("Batch position: {position}, invalid: {invalid}, {:.1%} of the "
+          "steps".format(result['decoded_fraction'], **result))
+    lossy |= _warnLossy('batch', result)
+    return 1 if lossy else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
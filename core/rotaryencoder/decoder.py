@@ -0,0 +1,284 @@
+#
+# core/rotaryencoder/decoder.py
+#
+
+"""
+Offline quadrature decoding of captured samples and a streaming velocity
+estimator for live use. Both decode with the TRANSITION_TABLE of the live
+RotaryEncoder so the counts always agree.
+
+    times, values = pinA.drain()
+    ...
+    result = decodeSamples(times, a, b)
+    print(result['position'], result['invalid'])
+
+    result = decodeRecording('encoder.edges', phaseA=66, phaseB=67)
+
+NumPy is used when it is installed and decodes in one vectorized pass,
+without it the same results are computed in Python and returned in
+array.array objects.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from array import array
+from collections import deque
+
+from core.utils.exceptions import InvalidArgumentsException
+from core.utils.recorder import HEADER, readRecords, checkHeader
+
+from .rotary_encoder import TRANSITION_TABLE, INVALID
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def decodeSamples(times, a, b, initial=None):
+    """
+    Decode samples of both phases taken at times in monotonic ns. Returns a
+    dict of:
+
+    position  -- The steps counted over all the samples.
+    positions -- The position after each sample.
+    direction -- The step of each sample, 1 forward, -1 back or 0 for no
+                 step or an invalid transition.
+    invalid   -- The transitions where both phases changed.
+    edges     -- The valid steps counted.
+    edgeTimes -- The time of each step.
+    velocity  -- Steps per second at each step measured from the step
+                 before it, 0 for the first step.
+
+    initial -- The (A, B) state before the first sample, by default the
+               first sample.
+    """
+    if not len(times) == len(a) == len(b):
+        raise InvalidArgumentsException(
+            "The times and samples must be the same length, found: {}, {}, "
+            "{}".format(len(times), len(a), len(b)))
+
+    if numpy is not None:
+        return _decodeNumpy(times, a, b, initial)
+
+    return _decodePython(times, a, b, initial)
+
+
+def _decodeNumpy(times, a, b, initial):
+    times = numpy.asarray(times, dtype=numpy.int64)
+    states = (numpy.asarray(a, dtype=numpy.int8) << 1) | \
+             numpy.asarray(b, dtype=numpy.int8)
+
+    if not len(states):
+        return _result(0, numpy.zeros(0, numpy.int64),
+                       numpy.zeros(0, numpy.int8), 0,
+                       numpy.zeros(0, numpy.int64),
+                       numpy.zeros(0, numpy.float64))
+
+    first = states[0] if initial is None else \
+            (initial[0] << 1) | initial[1]
+    previous = numpy.empty_like(states)
+    previous[0] = first
+    previous[1:] = states[:-1]
+    direction = numpy.asarray(TRANSITION_TABLE, dtype=numpy.int8)[
+        (previous << 2) | states]
+    lost = direction == INVALID
+    direction[lost] = 0
+    positions = numpy.cumsum(direction, dtype=numpy.int64)
+    stepped = numpy.flatnonzero(direction)
+    edgeTimes = times[stepped]
+    velocity = numpy.zeros(len(stepped), dtype=numpy.float64)
+
+    if len(stepped) > 1:
+        periods = numpy.diff(edgeTimes)
+        # Steps at the same ns are counted as 1ns apart.
+        velocity[1:] = direction[stepped[1:]] * 1e9 / numpy.maximum(
+            periods, 1)
+
+    return _result(int(positions[-1]), positions, direction,
+                   int(numpy.count_nonzero(lost)), edgeTimes, velocity)
+
+
+def _decodePython(times, a, b, initial):
+    table = TRANSITION_TABLE
+    positions = array('q')
+    direction = array('b')
+    edgeTimes = array('q')
+    velocity = array('d')
+    invalid = position = 0
+    lastTime = None
+
+    if len(a):
+        last = (a[0] << 1) | b[0] if initial is None else \
+               (initial[0] << 1) | initial[1]
+
+    for t, new in zip(times, [(x << 1) | y for x, y in zip(a, b)]):
+        step = table[(last << 2) | new]
+        last = new
+
+        if step == INVALID:
+            invalid += 1
+            step = 0
+        elif step:
+            position += step
+            velocity.append(step * 1e9 / max(t - lastTime, 1)
+                            if lastTime is not None else 0.0)
+            edgeTimes.append(t)
+            lastTime = t
+
+        direction.append(step)
+        positions.append(position)
+
+    return _result(position, positions, direction, invalid, edgeTimes,
+                   velocity)
+
+
+def _result(position, positions, direction, invalid, edgeTimes, velocity):
+    return {'position': position, 'positions': positions,
+            'direction': direction, 'invalid': invalid,
+            'edges': len(edgeTimes), 'edgeTimes': edgeTimes,
+            'velocity': velocity}
+
+
+def decodeEdges(times, gpioIds, values, phaseA, phaseB, initial=(0, 0)):
+    """
+    Decode a stream of edges on either phase, ex. the records of an
+    EdgeRecorder, with decodeSamples. Edges on other gpioIds are ignored.
+
+    initial -- The (A, B) state before the first edge.
+    """
+    if numpy is not None:
+        times = numpy.asarray(times, dtype=numpy.int64)
+        gpioIds = numpy.asarray(gpioIds)
+        values = numpy.asarray(values, dtype=numpy.int8)
+        keep = (gpioIds == phaseA) | (gpioIds == phaseB)
+        times, gpioIds, values = times[keep], gpioIds[keep], values[keep]
+        index = numpy.arange(len(values))
+        phases = []
+
+        for gpioId, start in zip((phaseA, phaseB), initial):
+            # Carry the last value of the phase forward to every sample.
+            isPhase = gpioIds == gpioId
+            last = numpy.maximum.accumulate(numpy.where(isPhase, index, -1))
+            phases.append(numpy.where(last >= 0, values[last], start).astype(
+                numpy.int8))
+
+        return decodeSamples(times, phases[0], phases[1], initial=initial)
+
+    state = list(initial)
+    samples = ([], [], [])
+
+    for t, gpioId, value in zip(times, gpioIds, values):
+        if gpioId == phaseA:
+            state[0] = value
+        elif gpioId == phaseB:
+            state[1] = value
+        else:
+            continue
+
+        for column, item in zip(samples, (t, state[0], state[1])):
+            column.append(item)
+
+    return decodeSamples(*samples, initial=initial)
+
+
+def decodeRecording(path, phaseA, phaseB, initial=(0, 0)):
+    """
+    Decode the edges of phaseA and phaseB in a recording made with an
+    EdgeRecorder.
+    """
+    if numpy is not None:
+        with open(path, 'rb') as f:
+            checkHeader(f.read(HEADER.size), path)
+            data = f.read()
+
+        dtype = numpy.dtype([('time', '=i8'), ('gpioId', '=u4'),
+                             ('value', '=i4')])
+        # A partly written last record is ignored.
+        records = numpy.frombuffer(
+            data, dtype=dtype, count=len(data) // dtype.itemsize)
+
+        return decodeEdges(records['time'], records['gpioId'],
+                           records['value'], phaseA, phaseB, initial)
+
+    records = list(readRecords(path))
+    return decodeEdges([r[0] for r in records], [r[1] for r in records],
+                       [r[2] for r in records], phaseA, phaseB, initial)
+
+
+class VelocityEstimator(object):
+    """
+    Velocity and acceleration from the steps of a live decoder in O(1) per
+    step. The velocity is measured over the last window steps, so it is
+    smooth at speed, and the acceleration from the velocities at the two
+    ends of that window.
+
+    window -- Steps to measure over, larger is smoother but slower to
+              follow a change.
+    """
+    DEFAULT_WINDOW = 8
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        if window < 1:
+            raise InvalidArgumentsException(
+                "Invalid window {}, must be 1 or greater.".format(window))
+
+        self._window = window
+        self._steps = deque(maxlen=window + 1)
+        self._velocities = deque(maxlen=window + 1)
+        self._velocity = 0.0
+        self._acceleration = 0.0
+
+    def reset(self):
+        self._steps.clear()
+        self._velocities.clear()
+        self._velocity = 0.0
+        self._acceleration = 0.0
+
+    def update(self, timestamp, position):
+        """
+        Add a step, timestamp in monotonic ns and the position after it.
+        """
+        steps = self._steps
+        steps.append((timestamp, position))
+
+        if len(steps) > 1:
+            oldTime, oldPosition = steps[0]
+            self._velocity = velocity = (position - oldPosition) * 1e9 / \
+                                        max(timestamp - oldTime, 1)
+            velocities = self._velocities
+            velocities.append((timestamp, velocity))
+
+            if len(velocities) > 1:
+                oldTime, oldVelocity = velocities[0]
+                self._acceleration = (velocity - oldVelocity) * 1e9 / \
+                                     max(timestamp - oldTime, 1)
+
+    def velocity(self, now=None):
+        """
+        Steps per second. With now, the monotonic ns time, a stopped
+        encoder decays toward 0, the velocity can be no more than one step
+        in the time since the last step.
+        """
+        if now is not None and self._steps:
+            bound = 1e9 / max(now - self._steps[-1][0], 1)
+
+            if bound < abs(self._velocity):
+                return bound if self._velocity > 0 else -bound
+
+        return self._velocity
+
+    @property
+    def acceleration(self):
+        """
+        Steps per second squared.
+        """
+        return self._acceleration
@@ -7,6 +7,10 @@ This is rotary encoder code converted from the C code for the AVR series of
 microcontrollers originally written by Peter Dannegger at:
 http://www.mikrocontroller.net/articles/Drehgeber
 
+The interrupts of the original are replaced by the Pin and Event classes,
+both phases trigger on both edges and a thread decodes the transitions with
+a lookup table.
+
 by Carl J. Nobile
 
 THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
@@ -18,115 +22,259 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from bbio import *
+import time
+import logging
+import threading
 
+from core.utils import GPIO, Pin, Event
+from core.utils.filters import SettleTimeFilter
+
+# A state is (A << 1) | B, the position of each state in the quadrature
+# cycle 00, 01, 11, 10.
+_PHASES = (0, 1, 3, 2)
+# Both phases changed, an edge was lost.
+INVALID = 2
+# Indexed by (previous state << 2) | new state. +1 or -1 for a step
+# forward or backward, 0 for no change and INVALID when both phases changed.
+TRANSITION_TABLE = tuple(
+    (0, 1, INVALID, -1)[(_PHASES[new] - _PHASES[old]) % 4]
+    for old in range(4) for new in range(4))
 
-class RotaryEncoder(object):
-    _DEFAULT_BOUNCE_TIME = 300
 
-    def __init__(self, phaseA, phaseB):
+class RotaryEncoder(object):
+    """
+    A quadrature decoder running on its own thread.
+
+    phaseA -- Any of the pin designation types for phase A.
+    phaseB -- Any of the pin designation types for phase B.
+    gpio   -- An optional GPIO object used to configure the pins.
+
+    The pull-up resistors must be set in the device tree, sysfs cannot set
+    them.
+    """
+    _DEFAULT_BOUNCE_TIME = 0
+    _WAIT_TIMEOUT = 0.1
+
+    def __init__(self, phaseA, phaseB, gpio=None, logger=None,
+                 level=logging.INFO):
+        self._gpio = gpio if gpio is not None else GPIO(logger=logger,
+                                                        level=level)
+        self._logger = logger
+        self._level = level
+        self._lock = threading.Lock()
         self._encDelta = 0
+        self._position = 0
         self._last = 0
+        self._edges = 0
+        self._lostEdges = 0
         self._phaseA = phaseA
         self._phaseB = phaseB
+        self._pinA = None
+        self._pinB = None
         self._setPins()
         self._bounceTime = self._DEFAULT_BOUNCE_TIME
+        self._filters = ()
+        self._estimator = None
+        self._thread = None
+        self._running = False
 
     def _setPins(self):
-        pinMode(self._phaseA, INPUT, PULLUP)
-        pinMode(self._phaseB, INPUT, PULLUP)
+        for pin in (self._phaseA, self._phaseB):
+            self._gpio.setMode(pin, direction=GPIO.IN, edge=GPIO.BOTH)
+
+        backend = self._gpio._backend
+        self._pinA = Pin(self._phaseA, logger=self._logger, level=self._level,
+                         backend=backend)
+        self._pinB = Pin(self._phaseB, logger=self._logger, level=self._level,
+                         backend=backend)
 
     def resetPins(self):
-        pass
+        self.disableInterrupts()
+
+        for pin in (self._pinA, self._pinB):
+            if pin is not None and not pin.isClosed:
+                pin.close()
 
     def setBounceTime(self, time):
         """
-        Set the bounce time in ms.
+        Set the bounce time in ms, a phase is decoded only once it has been
+        stable for this long, a glitch that returns it to its previous
+        value is not decoded at all. 0 turns the filter off,
+        the transition table already ignores a bounce that returns to the
+        previous state. Takes effect the next time the interrupts are
+        enabled.
 
         time - Time in milliseconds.
         """
         self._bounceTime = time
 
+    @property
+    def edges(self):
+        """
+        The number of valid transitions decoded.
+        """
+        return self._edges
+
+    @property
+    def position(self):
+        """
+        The steps counted since the encoder was created, unlike the
+        encodeRead methods reading it does not consume the count.
+        """
+        return self._position
+
+    @property
+    def suppressedEdges(self):
+        """
+        The number of edges dropped by the bounce time filters.
+        """
+        return sum(f.suppressed for f in self._filters)
+
+    @property
+    def lostEdges(self):
+        """
+        The number of transitions where both phases changed, at least one
+        edge was missed in each. This is only a lower bound, edges missed
+        between two samples that land back on the same state or on a
+        neighbouring one look like no step or a single step and are not
+        counted. Compare edges with a count kept by the source, ex. the
+        steps an EdgeGenerator drove, to find them all.
+        """
+        return self._lostEdges
+
+    def enableVelocity(self, window=8):
+        """
+        Estimate the velocity and acceleration over the last window steps
+        as they are decoded.
+        """
+        from .decoder import VelocityEstimator
+
+        self._estimator = VelocityEstimator(window)
+
+    def disableVelocity(self):
+        self._estimator = None
+
+    @property
+    def velocity(self):
+        """
+        Steps per second, 0 if the velocity is not enabled.
+        """
+        estimator = self._estimator
+        return estimator.velocity(time.monotonic_ns()) \
+               if estimator is not None else 0.0
+
+    @property
+    def acceleration(self):
+        """
+        Steps per second squared, 0 if the velocity is not enabled.
+        """
+        estimator = self._estimator
+        return estimator.acceleration if estimator is not None else 0.0
+
     def initEncoder(self):
-        new = 0
+        with self._lock:
+            self._last = (self._pinA.value << 1) | self._pinB.value
+            self._encDelta = 0
 
-        if digitalRead(self._phaseA):
-            new = 3
+    @property
+    def pins(self):
+        """
+        The (phase A, phase B) Pin objects.
+        """
+        return self._pinA, self._pinB
+
+    def sample(self):
+        """
+        Read both phases and decode them, for dispatching the events of the
+        pins on a thread of the caller's own.
+        """
+        self.update(self._pinA.value, self._pinB.value)
 
-        if digitalRead(self._phaseB):
-            new ^= 1
+    def update(self, a, b):
+        """
+        Decode a new sample of the phases, this is called by the event thread
+        and can be called directly with simulated samples.
+        """
+        new = (a << 1) | b
 
-        self._last = new
-        self._encDelta = 0;
+        with self._lock:
+            step = TRANSITION_TABLE[(self._last << 2) | new]
+            self._last = new
 
-    def _phaseInterrupt(self):
-        try:
-            new = 0
+            if step == INVALID:
+                self._lostEdges += 1
+            elif step:
+                self._encDelta += step
+                self._position += step
+                self._edges += 1
 
-            if digitalRead(self._phaseA):
-                new = 3
+                if self._estimator is not None:
+                    self._estimator.update(time.monotonic_ns(),
+                                           self._position)
 
-            if digitalRead(self._phaseB):
-                new ^= 1
+    def _run(self):
+        pinA, pinB = self._pinA, self._pinB
 
-            diff = self._last - new
+        settle = int(self._bounceTime * 1000000)
+        filters = [SettleTimeFilter(settle) if settle else None
+                   for pin in (pinA, pinB)]
+        self._filters = tuple(f for f in filters if f is not None)
 
-            if diff & 1:
-                self._last = new
-                self._encDelta += (diff & 2) - 1
+        with Event() as event:
+            for pin, filter in zip((pinA, pinB), filters):
+                event.register(pin, filter=filter)
 
-        except Exception as e:
-            print e
+            while self._running:
+                if event.eventWait(timeout=self._WAIT_TIMEOUT):
+                    self.update(pinA.value, pinB.value)
 
     def enableInterrupts(self):
         """
-        This sets the interrupt.
+        Start the thread decoding the edges of both phases.
         """
-        attachInterrupt(self._phaseA, self._phaseInterrupt, RISING)
-        attachInterrupt(self._phaseB, self._phaseInterrupt, RISING)
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                                            name='RotaryEncoder')
+            self._thread.daemon = True
+            self._thread.start()
 
     def disableInterrupts(self):
         """
-        This clears the interrupt.
+        Stop the decoding thread.
         """
-        detachInterrupt(self._phaseA)
-        detachInterrupt(self._phaseB)
+        if self._thread is not None:
+            self._running = False
+            self._thread.join()
+            self._thread = None
+
+    def _read(self, keep):
+        with self._lock:
+            value = self._encDelta
+            self._encDelta &= keep
 
-    def encodeRead_1(self):
-        self.disableInterrupts()
-        value = self._encDelta
-        self._encDelta = 0;
-        self.enableInterrupts()
         return value
 
+    def encodeRead_1(self):
+        return self._read(0)
+
     def encodeRead_2(self):
-        self.disableInterrupts()
-        value = self._encDelta
-        self._encDelta &= 1;
-        self.enableInterrupts()
-        return value >> 1
+        return self._read(1) >> 1
 
     def encodeRead_4(self):
-        self.disableInterrupts()
-        value = self._encDelta
-        self._encDelta &= 3;
-        self.enableInterrupts()
-        return value >> 2
+        return self._read(3) >> 2
 
 
 def test(phaseA, phaseB, header, startPin):
-    from central.utils import setupPins
-
     value = 0
     re = RotaryEncoder(phaseA, phaseB)
-    re.setBounceTime(300)
+    re.setBounceTime(1)
     re.initEncoder()
     re.enableInterrupts()
-    #setupPins(header, startPin)
 
     while True:
         value += re.encodeRead_1()
-        print value
+        print(value)
         # Set LEDs here. *** FIX ME ***
 
 
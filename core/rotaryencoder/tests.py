@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+"""
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import io, os, time, random, tempfile, itertools
+import unittest
+
+from core.utils import GPIO, SimBackend
+from core.utils.fakesysfs import FakeSysfs
+from core.utils.exceptions import InvalidArgumentsException
+from core.utils.simulator import QuadratureEdges
+from core.utils.events import Event
+from core.utils.recorder import EdgeRecorder, EdgeReplayer
+from core.rotaryencoder import (
+    RotaryEncoder, TRANSITION_TABLE, INVALID, decodeSamples, decodeRecording,
+    VelocityEstimator)
+from core.rotaryencoder import decoder, benchmarks
+
+# (A, B) samples of one full forward cycle.
+FORWARD = ((0, 1), (1, 1), (1, 0), (0, 0))
+
+
+class TestRotaryEncoder(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestRotaryEncoder, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67)).__enter__()
+        self.re = RotaryEncoder(u'GPIO2_2', u'GPIO2_3')
+        self.re.initEncoder()
+
+    def tearDown(self):
+        self.re.resetPins()
+        self.fake.__exit__(None, None, None)
+
+    def test_setPins(self):
+        for gpioId in (66, 67):
+            d = self.fake.read(gpioId, GPIO._DIRECTION)
+            e = self.fake.read(gpioId, GPIO._EDGE)
+            self.assertTrue(d == GPIO.IN and e == GPIO.BOTH, msg=u"Invalid "
+                            u"direction or edge, found: {}, {}".format(d, e))
+
+    def test_transition_table(self):
+        self.assertTrue(len(TRANSITION_TABLE) == 16)
+        self.assertTrue(TRANSITION_TABLE.count(INVALID) == 4)
+        self.assertTrue(TRANSITION_TABLE.count(1) == 4)
+        self.assertTrue(TRANSITION_TABLE.count(-1) == 4)
+
+    def test_forward_backward(self):
+        for a, b in FORWARD * 2:
+            self.re.update(a, b)
+
+        value = self.re.encodeRead_1()
+        self.assertTrue(value == 8, msg=u"Invalid count, found: {}, should "
+                        u"have been: 8".format(value))
+        self.assertTrue(self.re.encodeRead_1() == 0)
+
+        for a, b in reversed(FORWARD[:-1]):
+            self.re.update(a, b)
+
+        self.re.update(0, 0)
+        value = self.re.encodeRead_1()
+        self.assertTrue(value == -4, msg=u"Invalid count, found: {}, should "
+                        u"have been: -4".format(value))
+        # The position is not consumed by the reads.
+        self.assertTrue(self.re.position == 4)
+
+    def test_encodeRead_4(self):
+        for a, b in FORWARD + FORWARD[:2]:
+            self.re.update(a, b)
+
+        self.assertTrue(self.re.encodeRead_4() == 1)
+        # The partial step is kept.
+        self.assertTrue(self.re._encDelta == 2)
+
+    def test_lostEdges(self):
+        self.re.update(1, 1) # Skipped (0, 1)
+        self.assertTrue(self.re.lostEdges == 1)
+        self.assertTrue(self.re.encodeRead_1() == 0)
+        self.re.update(1, 0)
+        self.assertTrue(self.re.encodeRead_1() == 1)
+        self.assertTrue(self.re.edges == 1)
+
+
+class TestRotaryEncoderSim(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestRotaryEncoderSim, self).__init__(name)
+
+    def setUp(self):
+        self.sim = SimBackend(128)
+        self.re = RotaryEncoder(u'P8_7', u'P8_8',
+                                gpio=GPIO(backend=self.sim))
+        self.re.initEncoder()
+        self.re.enableInterrupts()
+
+    def tearDown(self):
+        self.re.resetPins()
+        self.sim.close()
+
+    def _waitForEdges(self, edges, timeout=1.0):
+        end = time.monotonic() + timeout
+
+        while self.re.edges < edges and time.monotonic() < end:
+            time.sleep(0.001)
+
+    def test_interrupts(self):
+        """
+        Test decoding simulated edges one at a time through the event
+        thread.
+        """
+        for step in range(1, 9):
+            gen = QuadratureEdges(self.sim, 66, 67, count=1)
+            gen.start()
+            gen.join()
+            self._waitForEdges(step)
+
+        value = self.re.encodeRead_1()
+        self.assertTrue(value == 8, msg=u"Invalid count, found: {}, should "
+                        u"have been: 8".format(value))
+        self.assertTrue(self.re.lostEdges == 0)
+
+    def test_replay(self):
+        """
+        Test that a recording of the phases decodes the same when replayed.
+        """
+        self.re.disableInterrupts()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'encoder.edges')
+
+            with EdgeRecorder(path) as recorder, Event() as event:
+                for pin in self.re.pins:
+                    pin.enableRecording(recorder)
+                    event.register(pin)
+
+                gen = QuadratureEdges(self.sim, 66, 67, count=12,
+                                      direction=-1)
+
+                for gpioId, value in itertools.islice(gen._generate(), 12):
+                    self.sim.drive(gpioId, value)
+
+                    for pin, mask in event.eventWait(0):
+                        self.re.sample()
+
+            self.assertTrue(self.re.position == -12)
+            replay = SimBackend(128)
+            replay.setMode(66, direction=GPIO.IN, edge=GPIO.BOTH)
+            replay.setMode(67, direction=GPIO.IN, edge=GPIO.BOTH)
+            re = RotaryEncoder(u'P8_7', u'P8_8', gpio=GPIO(backend=replay))
+            re.initEncoder()
+
+            with Event() as event:
+                for pin in re.pins:
+                    event.register(pin)
+
+                EdgeReplayer(replay, path, speed=0).play(
+                    event, lambda pin, mask: re.sample())
+
+            re.resetPins()
+            replay.close()
+
+        self.assertTrue(re.position == -12 and re.lostEdges == 0,
+                        msg=u"Invalid position, found: {}".format(
+                            re.position))
+
+
+class TestDecoder(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestDecoder, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67)).__enter__()
+        self.re = RotaryEncoder(u'GPIO2_2', u'GPIO2_3')
+        self.re.initEncoder()
+
+    def tearDown(self):
+        self.re.resetPins()
+        self.fake.__exit__(None, None, None)
+
+    def test_decodeSamples(self):
+        """
+        Test that a batch decodes as the live decoder does, with and
+        without NumPy.
+        """
+        rand = random.Random(5)
+        samples = [(0, 0)] + [(rand.randint(0, 1), rand.randint(0, 1))
+                              for i in range(2000)]
+        times = [i * 1000 for i in range(len(samples))]
+        a, b = [s[0] for s in samples], [s[1] for s in samples]
+
+        for sample in samples:
+            self.re.update(*sample)
+
+        for decode in (decodeSamples, decoder._decodePython):
+            result = decode(times, a, b, None)
+            self.assertTrue(result['position'] == self.re.position and
+                            result['invalid'] == self.re.lostEdges and
+                            result['edges'] == self.re.edges,
+                            msg=u"Invalid result, found: {}, {}, {}".format(
+                                result['position'], result['invalid'],
+                                result['edges']))
+            self.assertTrue(int(result['positions'][-1]) ==
+                            result['position'])
+
+        result = decodeSamples((0, 1000, 3000), (0, 0, 1), (0, 1, 1))
+        self.assertTrue(list(result['direction']) == [0, 1, 1])
+        self.assertTrue(list(result['velocity']) == [0, 5e5])
+        self.assertRaises(InvalidArgumentsException, decodeSamples, (0,),
+                          (0, 1), (0, 1))
+
+    def test_decodeRecording(self):
+        """
+        Test that a recording of edges decodes to the steps recorded.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'encoder.edges')
+
+            with EdgeRecorder(path) as recorder:
+                # Forward 6 steps with an edge of another pin mixed in.
+                for idx, (gpioId, value) in enumerate(
+                        ((66, 0), (67, 1), (66, 1), (67, 0), (68, 1),
+                         (66, 0), (67, 1), (66, 1))):
+                    recorder.record(gpioId, value, idx * 1000)
+
+            for numpy in (decoder.numpy, None):
+                saved, decoder.numpy = decoder.numpy, numpy
+
+                try:
+                    result = decodeRecording(path, 66, 67)
+                finally:
+                    decoder.numpy = saved
+
+                self.assertTrue(result['position'] == 6 and
+                                result['edges'] == 6,
+                                msg=u"Invalid result, found: {}".format(
+                                    result))
+
+    def test_velocity(self):
+        """
+        Test the streaming velocity and acceleration estimates.
+        """
+        estimator = VelocityEstimator(window=4)
+
+        for step in range(10):
+            estimator.update(step * 1000000, step)
+
+        self.assertTrue(abs(estimator.velocity() - 1000) < 1e-6)
+        self.assertTrue(abs(estimator.acceleration) < 1e-6)
+        # One step 100ms later bounds a stopped encoder.
+        self.assertTrue(estimator.velocity(now=109000000) < 11)
+        estimator.reset()
+        t = 0
+
+        for step in range(1, 40):
+            t += 1e9 / (100 * step)
+            estimator.update(int(t), step)
+
+        self.assertTrue(estimator.acceleration > 0)
+        self.assertRaises(InvalidArgumentsException, VelocityEstimator, 0)
+        self.re.enableVelocity(window=2)
+
+        for a, b in FORWARD * 2:
+            self.re.update(a, b)
+            time.sleep(0.001)
+
+        self.assertTrue(self.re.velocity > 0)
+
+
+class TestEncoderBenchmarks(unittest.TestCase):
+
+    def test_decoded_fraction(self):
+        """
+        Test that the steps lost to skipped samples show in the decoded
+        fraction and only a shortfall from the expected one is warned about.
+        """
+        result = benchmarks.benchDecode(count=1000, skipEvery=10)
+        self.assertEqual(result['decoded_fraction'], 0.801)
+        self.assertEqual(result['expected_fraction'], 0.801)
+        # 199 steps were not decoded, the lost edges undercount them.
+        self.assertEqual(result['lost_edges'], 99)
+        out = io.StringIO()
+        self.assertFalse(benchmarks._warnLossy('decode', result, out=out))
+        self.assertEqual(out.getvalue(), "")
+        result = benchmarks.benchDecode(count=1000, skipEvery=0)
+        self.assertEqual(result['decoded_fraction'], 1.0)
+        result['decoded_fraction'] = 0.5
+        self.assertTrue(benchmarks._warnLossy('decode', result, out=out))
+        self.assertTrue(out.getvalue().startswith("WARNING decode:"))
+
+
+if __name__ == '__main__':
+    unittest.main()
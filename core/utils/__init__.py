@@ -18,9 +18,15 @@ SOFTWARE.
 """
 
 __all__ = ['isRootUser', 'GPIO', 'getBasePath', 'ConfigLogger',
-           'setupMultiplePins', 'Pin', 'Event',
+           'setupMultiplePins', 'Pin', 'PinSet', 'PinBank', 'Event',
+           'MMapBackend', 'AsyncEvent', 'AsyncGPIO', 'SoftPWM', 'SimBackend',
+           'ChardevBackend', 'enableTracing', 'disableTracing',
+           'enableMetrics', 'disableMetrics', 'GPIOBroker', 'GPIOProxy',
+           'SnapshotPublisher', 'SnapshotReader', 'EdgeRecorder',
+           'EdgeReplayer',
            'InvalidPinNomenclatureException', 'InvalidDirectionException',
-           'InvalidEdgeException', 'InvalidArgumentsException']
+           'InvalidEdgeException', 'InvalidArgumentsException',
+           'TransactionException']
 
 import os
 import logging
@@ -28,9 +34,21 @@ import logging
 from .logging_config import getBasePath, ConfigLogger
 
 from .exceptions import *
-from .gpio import GPIO
+from .gpio import GPIO, setupMultiplePins
 from .containers import Pin
+from .pinset import PinSet
+from .pinbank import PinBank
 from .events import Event
+from .backends import MMapBackend
+from .aio import AsyncEvent, AsyncGPIO
+from .pwm import SoftPWM
+from .simulator import SimBackend
+from .chardev import ChardevBackend
+from .trace import enableTracing, disableTracing
+from .metrics import enableMetrics, disableMetrics
+from .broker import GPIOBroker, GPIOProxy
+from .snapshot import SnapshotPublisher, SnapshotReader
+from .recorder import EdgeRecorder, EdgeReplayer
 
 
 def isRootUser(logger=''):
@@ -43,25 +61,3 @@ def isRootUser(logger=''):
                      os.environ.get('LOGNAME'))
 
     return result
-
-
-def setupMultiplePins(pinHeader, startPin, pinRange=8, direction=GPIO.OUT):
-    """
-    Sets up a range of pins to a specified direction. (GPIO.IN or GPIO.OUT)
-    """
-    validHeaders = (8, 9)
-    validDir = (GPIO.IN, GPIO.OUT)
-
-    if pinHeader not in validHeaders:
-        raise TypeError("Invalid header number {} must be one of {}.".format(
-            pinHeader, validHeaders))
-
-    if direction not in validDir:
-        raise TypeError("Invalid pin direction {} must be one of {}.".format(
-            direction, validDir))
-
-    for idx in range(pinRange):
-        pin = startPin + idx
-        channel = "P{}_{}".format(pinHeader, pin)
-        #print channel, direction
-        GPIO.setup(channel, direction)
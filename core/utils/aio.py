@@ -0,0 +1,197 @@
+#
+# core/utils/aio.py
+#
+
+"""
+asyncio support. The edges of any number of containers are dispatched from
+one Event whose epoll file descriptor is watched with loop.add_reader, so
+waiting on thousands of pins needs no threads. The blocking GPIO calls are
+run in an executor.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio, functools, weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .events import Event
+
+_asyncEvents = weakref.WeakKeyDictionary()
+
+
+def getAsyncEvent(loop=None):
+    """
+    Return the AsyncEvent shared by everything running on loop, the running
+    loop by default.
+    """
+    if loop is None:
+        loop = asyncio.get_running_loop()
+
+    asyncEvent = _asyncEvents.get(loop)
+
+    if asyncEvent is None or asyncEvent.isClosed:
+        asyncEvent = _asyncEvents[loop] = AsyncEvent(loop)
+
+    return asyncEvent
+
+
+class AsyncEvent(object):
+    """
+    Dispatches the events of registered containers to asyncio queues. A
+    container is registered with the Event while it has at least one
+    subscriber. On each event the container's value property, if it has
+    one, is read and put in every subscriber queue.
+    """
+
+    def __init__(self, loop=None):
+        self._loop = loop if loop is not None else asyncio.get_running_loop()
+        self._event = Event()
+        self._containers = {}
+        self._subscribers = {}
+        self._loop.add_reader(self._event.fileno(), self._dispatch)
+
+    @property
+    def isClosed(self):
+        return self._event is None
+
+    def _dispatch(self):
+        subscribers = self._subscribers
+        containers = self._containers
+
+        for fd, mask in self._event.eventWait(timeout=0):
+            value = getattr(containers[fd], 'value', mask)
+
+            for queue in subscribers[fd]:
+                queue.put_nowait(value)
+
+    def subscribe(self, container, queue):
+        fd = container.fileno()
+
+        if fd not in self._subscribers:
+            self._containers[fd] = container
+            self._subscribers[fd] = []
+            self._event.register(container, identifier=fd)
+
+        self._subscribers[fd].append(queue)
+
+    def unsubscribe(self, container, queue, fd=None):
+        """
+        Remove queue, the container is unregistered with its last queue.
+
+        fd -- The fd the container was subscribed with, needed once it is
+              closed.
+        """
+        fd = container.fileno() if fd is None else fd
+        queues = self._subscribers.get(fd, [])
+
+        if queue in queues:
+            queues.remove(queue)
+
+        if not queues and fd in self._subscribers:
+            del self._subscribers[fd]
+            del self._containers[fd]
+
+            # A closed container is already out of the epoll.
+            if container.isClosed:
+                self._event.discard(fd)
+            else:
+                self._event.unregister(container)
+
+    async def edges(self, container):
+        """
+        An asynchronous iterator of the value of container after each event.
+        """
+        queue = asyncio.Queue()
+        fd = container.fileno()
+        self.subscribe(container, queue)
+
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            if not self.isClosed:
+                self.unsubscribe(container, queue, fd)
+
+    async def waitFor(self, container, value, timeout=None):
+        """
+        Wait until the value of container is value, returns immediately if
+        it already is. Raises asyncio.TimeoutError after timeout seconds.
+        """
+        queue = asyncio.Queue()
+        fd = container.fileno()
+        self.subscribe(container, queue)
+
+        async def _wait():
+            if container.value == value:
+                return value
+
+            while (await queue.get()) != value:
+                pass
+
+            return value
+
+        try:
+            return await asyncio.wait_for(_wait(), timeout)
+        finally:
+            if not self.isClosed:
+                self.unsubscribe(container, queue, fd)
+
+    def close(self):
+        if self._event is not None:
+            self._loop.remove_reader(self._event.fileno())
+            self._event.close()
+            self._event = None
+            self._subscribers.clear()
+            self._containers.clear()
+
+
+class AsyncGPIO(object):
+    """
+    Async versions of the GPIO calls, run in a single worker thread so calls
+    on the wrapped GPIO object are never concurrent.
+
+    gpio     -- The GPIO object to wrap.
+    executor -- An optional concurrent.futures executor.
+    """
+
+    def __init__(self, gpio, executor=None):
+        self._gpio = gpio
+        self._ownExecutor = executor is None
+        self._executor = executor if executor is not None else \
+                         ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs))
+
+    async def setMode(self, pin, direction=None, edge=None):
+        return await self._run(self._gpio.setMode, pin, direction=direction,
+                               edge=edge)
+
+    async def cleanup(self, pin=None):
+        return await self._run(self._gpio.cleanup, pin)
+
+    async def setDirection(self, pin, direction):
+        return await self._run(self._gpio.setDirection, pin, direction)
+
+    async def getDirection(self, pin):
+        return await self._run(self._gpio.getDirection, pin)
+
+    async def setEdge(self, pin, edge):
+        return await self._run(self._gpio.setEdge, pin, edge)
+
+    async def getEdge(self, pin):
+        return await self._run(self._gpio.getEdge, pin)
+
+    def close(self):
+        if self._ownExecutor:
+            self._executor.shutdown()
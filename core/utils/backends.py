@@ -0,0 +1,204 @@
+#
+# core/utils/backends.py
+#
+
+"""
+Optional pin value backends. By default the GPIO and Pin classes read and
+write pin values through sysfs, a backend passed in at construction replaces
+those reads and writes. Exporting and setting the direction and edge of pins
+is still done through sysfs unless the backend sets CONFIGURES, then those
+calls are passed to the backend too.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, mmap, select
+
+from .exceptions import InvalidArgumentsException
+
+
+class BaseBackend(object):
+    """
+    The interface all backends implement.
+    """
+    # True if the backend implements setMode, release and the direction and
+    # edge methods, else sysfs is used for them.
+    CONFIGURES = False
+    # The epoll mask the descriptors returned by open signal edges with.
+    EVENTMASK = select.EPOLLPRI | select.EPOLLERR
+
+    def read(self, gpioId):
+        raise NotImplementedError()
+
+    def write(self, gpioId, value):
+        raise NotImplementedError()
+
+    def open(self, gpioId):
+        """
+        Return a new descriptor a Pin can register with an Event to wait for
+        edges on gpioId, or None to use the sysfs value file. The caller
+        closes it with closeFd.
+        """
+        return None
+
+    def closeFd(self, fd):
+        """
+        Close a descriptor returned by open.
+        """
+        os.close(fd)
+
+    def readEvents(self, fd):
+        """
+        Read the edge events pending on a descriptor returned by open as a
+        list of (timestamp_ns, value) pairs, or None if the backend does
+        not timestamp edges.
+        """
+        return None
+
+    def setMode(self, gpioId, direction=None, edge=None):
+        raise NotImplementedError()
+
+    def release(self, gpioId=None):
+        """
+        Release gpioId or all the pins if None, returns True if any were in
+        use.
+        """
+        raise NotImplementedError()
+
+    def setDirection(self, gpioId, direction):
+        raise NotImplementedError()
+
+    def getDirection(self, gpioId):
+        raise NotImplementedError()
+
+    def setEdge(self, gpioId, edge):
+        raise NotImplementedError()
+
+    def getEdge(self, gpioId):
+        raise NotImplementedError()
+
+    def setActiveLow(self, gpioId, activeLow):
+        raise NotImplementedError()
+
+    def getActiveLow(self, gpioId):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class MMapBackend(BaseBackend):
+    """
+    Reads and writes pin values directly in the memory mapped registers of
+    the four AM335x GPIO banks. A gpioId is bit gpioId % 32 of bank
+    gpioId // 32.
+
+    path  -- The memory device, /dev/mem (default) needs root. Any file
+             holding the register blocks at the bank offsets can be used.
+    bases -- The offsets of the four bank register blocks in path.
+    """
+    BANK_BASES = (0x44E07000, 0x4804C000, 0x481AC000, 0x481AE000)
+    BANK_SIZE = 0x1000
+    # Register offsets in a bank block.
+    OE = 0x134
+    DATAIN = 0x138
+    DATAOUT = 0x13C
+    CLEARDATAOUT = 0x190
+    SETDATAOUT = 0x194
+
+    def __init__(self, path='/dev/mem', bases=BANK_BASES):
+        self._maps = []
+        self._words = []
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+
+        try:
+            for base in bases:
+                mm = mmap.mmap(fd, self.BANK_SIZE, mmap.MAP_SHARED,
+                               mmap.PROT_READ | mmap.PROT_WRITE, offset=base)
+                self._maps.append(mm)
+                self._words.append(memoryview(mm).cast('I'))
+        except Exception:
+            self.close()
+            raise
+        finally:
+            os.close(fd)
+
+        self._oe = self.OE // 4
+        self._dataIn = self.DATAIN // 4
+        self._dataOut = self.DATAOUT // 4
+        self._clear = self.CLEARDATAOUT // 4
+        self._set = self.SETDATAOUT // 4
+        # Lookup tables indexed by gpioId.
+        self._pinWords = [words for words in self._words for bit in range(32)]
+        self._pinMasks = [1 << bit for words in self._words for bit in range(32)]
+
+    def _checkBank(self, bank):
+        if not 0 <= bank < len(self._words):
+            raise InvalidArgumentsException(
+                "Invalid bank {}, must be 0 - {}.".format(
+                    bank, len(self._words) - 1))
+
+        return self._words[bank]
+
+    def read(self, gpioId):
+        return int(bool(self._pinWords[gpioId][self._dataIn] &
+                        self._pinMasks[gpioId]))
+
+    def write(self, gpioId, value):
+        words = self._pinWords[gpioId]
+        words[self._set if value else self._clear] = self._pinMasks[gpioId]
+
+    def isOutput(self, gpioId):
+        """
+        A cleared output enable bit means the pin is an output.
+        """
+        return not self._pinWords[gpioId][self._oe] & self._pinMasks[gpioId]
+
+    def readBank(self, bank):
+        return self._checkBank(bank)[self._dataIn]
+
+    def setBits(self, bank, mask):
+        self._checkBank(bank)[self._set] = mask & 0xFFFFFFFF
+
+    def clearBits(self, bank, mask):
+        self._checkBank(bank)[self._clear] = mask & 0xFFFFFFFF
+
+    def writeBank(self, bank, value, mask=0xFFFFFFFF):
+        """
+        Write value to the output bits of bank selected by mask. A full mask
+        is a single store to the data out register, otherwise the set and
+        clear registers are used so other pins are not disturbed.
+        """
+        words = self._checkBank(bank)
+        mask &= 0xFFFFFFFF
+
+        if mask == 0xFFFFFFFF:
+            words[self._dataOut] = value & mask
+        else:
+            words[self._set] = value & mask
+            words[self._clear] = ~value & mask
+
+    def close(self):
+        for words in self._words:
+            words.release()
+
+        for mm in self._maps:
+            mm.close()
+
+        self._words[:] = []
+        self._maps[:] = []
+        self._pinWords = []
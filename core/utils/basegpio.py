@@ -14,10 +14,17 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import re, os
-import time, logging
+import re, os, json, errno
+import time, logging, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from .logging_config import getBasePath, ConfigLogger
+from .inotify import waitForAccess
+from .trace import (
+    getTracer, OP_READ, OP_WRITE, OP_GET_DIRECTION, OP_SET_DIRECTION,
+    OP_GET_EDGE, OP_SET_EDGE, OP_EXPORT, OP_UNEXPORT)
+from .metrics import getMetrics, timed, OP_EXPORT as METRIC_EXPORT
 from .exceptions import (
     InvalidPinNomenclatureException, InvalidArgumentsException)
 
@@ -33,6 +40,158 @@ class OpenCM(object):
         os.close(self.fd)
 
 
+class FDCache(object):
+    """
+    A bounded LRU cache of open sysfs attribute file descriptors keyed by
+    (gpioId, attribute). The least recently used descriptor is closed when
+    the cache is full.
+    """
+    DEFAULT_SIZE = 128
+
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        self._maxsize = max(1, maxsize)
+        self._fds = OrderedDict()
+
+    def __len__(self):
+        return len(self._fds)
+
+    def _close(self, fd):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def get(self, gpioId, attr):
+        key = (gpioId, attr)
+        fd = self._fds.get(key)
+
+        if fd is not None:
+            self._fds.move_to_end(key)
+
+        return fd
+
+    def add(self, gpioId, attr, fd):
+        key = (gpioId, attr)
+        old = self._fds.pop(key, None)
+
+        if old is not None and old != fd:
+            self._close(old)
+
+        self._fds[key] = fd
+
+        while len(self._fds) > self._maxsize:
+            key, old = self._fds.popitem(last=False)
+            self._close(old)
+
+        return fd
+
+    def invalidate(self, gpioId=None):
+        """
+        Close the cached descriptors of one gpioId or of all of them if
+        gpioId is None.
+        """
+        keys = [key for key in self._fds
+                if gpioId is None or key[0] == gpioId]
+
+        for key in keys:
+            self._close(self._fds.pop(key))
+
+    def close(self):
+        self.invalidate()
+
+
+class ExportRegistry(object):
+    """
+    The gpioIds exported by this process. With a state file the registry
+    is saved on every change so a later run can unexport the pins left
+    exported by a process that died.
+    """
+
+    def __init__(self):
+        self._pins = set()
+        self._path = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, gpioId):
+        return gpioId in self._pins
+
+    def pins(self):
+        return sorted(self._pins)
+
+    @property
+    def stateFile(self):
+        return self._path
+
+    def setStateFile(self, path):
+        """
+        Keep the registry in path, None stops saving it. Pins in the file
+        from a process that is no longer running are adopted so they are
+        unexported by cleanup. Returns the adopted gpioIds.
+        """
+        adopted = []
+
+        with self._lock:
+            if path is None or path == self._path:
+                self._path = path
+                return adopted
+
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+            pid = state.get('pid')
+
+            if pid and pid != os.getpid():
+                if self._isRunning(pid):
+                    raise InvalidArgumentsException(
+                        "State file {} is in use by process {}.".format(
+                            path, pid))
+
+                adopted = [gpioId for gpioId in state.get('pins', ())
+                           if gpioId not in self._pins]
+                self._pins.update(adopted)
+
+            self._path = path
+            self._save()
+
+        return adopted
+
+    def _isRunning(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+
+        return True
+
+    def add(self, gpioId):
+        with self._lock:
+            if gpioId not in self._pins:
+                self._pins.add(gpioId)
+                self._save()
+
+    def discard(self, gpioId):
+        with self._lock:
+            if gpioId in self._pins:
+                self._pins.discard(gpioId)
+                self._save()
+
+    def _save(self):
+        if self._path is None:
+            return
+
+        tmp = '{}.{}.tmp'.format(self._path, os.getpid())
+
+        with open(tmp, 'w') as f:
+            json.dump({'pid': os.getpid(), 'pins': sorted(self._pins)}, f)
+
+        os.replace(tmp, self._path)
+
+
 class BaseGPIO(object):
     __DIRS_RE = re.compile(r'^gpio\d{1,3}$')
     __EXPORT = 'export'
@@ -53,68 +212,219 @@ class BaseGPIO(object):
         33, 34, 35, 36, 37, 38, 39, 40, 44, 45, 46, 47, 48, 49, 51, 60, 61,
         62, 63, 65, 66, 67, 68, 69, 70, 71, 72, 73, 74, 75, 76, 77, 78, 79,
         80, 81, 86, 87, 88, 89, 115, 117, 120, 121, 122, 123)
+    __PIN_INDEX = {}
+    __PIN_MEMO = {}
+    __PATH_INDEX = {}
     _GPIO_PATH = '/sys/class/gpio'
     _ACTIVE_LOW = 'active_low'
     _DIRECTION = 'direction'
     _EDGE = 'edge'
     _UEVENT = 'uevent'
     _VALUE = 'value'
-
-    def __init__(self, logger=None, level=logging.INFO):
+    _STALE_ERRNOS = (errno.EBADF, errno.ENODEV, errno.ENOENT)
+    _PIN_MEMO_SIZE = 1024
+    _EXPORT_TIMEOUT = 2.0
+    # The (read, write) trace operations of the traced attributes.
+    _ATTR_OPS = {_VALUE: (OP_READ, OP_WRITE),
+                 _DIRECTION: (OP_GET_DIRECTION, OP_SET_DIRECTION),
+                 _EDGE: (OP_GET_EDGE, OP_SET_EDGE)}
+    __LOGGING_CONFIGURED = False
+    # The pins exported by this process, shared by every object.
+    _registry = ExportRegistry()
+    _UNEXPORT_WORKERS = 8
+    _SLOW_UNEXPORT = 0.0005
+
+    def __init__(self, logger=None, level=logging.INFO,
+                 cacheSize=FDCache.DEFAULT_SIZE, backend=None):
         if not logger:
-            ConfigLogger().config(level=level)
+            if not BaseGPIO.__LOGGING_CONFIGURED:
+                ConfigLogger().config(level=level)
+                BaseGPIO.__LOGGING_CONFIGURED = True
+
             logger = ''
 
         self._log = logging.getLogger(logger)
-        self._log.setLevel(level)
+
+        if self._log.level != level:
+            self._log.setLevel(level)
+
+        # Whether to debug log and trace is decided once here so the hot
+        # paths pay nothing when both are off.
+        self._debug = self._log.isEnabledFor(logging.DEBUG)
+        self._tracer = getTracer()
+
+        if self._tracer is not None:
+            self._readAttr = self._tracedReadAttr
+            self._writeAttr = self._tracedWriteAttr
+
+        self._fdCache = FDCache(cacheSize)
+        self._backend = backend
+        self._configures = backend is not None and backend.CONFIGURES
+        self._metrics = getMetrics()
+
+        if self._metrics is not None:
+            self._instrument(self._metrics)
+
+    def _instrument(self, metrics):
+        """
+        Replace the methods measured by metrics with timed versions, done
+        only while metrics are enabled so the normal methods cost nothing.
+        """
+        self._export = timed(self._export, metrics, METRIC_EXPORT)
 
     def isRootUser(self):
         return os.getuid() == 0
 
     def _findActivePins(self):
-        dirs = os.listdir(self._GPIO_PATH)
-        dirs = [f for f in dirs
-                if os.path.isdir(os.path.join(self._GPIO_PATH, f))]
-        self._log.debug("dirs: %s", dirs)
-        return [d[4:] for d in dirs if self.__DIRS_RE.search(d)]
-
-    def _waitForFile(self, timeout=0.5):
-        if not self.isRootUser():
-            time.sleep(timeout)
+        """
+        Return the gpioIds of every exported pin, the gpioN entries are only
+        ever pins so nothing needs a stat.
+        """
+        with os.scandir(self._GPIO_PATH) as entries:
+            dirs = [entry.name for entry in entries
+                    if self.__DIRS_RE.match(entry.name)]
+
+        if self._debug:
+            self._log.debug("dirs: %s", dirs)
+
+        return [int(d[4:]) for d in dirs]
+
+    def _waitForExport(self, gpioIds, timeout=_EXPORT_TIMEOUT):
+        """
+        Wait for udev to give this user access to the attribute files of
+        the newly exported gpioIds, all the pins are waited on together.
+        Returns True if all the pins are ready before the timeout.
+        """
+        if self.isRootUser():
+            return True
+
+        paths = [self._getPinPaths(gpioId)[attr] for gpioId in gpioIds
+                 for attr in (self._DIRECTION, self._EDGE, self._VALUE)]
+        pending = waitForAccess(paths, timeout)
+
+        if pending:
+            self._log.warning("Timed out after %s seconds waiting for: %s",
+                              timeout, pending)
+
+        return not pending
 
     def _export(self, gpioId):
         result = False
-        path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(gpioId))
+        path = self._getPinPaths(gpioId)['']
 
         if not os.path.exists(path):
             path = os.path.join(self._GPIO_PATH, self.__EXPORT)
             self._writePin(path, gpioId)
+            self._registry.add(gpioId)
             result = True
 
-        self._log.debug("result: %s, path: %s", result, path)
+            if self._tracer is not None:
+                self._tracer.record(OP_EXPORT, gpioId)
+
+        if self._debug:
+            self._log.debug("result: %s, path: %s", result, path)
+
         return result
 
     def _unexport(self, gpioId):
         result = False
-        path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(gpioId))
+        path = self._getPinPaths(gpioId)['']
 
         if os.path.exists(path):
+            self._fdCache.invalidate(gpioId)
             path = os.path.join(self._GPIO_PATH, self.__UNEXPORT)
             self._writePin(path, gpioId)
             result = True
 
-        self._log.debug("result: %s, path: %s", result, path)
+            if self._tracer is not None:
+                self._tracer.record(OP_UNEXPORT, gpioId)
+
+        # Gone either way, it is no longer ours to clean up.
+        self._registry.discard(gpioId)
+
+        if self._debug:
+            self._log.debug("result: %s, path: %s", result, path)
+
         return result
 
+    def _unexportAll(self, gpioIds):
+        """
+        Unexport gpioIds, returns True if any were exported. They are done
+        in turn while each is quick, once one is slow the kernel is tearing
+        down devices and the rest are done concurrently. The descriptor
+        cache is closed first as it is not thread safe.
+        """
+        self._fdCache.close()
+        result = False
+
+        for idx, gpioId in enumerate(gpioIds):
+            start = time.perf_counter()
+            result = self._unexport(gpioId) or result
+            rest = gpioIds[idx + 1:]
+
+            if len(rest) > 1 and \
+                   time.perf_counter() - start > self._SLOW_UNEXPORT:
+                with ThreadPoolExecutor(
+                    min(self._UNEXPORT_WORKERS, len(rest)),
+                    thread_name_prefix='Unexport') as pool:
+                    return any(list(pool.map(self._unexport, rest))) or \
+                           result
+
+        return result
+
+    @classmethod
+    def _buildPinIndex(cls):
+        """
+        Build, once, an index of every common spelling of every valid pin
+        mapped to its gpioId. ex. P8_7, p8.7, GPIO2_2, gpio2.2, GPIO_66.
+        """
+        index = {}
+        names = [('GPIO_{}'.format(gpioId), gpioId)
+                 for gpioId in cls.__VALID_PINS]
+        names += [('GPIO{}_{}'.format(gpioId // 32, gpioId % 32), gpioId)
+                  for gpioId in cls.__VALID_PINS]
+        names += [('P{}_{}'.format(header, num), gpioId)
+                  for header, pins in cls.__PIN_MAP.items()
+                  for num, gpioId in pins.items()
+                  if gpioId in cls.__VALID_PINS]
+
+        for name, gpioId in names:
+            head, delimiter, tail = name.partition('_')
+
+            for head in (head, head.lower()):
+                for delimiter in ('_', '.'):
+                    index[head + delimiter + tail] = gpioId
+
+        cls.__PIN_INDEX = index
+        cls.__PIN_MEMO = {}
+        cls.__PATH_INDEX = {}
+
     def _getGpioId(self, pin):
+        try:
+            return self.__PIN_INDEX[pin]
+        except (KeyError, TypeError):
+            return self._resolvePin(pin)
+
+    def _resolvePin(self, pin):
+        """
+        Parse a spelling not in the pin index, ex. mixed case or leading
+        zeros. Valid results are memoized.
+        """
+        try:
+            return self.__PIN_MEMO[pin]
+        except (KeyError, TypeError):
+            pass
+
         result = 0
-        self._log.debug("pin: %s", pin)
 
-        if not isinstance(pin, basestring):
+        if self._debug:
+            self._log.debug("pin: %s", pin)
+
+        if not isinstance(pin, str):
             raise InvalidPinNomenclatureException(pin)
 
-        pin = pin.count('.') == 1 and pin.replace('.', '_') or pin
-        head, delimiter, tail = pin.partition('_')
+        name = pin.count('.') == 1 and pin.replace('.', '_') or pin
+        head, delimiter, tail = name.partition('_')
         head = head.upper()
 
         if (len(head) == 2 and head[0] == 'P' and
@@ -126,20 +436,46 @@ class BaseGPIO(object):
               head[-1].isdigit() and tail.isdigit()):
             result = int(head[-1]) * 32 + int(tail)
         else:
-            raise InvalidPinNomenclatureException(pin)
+            raise InvalidPinNomenclatureException(name)
 
         if result not in self.__VALID_PINS:
-            raise InvalidPinNomenclatureException(pin)
+            raise InvalidPinNomenclatureException(name)
+
+        if len(self.__PIN_MEMO) < self._PIN_MEMO_SIZE:
+            self.__PIN_MEMO[pin] = result
+
+        if self._debug:
+            self._log.debug("result: %s", result)
 
-        self._log.debug("result: %s", result)
         return result
 
+    def _getPinPaths(self, gpioId):
+        """
+        Return a dict of the precomputed sysfs paths of gpioId keyed by
+        attribute, the empty string being the gpioN directory itself.
+        """
+        try:
+            return self.__PATH_INDEX[self._GPIO_PATH][gpioId]
+        except KeyError:
+            pass
+
+        paths = self.__PATH_INDEX.setdefault(self._GPIO_PATH, {})
+        pinPath = os.path.join(self._GPIO_PATH, 'gpio{}'.format(gpioId))
+        paths[gpioId] = dict(
+            [('', pinPath)] + [(attr, os.path.join(pinPath, attr))
+                               for attr in (self._ACTIVE_LOW, self._DIRECTION,
+                                            self._EDGE, self._UEVENT,
+                                            self._VALUE)])
+        return paths[gpioId]
+
     def _readPin(self, path, bytes=128):
         with OpenCM(os.open(path, os.O_RDONLY)) as fd:
             result = os.read(fd, bytes)
-            result = result.strip()
-            self._log.debug("Read path '%s' and returned value '%s'.",
-                            path, result)
+            result = result.strip().decode('ascii')
+
+            if self._debug:
+                self._log.debug("Read path '%s' and returned value '%s'.",
+                                path, result)
 
         return result
 
@@ -147,8 +483,10 @@ class BaseGPIO(object):
         value = str(value)
 
         with OpenCM(os.open(path, os.O_WRONLY)) as fd:
-            numBytes = os.write(fd, value)
-            self._log.debug("Wrote to path '%s' value '%s'.", path, value)
+            numBytes = os.write(fd, value.encode('ascii'))
+
+            if self._debug:
+                self._log.debug("Wrote to path '%s' value '%s'.", path, value)
 
             if numBytes != len(value):
                 raise IOError("Wrong number of bytes witten to {}, wrote: {}, "
@@ -157,3 +495,69 @@ class BaseGPIO(object):
 
     def _openPin(self, path):
         return os.open(path, os.O_RDONLY)
+
+    def _attrPath(self, gpioId, attr):
+        return self._getPinPaths(gpioId)[attr]
+
+    def _getAttrFd(self, gpioId, attr):
+        fd = self._fdCache.get(gpioId, attr)
+
+        if fd is None:
+            path = self._attrPath(gpioId, attr)
+
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except PermissionError:
+                fd = os.open(path, os.O_RDONLY)
+
+            self._fdCache.add(gpioId, attr, fd)
+
+        return fd
+
+    def _readAttr(self, gpioId, attr, bytes=128):
+        """
+        Read a sysfs attribute through a cached descriptor with a single
+        pread at offset 0. Only the first line is returned.
+        """
+        try:
+            result = os.pread(self._getAttrFd(gpioId, attr), bytes, 0)
+        except OSError as e:
+            # The descriptor is stale if the pin was unexported elsewhere.
+            if e.errno not in self._STALE_ERRNOS: raise
+            self._fdCache.invalidate(gpioId)
+            result = os.pread(self._getAttrFd(gpioId, attr), bytes, 0)
+
+        return result.partition(b'\n')[0].strip().decode('ascii')
+
+    def _writeAttr(self, gpioId, attr, value):
+        """
+        Write a sysfs attribute through a cached descriptor with a single
+        pwrite at offset 0.
+        """
+        value = '{}\n'.format(value).encode('ascii')
+
+        try:
+            numBytes = os.pwrite(self._getAttrFd(gpioId, attr), value, 0)
+        except OSError as e:
+            if e.errno not in self._STALE_ERRNOS: raise
+            self._fdCache.invalidate(gpioId)
+            numBytes = os.pwrite(self._getAttrFd(gpioId, attr), value, 0)
+
+        if numBytes != len(value):
+            raise IOError("Wrong number of bytes written to gpio{} {}, "
+                          "wrote: {}, should have been: {}".format(
+                              gpioId, attr, numBytes, len(value)))
+
+    def _tracedReadAttr(self, gpioId, attr, bytes=128):
+        result = BaseGPIO._readAttr(self, gpioId, attr, bytes)
+        ops = self._ATTR_OPS.get(attr)
+        ops and self._tracer.recordAttr(ops[0], gpioId, result)
+        return result
+
+    def _tracedWriteAttr(self, gpioId, attr, value):
+        BaseGPIO._writeAttr(self, gpioId, attr, value)
+        ops = self._ATTR_OPS.get(attr)
+        ops and self._tracer.recordAttr(ops[1], gpioId, str(value))
+
+
+BaseGPIO._buildPinIndex()
@@ -0,0 +1,919 @@
+#!/usr/bin/env python
+#
+# core/utils/benchmarks.py
+#
+
+"""
+Benchmarks for the GPIO hot paths run against a fake sysfs tree.
+
+Run with: python -m core.utils.benchmarks [--json PATH] [--compare PATH]
+
+Result keys ending in _per_sec are better when higher, keys ending in _ns or
+_us are better when lower, everything else is informational. --compare
+checks the new results against a JSON file written by an earlier run.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, sys, json, time, shutil, logging, argparse, platform, resource
+import tempfile, tracemalloc, multiprocessing
+
+from .gpio import GPIO
+from .containers import Pin
+from .pinset import PinSet
+from .pinbank import PinBank
+from .backends import MMapBackend
+from .events import Event
+from .pwm import SoftPWM
+from .fakesysfs import FakeSysfs, PipeContainer
+from .simulator import SimBackend, RandomEdges, QuadratureEdges
+from .chardev import ChardevBackend
+from .fakechardev import FakeChardev
+from .trace import enableTracing, disableTracing
+from .metrics import enableMetrics, disableMetrics
+from .logging_config import ConfigLogger
+from .broker import GPIOBroker, GPIOProxy
+from .snapshot import SnapshotPublisher, SnapshotReader
+
+
+def _opsPerSec(func, count):
+    start = time.perf_counter()
+
+    for i in range(count):
+        func(i)
+
+    return count / (time.perf_counter() - start)
+
+
+def _latency(func, count):
+    """
+    Return the mean, median, 99th percentile and maximum duration of count
+    calls of func in microseconds.
+    """
+    times = []
+
+    for i in range(count):
+        start = time.perf_counter_ns()
+        func(i)
+        times.append(time.perf_counter_ns() - start)
+
+    times.sort()
+    return {'mean_us': sum(times) / count / 1000,
+            'p50_us': times[count // 2] / 1000,
+            'p99_us': times[min(count - 1, count * 99 // 100)] / 1000,
+            'max_us': times[-1] / 1000}
+
+
+def benchSetValue(count=20000):
+    """
+    Compare setValue through open/write/close against the fd cache.
+    """
+    pin = 'P8_7'
+
+    with FakeSysfs(pins=(66,)):
+        gpio = GPIO()
+        path = os.path.join(gpio._GPIO_PATH, 'gpio66', gpio._VALUE)
+
+        def uncached(i):
+            gpio._getGpioId(pin)
+            gpio._writePin(path, i & 1)
+
+        def cached(i):
+            gpio.setValue(pin, i & 1)
+
+        result = {'uncached_per_sec': _opsPerSec(uncached, count),
+                  'cached_per_sec': _opsPerSec(cached, count)}
+        gpio.cleanup()
+
+    return result
+
+
+def benchShadow(count=20000):
+    """
+    setValue of an unchanged value and getDirection with and without the
+    shadow state, and toggling an output with writes coalesced to 1ms.
+    """
+    with FakeSysfs(pins=(66,)):
+        plain = GPIO()
+        shadow = GPIO(shadow=True)
+        coalesced = GPIO(coalesce=0.001)
+
+        for gpio in (plain, shadow, coalesced):
+            gpio.setMode('P8_7', direction=GPIO.OUT)
+
+        result = {
+            'plain_same_per_sec': _opsPerSec(
+                lambda i: plain.setValue('P8_7', 1), count),
+            'shadow_same_per_sec': _opsPerSec(
+                lambda i: shadow.setValue('P8_7', 1), count),
+            'plain_direction_per_sec': _opsPerSec(
+                lambda i: plain.getDirection('P8_7'), count),
+            'shadow_direction_per_sec': _opsPerSec(
+                lambda i: shadow.getDirection('P8_7'), count),
+            'coalesced_toggle_per_sec': _opsPerSec(
+                lambda i: coalesced.setValue('P8_7', i & 1), count)}
+        coalesced.cleanup()
+
+    return result
+
+
+def benchGetValue(count=20000):
+    """
+    Compare getValue through open/read/close against the fd cache.
+    """
+    pin = 'P8_7'
+
+    with FakeSysfs(pins=(66,)):
+        gpio = GPIO()
+        path = os.path.join(gpio._GPIO_PATH, 'gpio66', gpio._VALUE)
+
+        def uncached(i):
+            gpio._getGpioId(pin)
+            int(gpio._readPin(path))
+
+        def cached(i):
+            gpio.getValue(pin)
+
+        result = {'uncached_per_sec': _opsPerSec(uncached, count),
+                  'cached_per_sec': _opsPerSec(cached, count)}
+        gpio.cleanup()
+
+    return result
+
+
+def benchSetMode(count=5000):
+    """
+    Latency of setMode setting the direction and edge of an exported pin.
+    """
+    with FakeSysfs(pins=(66,)):
+        gpio = GPIO()
+        result = _latency(
+            lambda i: gpio.setMode('P8_7', direction=GPIO.IN,
+                                   edge=(GPIO.RISING, GPIO.FALLING)[i & 1]),
+            count)
+        gpio.cleanup()
+
+    return result
+
+
+def _slowGPIO(delay):
+    """
+    Return a GPIO class whose attribute, export and unexport writes take
+    delay seconds, as on a slow controller.
+    """
+    class SlowGPIO(GPIO):
+
+        def _writeAttr(self, gpioId, attr, value):
+            time.sleep(delay)
+            super(SlowGPIO, self)._writeAttr(gpioId, attr, value)
+
+        def _writePin(self, path, value):
+            time.sleep(delay)
+            super(SlowGPIO, self)._writePin(path, value)
+
+    return SlowGPIO
+
+
+def benchTransaction(numPins=60, delay=0.001, workers=8):
+    """
+    Configuring numPins pins one setMode at a time against one transaction,
+    each attribute write made to take delay seconds.
+    """
+    gpioIds = sorted(set(GPIO()._getGpioId(pin) for pin in (
+        'P8_{}'.format(num) for num in range(3, 47))))[:numPins]
+
+    with FakeSysfs(pins=gpioIds):
+        gpio = _slowGPIO(delay)()
+        start = time.perf_counter()
+
+        for idx, gpioId in enumerate(gpioIds):
+            gpio.setMode('GPIO_{}'.format(gpioId), direction=GPIO.IN,
+                         edge=(GPIO.RISING, GPIO.FALLING)[idx & 1])
+
+        serial = time.perf_counter() - start
+
+        with gpio.transaction(workers=workers) as txn:
+            for idx, gpioId in enumerate(gpioIds):
+                txn.stage('GPIO_{}'.format(gpioId), direction=GPIO.IN,
+                          edge=(GPIO.FALLING, GPIO.RISING)[idx & 1])
+
+    return {'pins': len(gpioIds), 'workers': workers,
+            'serial_ms': serial * 1000,
+            'transaction_ms': txn.report['total'] * 1000,
+            'slowest_pin_ms': max(txn.report['pins'].values()) * 1000}
+
+
+def benchCleanup(numPins=64, count=200, delay=0):
+    """
+    Latency of cleanup of numPins pins exported by this process with open
+    descriptors in the fd cache, against the old scan of every entry with
+    a stat and serial unexports. Unexports are made to take delay seconds.
+    The fake tree does not remove the gpioN directories so every round
+    sees all the pins.
+    """
+    pins = tuple(range(numPins))
+
+    with FakeSysfs(pins=pins):
+        gpio = (_slowGPIO(delay) if delay else GPIO)(cacheSize=numPins)
+
+        def prepare():
+            for gpioId in pins:
+                gpio._getAttrFd(gpioId, gpio._VALUE)
+                gpio._registry.add(gpioId)
+
+        def cleanup(i):
+            prepare()
+            gpio.cleanup()
+
+        def serial(i):
+            prepare()
+            path = gpio._GPIO_PATH
+            dirs = [f for f in os.listdir(path)
+                    if os.path.isdir(os.path.join(path, f))]
+
+            for name in dirs:
+                if name[:4] == 'gpio' and name[4:].isdigit():
+                    gpio._unexport(int(name[4:]))
+
+            gpio._fdCache.close()
+
+        result = {'pins': len(pins)}
+        result.update(_latency(cleanup, count))
+
+        if delay:
+            result['serial_mean_us'] = _latency(serial, count)['mean_us']
+
+    return result
+
+
+def benchBroker(count=5000, batch=32):
+    """
+    getValue in process, through a GPIOProxy to a GPIOBroker and through
+    pipelines of batch requests, the round trip latency of the proxy.
+    """
+    with FakeSysfs(pins=(66,)):
+        gpio = GPIO()
+        gpio.setMode('P8_7', direction=GPIO.OUT)
+        path = os.path.join(tempfile.mkdtemp(), 'gpio.sock')
+        broker = GPIOBroker(path, gpio=GPIO())
+        broker.start()
+
+        try:
+            with GPIOProxy(path) as proxy:
+                def pipelined(i):
+                    with proxy.pipeline() as pipe:
+                        for j in range(batch):
+                            pipe.getValue('P8_7')
+
+                result = {
+                    'local_per_sec': _opsPerSec(
+                        lambda i: gpio.getValue('P8_7'), count),
+                    'proxy_per_sec': _opsPerSec(
+                        lambda i: proxy.getValue('P8_7'), count),
+                    'pipelined_per_sec': _opsPerSec(
+                        pipelined, count // batch) * batch}
+                result.update(_latency(lambda i: proxy.getValue('P8_7'),
+                                       count))
+        finally:
+            broker.close()
+            shutil.rmtree(os.path.dirname(path))
+
+    return result
+
+
+def _readSnapshots(path, duration, results):
+    reader = SnapshotReader(path)
+    read = reader.read
+    count = 0
+    end = time.perf_counter() + duration
+
+    while time.perf_counter() < end:
+        for i in range(100):
+            read()
+
+        count += 100
+
+    results.put((count / duration, reader.retries))
+    reader.close()
+
+
+def benchSnapshot(numPins=16, readers=2, duration=0.5, interval=0.0001):
+    """
+    Snapshots of numPins read per second by each of several reader
+    processes while the publisher thread publishes every interval seconds,
+    against reading the same pins with getValue in process.
+    """
+    pins = [66 + i for i in range(numPins)]
+    names = ['GPIO_{}'.format(gpioId) for gpioId in pins]
+
+    with FakeSysfs(pins=pins):
+        gpio = GPIO()
+        local = _opsPerSec(lambda i: [gpio.getValue(name) for name in names],
+                           2000)
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+
+        with SnapshotPublisher(names, path=path) as pub:
+            pub.start(interval)
+            procs = [context.Process(target=_readSnapshots,
+                                     args=(path, duration, results))
+                     for i in range(readers)]
+
+            for proc in procs:
+                proc.start()
+
+            counts = [results.get() for proc in procs]
+
+            for proc in procs:
+                proc.join()
+
+            publishes = pub.sequence // 2
+
+        shutil.rmtree(os.path.dirname(path))
+
+    return {'getValue_per_sec': local,
+            'reader_per_sec': sum(c for c, r in counts) / readers,
+            'retries': sum(r for c, r in counts),
+            'publishes': publishes}
+
+
+def benchGetGpioId(count=200000):
+    """
+    Compare a pin index hit against parsing the pin name on every call.
+    """
+    gpio = GPIO()
+    gpio._PIN_MEMO_SIZE = 0
+    pins = ('P8_7', 'gpio2.2', 'GPIO_66', 'p9_12')
+    num = len(pins)
+
+    def parsed(i):
+        gpio._resolvePin(pins[i % num])
+
+    def indexed(i):
+        gpio._getGpioId(pins[i % num])
+
+    return {'parsed_ns': 1e9 / _opsPerSec(parsed, count),
+            'indexed_ns': 1e9 / _opsPerSec(indexed, count)}
+
+
+def benchPinBank(count=20000):
+    """
+    Bytes per second written to an 8 pin bank, counting up and writing
+    the complement of the last byte (all eight bits change).
+    """
+    pins = (45, 44, 23, 26, 47, 46, 27, 65) # P8_11 - P8_18
+
+    with FakeSysfs(pins=pins):
+        with PinBank(8, 11) as bank:
+            result = {'counter_bytes_per_sec': _opsPerSec(bank.write,
+                                                          count),
+                      'complement_bytes_per_sec': _opsPerSec(
+                          lambda i: bank.write(0x55 if i & 1 else 0xAA),
+                          count)}
+
+    return result
+
+
+def _build(factory, cleanup):
+    """
+    Return the seconds factory() took and the bytes it allocated, measured
+    in separate runs since tracing allocations slows them down. cleanup is
+    called with each result.
+    """
+    start = time.perf_counter()
+    result = factory()
+    elapsed = time.perf_counter() - start
+    cleanup(result)
+    tracemalloc.start()
+
+    try:
+        result = factory()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    cleanup(result)
+    return elapsed, size
+
+
+def benchPinSet(numPins=1000):
+    """
+    Construction time and memory per pin of numPins Pin objects against a
+    PinSet of numPins handles, and the time to read every pin.
+    """
+    _raiseFdLimit(numPins + 256)
+
+    def closeAll(pins):
+        [pin.close() for pin in pins]
+
+    with FakeSysfs(pins=(66,)):
+        names = ['P8_7'] * numPins
+        pinTime, pinSize = _build(lambda: [Pin(name) for name in names],
+                                  closeAll)
+        setTime, setSize = _build(lambda: PinSet(names),
+                                  lambda pinSet: pinSet.close())
+        pins = [Pin(name) for name in names]
+        pinSet = PinSet(names)
+        pinRead = _opsPerSec(lambda i: [pin.value for pin in pins], 20)
+        setRead = _opsPerSec(lambda i: pinSet.values(), 20)
+        closeAll(pins)
+        pinSet.close()
+
+    return {'pins': numPins,
+            'pin_construct_us': pinTime * 1e6 / numPins,
+            'pinset_construct_us': setTime * 1e6 / numPins,
+            'pin_bytes': pinSize / numPins,
+            'handle_bytes': setSize / numPins,
+            'pin_read_all_us': 1e6 / pinRead,
+            'pinset_read_all_us': 1e6 / setRead}
+
+
+def benchMMapBackend(count=200000):
+    """
+    Toggle rate of setValue through the sysfs fd cache against the memory
+    mapped backend, a regular file stands in for the register window.
+    """
+    fd, path = tempfile.mkstemp()
+    os.ftruncate(fd, 4 * MMapBackend.BANK_SIZE)
+    os.close(fd)
+    backend = MMapBackend(path, bases=(0x0000, 0x1000, 0x2000, 0x3000))
+
+    with FakeSysfs(pins=(66,)):
+        sysfs = GPIO()
+        mapped = GPIO(backend=backend)
+        result = {'sysfs_per_sec': _opsPerSec(
+                      lambda i: sysfs.setValue('P8_7', i & 1), count // 10),
+                  'mmap_per_sec': _opsPerSec(
+                      lambda i: mapped.setValue('P8_7', i & 1), count),
+                  'mmap_direct_per_sec': _opsPerSec(
+                      lambda i: backend.write(66, i & 1), count)}
+        sysfs.cleanup()
+
+    backend.close()
+    os.remove(path)
+    return result
+
+
+def benchEventWait(numFds=256, numReady=1, count=20000):
+    """
+    Wakeups per second of Event.eventWait with numFds registered
+    descriptors of which numReady are always ready.
+    """
+    conts = [PipeContainer() for i in range(numFds)]
+
+    for cont in conts[:numReady]:
+        cont.fire()
+
+    with Event() as event:
+        for cont in conts:
+            event.register(cont)
+
+        def wait(i):
+            for cont, mask in event.eventWait(timeout=0):
+                pass
+
+        result = {'fds': numFds, 'ready': numReady,
+                  'wakeups_per_sec': _opsPerSec(wait, count)}
+
+    [cont.close() for cont in conts]
+    return result
+
+
+def benchSoftPWM(channels=8, frequency=200, duration=1.0, spin=0):
+    """
+    Lateness of the edges written by SoftPWM with channels spread over the
+    duty cycle range.
+    """
+    pins = (45, 44, 23, 26, 47, 46, 27, 65, 22, 63, 62, 37, 36, 33, 32, 61)
+    pins = pins[:channels]
+
+    with FakeSysfs(pins=pins):
+        with SoftPWM(frequency=frequency, spin=spin) as pwm:
+            for idx, gpioId in enumerate(pins):
+                pwm.addChannel('GPIO_{}'.format(gpioId),
+                               (idx + 1) / (len(pins) + 1))
+
+            pwm.start()
+            time.sleep(duration)
+            pwm.stop()
+            result = pwm.stats()
+
+    return result
+
+
+def _raiseFdLimit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        if hard != resource.RLIM_INFINITY:
+            needed = min(needed, hard)
+
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+
+
+def benchSimFanIn(numLines=256, count=100000):
+    """
+    Event fan-in from numLines simulated lines toggled at random as fast as
+    possible by another thread. Edges on a line that has not been waited
+    on yet are merged into one event.
+    """
+    _raiseFdLimit(2 * numLines + 256)
+    sim = SimBackend(numLines)
+    lines = []
+
+    for gpioId in range(numLines):
+        sim.setMode(gpioId, direction='in', edge='both')
+        lines.append(sim.line(gpioId))
+
+    events = 0
+
+    with Event() as event:
+        for line in lines:
+            event.register(line)
+
+        generator = RandomEdges(sim, range(numLines), count=count, seed=1)
+        start = time.perf_counter()
+        generator.start()
+
+        while generator.isRunning or event.eventWait(timeout=0):
+            events += len(event.eventWait(timeout=0.01))
+
+        elapsed = time.perf_counter() - start
+
+    [line.close() for line in lines]
+    sim.close()
+    return {'lines': numLines, 'edges': sim.signalled, 'events': events,
+            'edges_per_sec': generator.rate,
+            'events_per_sec': events / elapsed}
+
+
+def benchSimEncoder(count=100000, rate=0):
+    """
+    RotaryEncoder decoding a simulated encoder turning at rate steps per
+    second, 0 is as fast as the generator can run. Steps decoded against
+    steps driven shows where the decoder saturates, runSuite warns when the
+    decoded_fraction is below 1.0.
+    """
+    from core.rotaryencoder import RotaryEncoder
+
+    sim = SimBackend(128)
+    encoder = RotaryEncoder('P8_7', 'P8_8', gpio=GPIO(backend=sim))
+    encoder.initEncoder()
+    encoder.enableInterrupts()
+    generator = QuadratureEdges(sim, 66, 67, rate=rate, count=count)
+    generator.start()
+    generator.join()
+    time.sleep(0.1)
+    encoder.resetPins()
+    sim.close()
+    return {'steps': count, 'decoded': encoder.edges,
+            'lost': encoder.lostEdges,
+            'steps_per_sec': generator.rate,
+            'decoded_fraction': encoder.edges / count}
+
+
+def benchChardev(count=20000):
+    """
+    Bytes per second written to 8 lines through the character device
+    backend one line at a time against one bulk request, on the fake ioctl
+    layer so only our own overhead is measured. The ioctls per byte are
+    what matter on hardware.
+    """
+    fake = FakeChardev()
+    gpioIds = (44, 45, 46, 47, 48, 49, 50, 51)
+
+    with ChardevBackend(chips=fake.paths, io=fake) as backend:
+        request = backend.request(gpioIds, direction='out')
+
+        def perLine(i):
+            for bit, gpioId in enumerate(gpioIds):
+                backend.write(gpioId, i >> bit & 1)
+
+        start = fake.ioctls
+        perLineRate = _opsPerSec(perLine, count)
+        perLineIoctls = (fake.ioctls - start) / count
+        start = fake.ioctls
+        result = {'per_line_bytes_per_sec': perLineRate,
+                  'bulk_bytes_per_sec': _opsPerSec(request.setValues, count),
+                  'per_line_ioctls': perLineIoctls,
+                  'bulk_ioctls': (fake.ioctls - start) / count}
+
+    return result
+
+
+def benchTracing(count=20000):
+    """
+    setValue with tracing disabled and enabled, the cost of a debug log call
+    at INFO level against the guard that replaced it, and the construction
+    time of a GPIO object.
+    """
+    with FakeSysfs(pins=(66,)):
+        gpio = GPIO()
+        disabled = _opsPerSec(lambda i: gpio.setValue('P8_7', i & 1), count)
+        enableTracing(1024)
+
+        try:
+            traced = GPIO()
+            enabled = _opsPerSec(lambda i: traced.setValue('P8_7', i & 1),
+                                 count)
+        finally:
+            disableTracing()
+
+        log = gpio._log
+
+        def debugCall(i):
+            log.debug("pin: %s", i)
+
+        def debugGuard(i):
+            if gpio._debug:
+                log.debug("pin: %s", i)
+
+        result = {'disabled_per_sec': disabled,
+                  'traced_per_sec': enabled,
+                  'debug_call_ns': 1e9 / _opsPerSec(debugCall, count * 10),
+                  'debug_guard_ns': 1e9 / _opsPerSec(debugGuard, count * 10),
+                  'construct_us': 1e6 / _opsPerSec(lambda i: GPIO(),
+                                                   count // 10)}
+        gpio.cleanup()
+
+    return result
+
+
+def benchMetrics(count=20000):
+    """
+    setValue and Pin.value with metrics disabled and enabled, the cost of
+    one observation and of a Prometheus snapshot of the recorded series.
+    """
+    with FakeSysfs(pins=(66,)):
+        gpio = GPIO()
+        gpio.setMode('P8_7', direction=GPIO.OUT)
+        pin = Pin('P8_7')
+        disabled = _opsPerSec(lambda i: gpio.setValue('P8_7', i & 1), count)
+        readDisabled = _opsPerSec(lambda i: pin.value, count)
+        metrics = enableMetrics()
+
+        try:
+            measured = GPIO()
+            measuredPin = Pin('P8_7')
+            enabled = _opsPerSec(lambda i: measured.setValue('P8_7', i & 1),
+                                 count)
+            readEnabled = _opsPerSec(lambda i: measuredPin.value, count)
+        finally:
+            disableMetrics()
+
+        result = {'disabled_per_sec': disabled,
+                  'enabled_per_sec': enabled,
+                  'read_disabled_per_sec': readDisabled,
+                  'read_enabled_per_sec': readEnabled,
+                  'observe_ns': 1e9 / _opsPerSec(
+                      lambda i: metrics.observe(0, 66, i), count * 10),
+                  'snapshot_us': 1e6 / _opsPerSec(
+                      lambda i: metrics.toPrometheus(), count // 100)}
+        measuredPin.close()
+        pin.close()
+        gpio.cleanup()
+
+    return result
+
+
+class _SlowFile(object):
+    """
+    A file whose flush stalls for delay seconds, as a busy SD card does.
+    """
+
+    def __init__(self, file, delay):
+        self._file = file
+        self._delay = delay
+
+    def flush(self):
+        self._file.flush()
+        time.sleep(self._delay)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def benchLogging(count=20000, writeDelay=0, interval=0):
+    """
+    Latency of a debug log call at DEBUG level to a synchronous file handler
+    against the queued handler, the log files are in a temporary directory.
+    Logging back to back outruns the writer thread, the queued handler then
+    drops records rather than slow the caller.
+
+    writeDelay -- Seconds each flush of the log file stalls for.
+    interval   -- Seconds between calls, as a control loop logs.
+    """
+    path = tempfile.mkdtemp(prefix='bench-log-')
+    result = {}
+
+    try:
+        for name, queued in (('sync', False), ('queued', True)):
+            log = ConfigLogger(path).config('bench.' + name, name + '.log',
+                                            level=logging.DEBUG,
+                                            queued=queued)
+            log.propagate = False
+            handler = log.handlers[-1]
+
+            if writeDelay:
+                if queued:
+                    handler.writer._file = _SlowFile(handler.writer._file,
+                                                     writeDelay)
+                else:
+                    handler.stream = _SlowFile(handler.stream, writeDelay)
+
+            # Time only the log call, not the sleep between calls.
+            times = []
+
+            for i in range(count):
+                start = time.perf_counter_ns()
+                log.debug("value: %s", i)
+                times.append(time.perf_counter_ns() - start)
+
+                if interval:
+                    time.sleep(interval)
+
+            times.sort()
+            result[name + '_mean_us'] = sum(times) / count / 1000
+            result[name + '_p50_us'] = times[count // 2] / 1000
+            result[name + '_p99_us'] = times[
+                min(count - 1, count * 99 // 100)] / 1000
+            result[name + '_max_us'] = times[-1] / 1000
+
+            for handler in log.handlers[:]:
+                log.removeHandler(handler)
+                handler.close()
+
+            if queued:
+                result['queued_dropped'] = handler.dropped
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    return result
+
+
+# (name, function, keyword arguments), the count and duration arguments are
+# multiplied by the --scale option.
+SUITE = (
+    ('getGpioId', benchGetGpioId, {'count': 200000}),
+    ('setValue', benchSetValue, {'count': 20000}),
+    ('getValue', benchGetValue, {'count': 20000}),
+    ('shadow', benchShadow, {'count': 20000}),
+    ('setMode', benchSetMode, {'count': 5000}),
+    ('cleanup_64', benchCleanup, {'numPins': 64, 'count': 200}),
+    ('cleanup_60_slow', benchCleanup,
+     {'numPins': 60, 'count': 10, 'delay': 0.001}),
+    ('transaction_40', benchTransaction,
+     {'numPins': 40, 'delay': 0.001, 'workers': 8}),
+    ('eventWait_256_1', benchEventWait,
+     {'numFds': 256, 'numReady': 1, 'count': 20000}),
+    ('eventWait_256_16', benchEventWait,
+     {'numFds': 256, 'numReady': 16, 'count': 20000}),
+    ('eventWait_1024_1', benchEventWait,
+     {'numFds': 1024, 'numReady': 1, 'count': 20000}),
+    ('simFanIn_256', benchSimFanIn, {'numLines': 256, 'count': 100000}),
+    ('simFanIn_4096', benchSimFanIn, {'numLines': 4096, 'count': 100000}),
+    ('simEncoder_max', benchSimEncoder, {'count': 100000}),
+    ('simEncoder_2k', benchSimEncoder, {'count': 2000, 'rate': 2000}),
+    ('simEncoder_20k', benchSimEncoder, {'count': 20000, 'rate': 20000}),
+    ('broker', benchBroker, {'count': 5000, 'batch': 32}),
+    ('snapshot_16', benchSnapshot, {'numPins': 16, 'readers': 2}),
+    ('pinBank', benchPinBank, {'count': 20000}),
+    ('pinSet_1000', benchPinSet, {'numPins': 1000}),
+    ('mmapBackend', benchMMapBackend, {'count': 200000}),
+    ('chardev', benchChardev, {'count': 20000}),
+    ('tracing', benchTracing, {'count': 20000}),
+    ('metrics', benchMetrics, {'count': 20000}),
+    ('logging', benchLogging, {'count': 20000}),
+    ('logging_slow', benchLogging,
+     {'count': 2000, 'writeDelay': 0.005, 'interval': 0.0005}),
+    ('softPWM_spin_0', benchSoftPWM, {'spin': 0, 'duration': 1.0}),
+    ('softPWM_spin_200', benchSoftPWM, {'spin': 200, 'duration': 1.0}),
+    )
+
+
+def runSuite(names=None, scale=1.0, out=None):
+    """
+    Run the benchmarks in SUITE, or only those in names, and return a dict
+    of the results keyed by name. Each result is printed to out as it
+    finishes if out is not None.
+    """
+    results = {}
+
+    for name, func, kwargs in SUITE:
+        if names and name not in names:
+            continue
+
+        kwargs = dict(kwargs)
+
+        for key in ('count', 'duration'):
+            if key in kwargs:
+                kwargs[key] = type(kwargs[key])(max(1, kwargs[key] * scale))
+
+        results[name] = result = func(**kwargs)
+
+        if out is not None:
+            print("{}: {}".format(name, ", ".join(
+                "{}={:,.1f}".format(key, value) if isinstance(value, float)
+                else "{}={}".format(key, value)
+                for key, value in sorted(result.items()))), file=out)
+
+            # The rates of a decoder that lost steps are not worth having.
+            fraction = result.get('decoded_fraction', 1.0)
+            expected = result.get('expected_fraction', 1.0)
+
+            if fraction < expected:
+                print("WARNING {}: decoded {:.1%} of the steps, expected "
+                      "{:.1%}.".format(name, fraction, expected), file=out)
+
+    return results
+
+
+def compareResults(baseline, results, tolerance=0.1):
+    """
+    Return a list of (name, key, old, new) for each metric in results that
+    is more than tolerance (a fraction) worse than in baseline. The min and
+    max latencies are too noisy to compare and are skipped.
+    """
+    regressions = []
+
+    for name, result in sorted(results.items()):
+        old = baseline.get(name, {})
+
+        for key, new in sorted(result.items()):
+            if (key not in old or not old[key]
+                or key.startswith(('min_', 'max_'))):
+                continue
+
+            if key.endswith('_per_sec'):
+                worse = new < old[key] * (1 - tolerance)
+            elif key.endswith(('_ns', '_us')):
+                worse = new > old[key] * (1 + tolerance)
+            else:
+                continue
+
+            if worse:
+                regressions.append((name, key, old[key], new))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the GPIO hot paths against a fake sysfs tree.")
+    parser.add_argument('--json', metavar='PATH',
+                        help="Write the results as JSON to PATH, - for stdout.")
+    parser.add_argument('--only', metavar='NAME', action='append',
+                        choices=[name for name, func, kwargs in SUITE],
+                        help="Run only this benchmark, can be repeated.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Multiply the iteration counts and durations.")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="Compare against the JSON results in PATH.")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Fraction a metric may get worse by before it "
+                        "is reported as a regression (default 0.1).")
+    options = parser.parse_args(argv)
+    # Keep stdout clean for the JSON.
+    out = sys.stderr if options.json == '-' else sys.stdout
+    results = runSuite(options.only, options.scale, out)
+    report = {'python': platform.python_version(),
+              'implementation': platform.python_implementation(),
+              'platform': platform.platform(),
+              'machine': platform.machine(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+              'scale': options.scale,
+              'results': results}
+
+    if options.json == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    elif options.json:
+        with open(options.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+
+        regressions = compareResults(baseline, results, options.tolerance)
+
+        for name, key, old, new in regressions:
+            print("REGRESSION {} {}: {:,.1f} -> {:,.1f}".format(
+                name, key, old, new), file=out)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
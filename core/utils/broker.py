@@ -0,0 +1,710 @@
+#
+# core/utils/broker.py
+#
+
+"""
+A broker that owns the exported pins of the machine and serves them to
+other processes over a Unix domain socket, so every process shares one
+set of descriptors and one epoll.
+
+Run with: python -m core.utils.broker [--socket PATH]
+
+    gpio = GPIOProxy('/run/robot/gpio.sock')
+    gpio.setMode('P8_7', direction=GPIO.OUT)
+    gpio.setValue('P8_7', 1)
+
+    with gpio.pipeline() as pipe:
+        for pin in pins:
+            pipe.getValue(pin)
+
+    values = pipe.results
+
+Every message in both directions is one MESSAGE, a request's response
+carries its sequence number. Requests may be sent back to back without
+waiting for their responses, the broker answers everything that arrived
+together in one write. Edges on subscribed pins are pushed as OP_EVENT
+messages with sequence number 0.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, sys, time, errno, select, signal, socket, struct, logging
+import argparse, threading
+from collections import deque
+
+from .basegpio import BaseGPIO
+from .gpio import GPIO
+from .containers import Pin
+from .events import Event
+from .exceptions import (
+    BaseGPIOException, InvalidDirectionException, InvalidEdgeException,
+    InvalidArgumentsException)
+
+# seq, op, status, gpioId, value, timestamp_ns
+MESSAGE = struct.Struct('=IBBHiq')
+(OP_PING, OP_SET_MODE, OP_SET_VALUE, OP_GET_VALUE, OP_SET_DIRECTION,
+ OP_GET_DIRECTION, OP_SET_EDGE, OP_GET_EDGE, OP_SUBSCRIBE, OP_UNSUBSCRIBE,
+ OP_CLEANUP, OP_EVENT) = range(12)
+STATUS_OK, STATUS_INVALID, STATUS_OSERROR = range(3)
+# Directions and edges sent as their index, 0 being not given.
+DIRECTIONS = ('', 'in', 'out')
+EDGES = ('', 'none', 'rising', 'falling', 'both')
+# The gpioId of a cleanup of all of a client's pins.
+ALL_PINS = 0xFFFF
+DEFAULT_SOCKET = '/run/gpio-broker.sock'
+
+
+def _code(values, value, exception, pin):
+    try:
+        return values.index(value or '')
+    except ValueError:
+        raise exception(pin)
+
+
+class _Client(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf = bytearray()
+        self.pins = set()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+class _Wakeup(object):
+
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+class GPIOBroker(object):
+    """
+    Serve the pins of a GPIO object to clients on a Unix domain socket.
+    The listener, the clients and the subscribed pins are all waited on
+    with one Event.
+
+    path    -- The socket path, a stale socket left there is replaced.
+    gpio    -- The GPIO object to serve, by default a new one on backend.
+    timeout -- Seconds a client may block a write to it before it is
+               dropped.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, gpio=None, backend=None,
+                 timeout=1.0, logger=None, level=logging.INFO):
+        self._log = logging.getLogger(logger or '')
+        self._gpio = gpio if gpio is not None else GPIO(
+            logger=logger, level=level, backend=backend)
+        self._path = path
+        self._timeout = timeout
+        self._event = Event()
+        self._clients = {}
+        self._pins = {}
+        self._subscribers = {}
+        self._names = {}
+        self._thread = None
+        self._running = False
+        self._wakeup = _Wakeup()
+        self._listener = self._listen(path)
+        self._event.register(self._listener, eventmask=Event.INPUT,
+                             identifier=self._onAccept)
+        self._event.register(self._wakeup, eventmask=Event.INPUT,
+                             identifier=self._onWakeup)
+        self.requests = 0
+
+    def _listen(self, path):
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise InvalidArgumentsException(
+                    "A broker is already serving {}.".format(path))
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(64)
+        listener.setblocking(False)
+        return listener
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def gpio(self):
+        return self._gpio
+
+    def serve(self, timeout=-1):
+        """
+        Wait up to timeout seconds and handle what arrived.
+        """
+        for handler, mask in self._event.eventWait(timeout):
+            handler(mask)
+
+    def serveForever(self):
+        self._running = True
+
+        while self._running:
+            self.serve()
+
+    def start(self):
+        """
+        Serve from a thread until stop() is called.
+        """
+        self._thread = threading.Thread(target=self.serveForever,
+                                        name='GPIOBroker')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.writer.send(b'\0')
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stop serving, drop the clients and clean up the pins.
+        """
+        self.stop()
+
+        for client in list(self._clients.values()):
+            self._drop(client)
+
+        for gpioId in list(self._pins):
+            self._closePin(gpioId)
+
+        self._event.close()
+        self._listener.close()
+        self._wakeup.close()
+
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+        self._gpio.cleanup()
+
+    def _onWakeup(self, mask):
+        try:
+            self._wakeup.reader.recv(64)
+        except BlockingIOError:
+            pass
+
+    def _onAccept(self, mask):
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+
+        sock.settimeout(self._timeout)
+        client = _Client(sock)
+        self._clients[client.fileno()] = client
+        self._event.register(client, eventmask=Event.INPUT,
+                             identifier=lambda mask: self._onClient(client))
+
+    def _drop(self, client):
+        if client.fileno() in self._clients:
+            del self._clients[client.fileno()]
+            self._event.unregister(client)
+
+        for gpioId in list(client.pins):
+            self._unsubscribe(client, gpioId)
+
+        client.sock.close()
+
+    def _send(self, client, data):
+        try:
+            client.sock.sendall(data)
+        except OSError as e:
+            self._log.warning("Dropping a client, %s", e)
+            self._drop(client)
+
+    def _onClient(self, client):
+        if client.sock.fileno() < 0:
+            return
+
+        try:
+            data = client.sock.recv(65536)
+        except (BlockingIOError, socket.timeout):
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._drop(client)
+            return
+
+        buf = client.buf
+        buf += data
+        count = len(buf) // MESSAGE.size
+        out = bytearray()
+
+        for offset in range(0, count * MESSAGE.size, MESSAGE.size):
+            out += self._handle(client, *MESSAGE.unpack_from(buf, offset))
+
+        del buf[:count * MESSAGE.size]
+        self.requests += count
+
+        if out:
+            self._send(client, out)
+
+    def _handle(self, client, seq, op, status, gpioId, value, timestamp):
+        try:
+            value = self._dispatch(client, op, gpioId, value)
+            status = STATUS_OK
+        except BaseGPIOException as e:
+            self._log.warning("Request %s for gpio%s failed, %s", op, gpioId,
+                              e)
+            status, value = STATUS_INVALID, 0
+        except OSError as e:
+            status, value = STATUS_OSERROR, e.errno or 0
+        except (IndexError, ValueError):
+            status, value = STATUS_INVALID, 0
+
+        return MESSAGE.pack(seq, op, status, gpioId, value, 0)
+
+    def _name(self, gpioId):
+        try:
+            return self._names[gpioId]
+        except KeyError:
+            name = self._names[gpioId] = 'GPIO_{}'.format(gpioId)
+            return name
+
+    def _dispatch(self, client, op, gpioId, value):
+        gpio = self._gpio
+
+        if op == OP_GET_VALUE:
+            return gpio.getValue(self._name(gpioId))
+        elif op == OP_SET_VALUE:
+            gpio.setValue(self._name(gpioId), value)
+        elif op == OP_SET_MODE:
+            return int(bool(gpio.setMode(
+                self._name(gpioId), direction=DIRECTIONS[value & 0xF] or None,
+                edge=EDGES[value >> 4] or None)))
+        elif op == OP_SET_DIRECTION:
+            gpio.setDirection(self._name(gpioId), DIRECTIONS[value])
+        elif op == OP_GET_DIRECTION:
+            return DIRECTIONS.index(gpio.getDirection(self._name(gpioId)))
+        elif op == OP_SET_EDGE:
+            gpio.setEdge(self._name(gpioId), EDGES[value])
+        elif op == OP_GET_EDGE:
+            return EDGES.index(gpio.getEdge(self._name(gpioId)))
+        elif op == OP_SUBSCRIBE:
+            return self._subscribe(client, gpioId)
+        elif op == OP_UNSUBSCRIBE:
+            self._unsubscribe(client, gpioId)
+        elif op == OP_CLEANUP:
+            return self._cleanup(client, gpioId)
+        elif op != OP_PING:
+            raise InvalidArgumentsException("Invalid op {}.".format(op))
+
+        return 0
+
+    def _subscribe(self, client, gpioId):
+        pin = self._pins.get(gpioId)
+
+        if pin is None:
+            pin = Pin(self._name(gpioId), backend=self._gpio._backend)
+            self._pins[gpioId] = pin
+            self._subscribers[gpioId] = set()
+            self._event.register(
+                pin, identifier=lambda mask: self._onPin(gpioId))
+
+        self._subscribers[gpioId].add(client)
+        client.pins.add(gpioId)
+        return pin.value
+
+    def _unsubscribe(self, client, gpioId):
+        client.pins.discard(gpioId)
+        subscribers = self._subscribers.get(gpioId)
+
+        if subscribers is not None:
+            subscribers.discard(client)
+
+            if not subscribers:
+                self._closePin(gpioId)
+
+    def _closePin(self, gpioId):
+        pin = self._pins.pop(gpioId)
+        del self._subscribers[gpioId]
+        self._event.unregister(pin)
+        pin.close()
+
+    def _cleanup(self, client, gpioId):
+        """
+        Unsubscribe the client from gpioId and unexport it, ALL_PINS only
+        unsubscribes the client from its pins, the broker keeps the pins
+        the other clients may be using.
+        """
+        if gpioId == ALL_PINS:
+            for pinId in list(client.pins):
+                self._unsubscribe(client, pinId)
+
+            return 0
+
+        for subscriber in list(self._subscribers.get(gpioId, ())):
+            self._unsubscribe(subscriber, gpioId)
+
+        return int(bool(self._gpio.cleanup(self._name(gpioId))))
+
+    def _onPin(self, gpioId):
+        pin = self._pins.get(gpioId)
+
+        if pin is None:
+            return
+
+        message = MESSAGE.pack(0, OP_EVENT, STATUS_OK, gpioId, pin.value,
+                               time.monotonic_ns())
+
+        for client in list(self._subscribers[gpioId]):
+            self._send(client, message)
+
+
+class GPIOProxy(BaseGPIO):
+    """
+    A GPIO work-alike whose calls are served by a GPIOBroker. Pin names
+    are resolved here, only gpioIds go over the socket.
+
+    path    -- The socket path of the broker.
+    timeout -- Seconds to wait for a response.
+    """
+    IN = GPIO.IN
+    OUT = GPIO.OUT
+    RISING = GPIO.RISING
+    FALLING = GPIO.FALLING
+    BOTH = GPIO.BOTH
+    HIGH = GPIO.HIGH
+    LOW = GPIO.LOW
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=5.0, logger=None,
+                 level=logging.INFO):
+        super(GPIOProxy, self).__init__(logger=logger, level=level)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._sock.settimeout(timeout)
+        self._seq = 0
+        self._buf = bytearray()
+        # The requests sent and still waited for, responses to any others
+        # were given up on and are dropped.
+        self._pending = set()
+        self._responses = {}
+        self._events = deque()
+        self._callbacks = {}
+
+    def fileno(self):
+        """
+        The socket, readable when events have been pushed.
+        """
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+
+    def _nextSeq(self):
+        self._seq = self._seq + 1 if self._seq < 0xFFFFFFFF else 1
+        return self._seq
+
+    def _encode(self, op, pin, value=0):
+        """
+        Return the sequence number and message of a request.
+        """
+        gpioId = self._getGpioId(pin) if pin is not None else ALL_PINS
+        seq = self._nextSeq()
+        return seq, MESSAGE.pack(seq, op, 0, gpioId, value, 0)
+
+    def _receive(self):
+        data = self._sock.recv(65536)
+
+        if not data:
+            raise ConnectionResetError(errno.ECONNRESET,
+                                       "The broker closed the connection.")
+
+        buf = self._buf
+        buf += data
+        count = len(buf) // MESSAGE.size
+
+        for offset in range(0, count * MESSAGE.size, MESSAGE.size):
+            seq, op, status, gpioId, value, timestamp = MESSAGE.unpack_from(
+                buf, offset)
+
+            if op == OP_EVENT:
+                self._events.append((gpioId, value, timestamp))
+            elif seq in self._pending:
+                self._responses[seq] = (op, status, gpioId, value)
+
+        del buf[:count * MESSAGE.size]
+
+    def _result(self, seq):
+        responses = self._responses
+
+        try:
+            while seq not in responses:
+                self._receive()
+        except OSError:
+            self._abandon((seq,))
+            raise
+
+        self._pending.discard(seq)
+        op, status, gpioId, value = responses.pop(seq)
+
+        if status == STATUS_OSERROR:
+            raise OSError(value, os.strerror(value))
+        elif status != STATUS_OK:
+            raise InvalidArgumentsException(
+                "The broker rejected op {} on gpio{}.".format(op, gpioId))
+
+        return value
+
+    def _abandon(self, seqs):
+        """
+        Stop waiting for seqs, their responses are dropped if they come.
+        """
+        for seq in seqs:
+            self._pending.discard(seq)
+            self._responses.pop(seq, None)
+
+    def _request(self, op, pin, value=0):
+        seq, message = self._encode(op, pin, value)
+        self._pending.add(seq)
+
+        try:
+            self._sock.sendall(message)
+        except OSError:
+            self._abandon((seq,))
+            raise
+
+        return self._result(seq)
+
+    def ping(self):
+        return self._request(OP_PING, None)
+
+    def setMode(self, pin, direction=None, edge=None):
+        return bool(self._request(OP_SET_MODE, pin, _modeCode(
+            pin, direction, edge)))
+
+    def setValue(self, pin, value):
+        self._request(OP_SET_VALUE, pin, int(value))
+
+    def getValue(self, pin):
+        return self._request(OP_GET_VALUE, pin)
+
+    def setDirection(self, pin, direction):
+        self._request(OP_SET_DIRECTION, pin, _code(
+            DIRECTIONS, direction, InvalidDirectionException, pin))
+
+    def getDirection(self, pin):
+        return DIRECTIONS[self._request(OP_GET_DIRECTION, pin)]
+
+    def setEdge(self, pin, edge):
+        self._request(OP_SET_EDGE, pin, _code(
+            EDGES, edge, InvalidEdgeException, pin))
+
+    def getEdge(self, pin):
+        return EDGES[self._request(OP_GET_EDGE, pin)]
+
+    def cleanup(self, pin=None):
+        """
+        Unexport pin, if None only drop this client's subscriptions, the
+        broker keeps the pins other clients may be using.
+        """
+        return bool(self._request(OP_CLEANUP, pin))
+
+    def subscribe(self, pin, callback=None):
+        """
+        Have the broker push the edges of pin, returns its current value.
+        The callback is called with (gpioId, value, timestamp_ns) for each
+        edge read by readEvents().
+        """
+        value = self._request(OP_SUBSCRIBE, pin)
+
+        if callback is not None:
+            self._callbacks[self._getGpioId(pin)] = callback
+
+        return value
+
+    def unsubscribe(self, pin):
+        self._callbacks.pop(self._getGpioId(pin), None)
+        self._request(OP_UNSUBSCRIBE, pin)
+
+    def readEvents(self, timeout=0):
+        """
+        Return the edges pushed so far as (gpioId, value, timestamp_ns)
+        tuples, waiting up to timeout seconds for one if there are none.
+        """
+        # Drain the socket, a partial message in the buffer still needs the
+        # rest of it.
+        wait = 0 if self._events else timeout
+
+        while select.select([self._sock], [], [], wait)[0]:
+            self._receive()
+            wait = 0
+
+        events = list(self._events)
+        self._events.clear()
+
+        for event in events:
+            callback = self._callbacks.get(event[0])
+
+            if callback is not None:
+                callback(*event)
+
+        return events
+
+    def pipeline(self):
+        """
+        Return a Pipeline that sends its requests together.
+        """
+        return Pipeline(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _modeCode(pin, direction, edge):
+    return _code(DIRECTIONS, direction, InvalidDirectionException, pin) | \
+           _code(EDGES, edge, InvalidEdgeException, pin) << 4
+
+
+class Pipeline(object):
+    """
+    Requests queued on a GPIOProxy and sent in one write, execute() waits
+    for all of their responses. Used as a context manager the requests are
+    executed on leaving the block and the results left in results.
+    """
+
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self._requests = []
+        self._convert = []
+        self.results = []
+
+    def __len__(self):
+        return len(self._requests)
+
+    def _add(self, op, pin, value=0, convert=None):
+        self._requests.append(self._proxy._encode(op, pin, value))
+        self._convert.append(convert)
+        return self
+
+    def setMode(self, pin, direction=None, edge=None):
+        return self._add(OP_SET_MODE, pin, _modeCode(pin, direction, edge),
+                         bool)
+
+    def setValue(self, pin, value):
+        return self._add(OP_SET_VALUE, pin, int(value), lambda v: None)
+
+    def getValue(self, pin):
+        return self._add(OP_GET_VALUE, pin)
+
+    def getDirection(self, pin):
+        return self._add(OP_GET_DIRECTION, pin, 0, DIRECTIONS.__getitem__)
+
+    def getEdge(self, pin):
+        return self._add(OP_GET_EDGE, pin, 0, EDGES.__getitem__)
+
+    def execute(self):
+        """
+        Send the requests and return their results in order. If any failed
+        the first error is raised after all the responses are read. A
+        timeout or lost connection is raised at once and the responses
+        still to come are dropped.
+        """
+        requests, self._requests = self._requests, []
+        convert, self._convert = self._convert, []
+        proxy = self._proxy
+        proxy._pending.update(seq for seq, message in requests)
+
+        try:
+            proxy._sock.sendall(b''.join(message for seq, message in requests))
+        except OSError:
+            proxy._abandon(seq for seq, message in requests)
+            raise
+
+        results = []
+        error = None
+
+        for (seq, message), func in zip(requests, convert):
+            try:
+                value = proxy._result(seq)
+                results.append(func(value) if func is not None else value)
+            except (OSError, BaseGPIOException) as e:
+                if isinstance(e, (ConnectionError, socket.timeout)):
+                    proxy._abandon(seq for seq, message in requests)
+                    raise
+
+                error = error or e
+                results.append(e)
+
+        self.results = results
+
+        if error is not None:
+            raise error
+
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the GPIO pins of this machine to other processes.")
+    parser.add_argument('--socket', metavar='PATH', default=DEFAULT_SOCKET,
+                        help="The Unix socket to serve on (default "
+                        "{}).".format(DEFAULT_SOCKET))
+    parser.add_argument('--state-file', metavar='PATH',
+                        help="Keep the exported pins in PATH so they are "
+                        "cleaned up after a crash.")
+    options = parser.parse_args(argv)
+    broker = GPIOBroker(options.socket, gpio=GPIO(
+        stateFile=options.state_file))
+
+    def terminate(signum, frame):
+        broker._running = False
+        broker._wakeup.writer.send(b'\0')
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    try:
+        broker.serveForever()
+    finally:
+        broker.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
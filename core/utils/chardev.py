@@ -0,0 +1,737 @@
+#
+# core/utils/chardev.py
+#
+
+"""
+A backend using the GPIO character device uAPI v2 (/dev/gpiochipN) in place
+of sysfs. Lines are claimed with line requests, all the lines of a request
+are read or written with a single ioctl, edge events are timestamped by the
+kernel and read from the request descriptor in batches, and bias and
+debounce are set in the kernel.
+
+    backend = ChardevBackend()
+    gpio = GPIO(backend=backend)
+    gpio.setMode('P8_7', direction=GPIO.IN, edge=GPIO.BOTH)
+    backend.setBias(66, ChardevBackend.PULL_UP)
+
+    request = backend.request((44, 45, 46, 47), direction='out')
+    request.setValues(0b1010)
+
+All the kernel calls go through an io object, KernelIO by default, so the
+backend can be run against FakeChardev from core.utils.fakechardev.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, fcntl, select, struct, threading
+from collections import deque
+
+from .exceptions import InvalidArgumentsException
+from .backends import BaseBackend
+
+
+def _IOC(direction, type, nr, size):
+    return (direction << 30) | (size << 16) | (type << 8) | nr
+
+
+# Structure layouts from include/uapi/linux/gpio.h, '=' so there is no
+# padding other than the explicit padding fields.
+LINES_MAX = 64
+NUM_ATTRS_MAX = 10
+CHIP_INFO = struct.Struct('=32s32sI')
+LINE_ATTRIBUTE = struct.Struct('=IIQQ') # id, padding, value, mask
+LINE_CONFIG = struct.Struct('=QI20x' + '24s' * NUM_ATTRS_MAX)
+LINE_REQUEST = struct.Struct('={}I32s{}sII20xi'.format(LINES_MAX,
+                                                      LINE_CONFIG.size))
+LINE_VALUES = struct.Struct('=QQ')
+LINE_EVENT = struct.Struct('=QIIII24x')
+
+GPIO_GET_CHIPINFO_IOCTL = _IOC(2, 0xB4, 0x01, CHIP_INFO.size)
+GPIO_V2_GET_LINE_IOCTL = _IOC(3, 0xB4, 0x07, LINE_REQUEST.size)
+GPIO_V2_LINE_SET_CONFIG_IOCTL = _IOC(3, 0xB4, 0x0D, LINE_CONFIG.size)
+GPIO_V2_LINE_GET_VALUES_IOCTL = _IOC(3, 0xB4, 0x0E, LINE_VALUES.size)
+GPIO_V2_LINE_SET_VALUES_IOCTL = _IOC(3, 0xB4, 0x0F, LINE_VALUES.size)
+
+# Line flags.
+FLAG_USED = 1 << 0
+FLAG_ACTIVE_LOW = 1 << 1
+FLAG_INPUT = 1 << 2
+FLAG_OUTPUT = 1 << 3
+FLAG_EDGE_RISING = 1 << 4
+FLAG_EDGE_FALLING = 1 << 5
+FLAG_OPEN_DRAIN = 1 << 6
+FLAG_OPEN_SOURCE = 1 << 7
+FLAG_BIAS_PULL_UP = 1 << 8
+FLAG_BIAS_PULL_DOWN = 1 << 9
+FLAG_BIAS_DISABLED = 1 << 10
+# Line config attribute ids.
+ATTR_ID_FLAGS = 1
+ATTR_ID_OUTPUT_VALUES = 2
+ATTR_ID_DEBOUNCE = 3
+# Line event ids.
+EVENT_RISING_EDGE = 1
+EVENT_FALLING_EDGE = 2
+
+_DIRECTION_FLAGS = {'in': FLAG_INPUT, 'out': FLAG_OUTPUT}
+_EDGE_FLAGS = {'none': 0, 'rising': FLAG_EDGE_RISING,
+               'falling': FLAG_EDGE_FALLING,
+               'both': FLAG_EDGE_RISING | FLAG_EDGE_FALLING}
+_BIAS_FLAGS = {None: 0, 'pull-up': FLAG_BIAS_PULL_UP,
+               'pull-down': FLAG_BIAS_PULL_DOWN,
+               'disable': FLAG_BIAS_DISABLED}
+_EDGE_MASK = FLAG_EDGE_RISING | FLAG_EDGE_FALLING
+_BIAS_MASK = FLAG_BIAS_PULL_UP | FLAG_BIAS_PULL_DOWN | FLAG_BIAS_DISABLED
+
+
+def _flagName(table, flags, mask):
+    flags &= mask
+
+    for name, value in table.items():
+        if value == flags:
+            return name
+
+
+def packConfig(flags, debounce=None, values=None):
+    """
+    Pack a line config for the lines of a request from a list of the flags
+    of each line, and optionally lists of the debounce period in
+    microseconds and the output value of each line. The most common flags
+    are the request default and the others are attributes masked to their
+    lines.
+    """
+    attrs = []
+    groups = {}
+
+    for idx, lineFlags in enumerate(flags):
+        groups[lineFlags] = groups.get(lineFlags, 0) | 1 << idx
+
+    default = max(groups, key=lambda f: bin(groups[f]).count('1'))
+
+    for lineFlags, mask in sorted(groups.items()):
+        if lineFlags != default:
+            attrs.append((ATTR_ID_FLAGS, lineFlags, mask))
+
+    if values is not None:
+        bits = mask = 0
+
+        for idx, (lineFlags, value) in enumerate(zip(flags, values)):
+            if lineFlags & FLAG_OUTPUT:
+                mask |= 1 << idx
+                bits |= (1 if value else 0) << idx
+
+        if mask:
+            attrs.append((ATTR_ID_OUTPUT_VALUES, bits, mask))
+
+    if debounce is not None:
+        periods = {}
+
+        for idx, period in enumerate(debounce):
+            if period:
+                periods[period] = periods.get(period, 0) | 1 << idx
+
+        for period, mask in sorted(periods.items()):
+            attrs.append((ATTR_ID_DEBOUNCE, period, mask))
+
+    if len(attrs) > NUM_ATTRS_MAX:
+        raise InvalidArgumentsException(
+            "Too many distinct line configurations in one request, found {}, "
+            "the maximum is {}.".format(len(attrs), NUM_ATTRS_MAX))
+
+    numAttrs = len(attrs)
+    attrs = [LINE_ATTRIBUTE.pack(id, 0, value, mask)
+             for id, value, mask in attrs]
+    attrs += [bytes(LINE_ATTRIBUTE.size)] * (NUM_ATTRS_MAX - numAttrs)
+    return LINE_CONFIG.pack(default, numAttrs, *attrs)
+
+
+def unpackConfig(data, numLines):
+    """
+    Return the flags, debounce periods and output values of each line of a
+    packed line config, the inverse of packConfig.
+    """
+    fields = LINE_CONFIG.unpack(data)
+    default, numAttrs = fields[:2]
+    flags = [default] * numLines
+    debounce = [0] * numLines
+    values = [0] * numLines
+
+    for attr in fields[2:2 + numAttrs]:
+        id, padding, value, mask = LINE_ATTRIBUTE.unpack(attr)
+
+        for idx in range(numLines):
+            if not mask >> idx & 1:
+                continue
+
+            if id == ATTR_ID_FLAGS:
+                flags[idx] = value
+            elif id == ATTR_ID_DEBOUNCE:
+                debounce[idx] = value
+            elif id == ATTR_ID_OUTPUT_VALUES:
+                values[idx] = value >> idx & 1
+
+    return flags, debounce, values
+
+
+class KernelIO(object):
+    """
+    The system calls used by ChardevBackend.
+    """
+
+    def open(self, path):
+        return os.open(path, os.O_RDWR | os.O_CLOEXEC)
+
+    def ioctl(self, fd, request, buf):
+        fcntl.ioctl(fd, request, buf, True)
+
+    def read(self, fd, size):
+        return os.read(fd, size)
+
+    def dup(self, fd):
+        return os.dup(fd)
+
+    def dup2(self, fd, fd2):
+        os.dup2(fd, fd2, inheritable=False)
+
+    def pipe(self):
+        return os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    def close(self, fd):
+        os.close(fd)
+
+
+class LineRequest(object):
+    """
+    A set of lines on one chip claimed with a single line request. The
+    values of all the lines are read or written with one ioctl, bit n of a
+    value is the nth line of gpioIds.
+    """
+
+    def __init__(self, backend, chip, gpioIds, flags, debounce, values,
+                 consumer):
+        self._io = backend._io
+        self._linesPerChip = backend._linesPerChip
+        self._gpioIds = tuple(gpioIds)
+        self._index = dict((gpioId, idx)
+                           for idx, gpioId in enumerate(self._gpioIds))
+        self._flags = list(flags)
+        self._debounce = list(debounce)
+        self._values = [1 if value else 0 for value in values]
+        self._mask = (1 << len(self._gpioIds)) - 1
+        self._valuesBuf = bytearray(LINE_VALUES.size)
+        offsets = [gpioId % backend._linesPerChip for gpioId in gpioIds]
+        offsets += [0] * (LINES_MAX - len(offsets))
+        buf = bytearray(LINE_REQUEST.pack(
+            *offsets, consumer.encode('ascii')[:31],
+            packConfig(self._flags, self._debounce, self._values),
+            len(self._gpioIds), backend._eventBufferSize, 0))
+        self._io.ioctl(backend._chipFd(chip), GPIO_V2_GET_LINE_IOCTL, buf)
+        self._fd = LINE_REQUEST.unpack(buf)[-1]
+
+    @property
+    def gpioIds(self):
+        return self._gpioIds
+
+    def fileno(self):
+        return self._fd
+
+    @property
+    def isClosed(self):
+        return self._fd is None
+
+    def index(self, gpioId):
+        return self._index[gpioId]
+
+    def getValues(self, mask=None):
+        """
+        Return the values of the lines in mask, all by default, as an int.
+        """
+        mask = self._mask if mask is None else mask & self._mask
+        buf = self._valuesBuf
+        LINE_VALUES.pack_into(buf, 0, 0, mask)
+        self._io.ioctl(self._fd, GPIO_V2_LINE_GET_VALUES_IOCTL, buf)
+        return LINE_VALUES.unpack(buf)[0] & mask
+
+    def setValues(self, bits, mask=None):
+        """
+        Set the output lines in mask, all by default, to the bits of bits,
+        in one atomic ioctl.
+        """
+        mask = self._mask if mask is None else mask & self._mask
+        buf = self._valuesBuf
+        LINE_VALUES.pack_into(buf, 0, bits & mask, mask)
+        self._io.ioctl(self._fd, GPIO_V2_LINE_SET_VALUES_IOCTL, buf)
+
+        for idx in range(len(self._values)):
+            if mask >> idx & 1:
+                self._values[idx] = bits >> idx & 1
+
+    def getFlags(self, gpioId):
+        return self._flags[self._index[gpioId]]
+
+    def getDebounce(self, gpioId):
+        return self._debounce[self._index[gpioId]]
+
+    def reconfigure(self, gpioId, flags=None, debounce=None):
+        """
+        Change the flags or debounce period of one line, the other lines
+        keep their configuration.
+        """
+        idx = self._index[gpioId]
+
+        if flags is not None:
+            self._flags[idx] = flags
+
+        if debounce is not None:
+            self._debounce[idx] = debounce
+
+        buf = bytearray(packConfig(self._flags, self._debounce, self._values))
+        self._io.ioctl(self._fd, GPIO_V2_LINE_SET_CONFIG_IOCTL, buf)
+
+    def readEvents(self, maxEvents=64):
+        """
+        Read the pending edge events, up to maxEvents, with a single read.
+        Returns a list of (timestamp_ns, gpioId, value, lineSeqno) tuples,
+        the timestamps are CLOCK_MONOTONIC as time.monotonic_ns().
+        """
+        try:
+            data = self._io.read(self._fd, maxEvents * LINE_EVENT.size)
+        except BlockingIOError:
+            return []
+
+        gpioIds = self._gpioIds
+        offsets = dict((gpioId % self._linesPerChip, gpioId)
+                       for gpioId in gpioIds)
+        return [(timestamp, offsets.get(offset, offset),
+                 1 if id == EVENT_RISING_EDGE else 0, lineSeqno)
+                for timestamp, id, offset, seqno, lineSeqno
+                in LINE_EVENT.iter_unpack(data)]
+
+    def values(self):
+        """
+        The last values written to the lines, outputs only.
+        """
+        return tuple(self._values)
+
+    def close(self):
+        if self._fd is not None:
+            self._io.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ChardevBackend(BaseBackend):
+    """
+    A gpioId is line gpioId % linesPerChip of chip gpioId // linesPerChip,
+    on the BeagleBone the four 32 line banks are gpiochip0 - gpiochip3.
+    setMode claims a single line request per pin, request claims many lines
+    of one chip together.
+
+    chips           -- The chip device paths in gpioId order.
+    linesPerChip    -- The number of lines on each chip.
+    consumer        -- The consumer label shown by the kernel.
+    eventBufferSize -- The kernel event buffer size of each request, 0 lets
+                       the kernel choose.
+    io              -- The system call layer, KernelIO by default.
+    """
+    CONFIGURES = True
+    EVENTMASK = select.EPOLLIN
+    # Events kept for a handle that has not read them yet, the oldest are
+    # dropped past this.
+    HANDLE_QUEUE = 1024
+    PULL_UP = 'pull-up'
+    PULL_DOWN = 'pull-down'
+    BIAS_DISABLE = 'disable'
+    DEFAULT_CHIPS = tuple('/dev/gpiochip{}'.format(n) for n in range(4))
+
+    def __init__(self, chips=DEFAULT_CHIPS, linesPerChip=32,
+                 consumer='RobotControl', eventBufferSize=0, io=None):
+        self._chips = tuple(chips)
+        self._linesPerChip = linesPerChip
+        self._consumer = consumer
+        self._eventBufferSize = eventBufferSize
+        self._io = io if io is not None else KernelIO()
+        self._chipFds = {}
+        # gpioId -> LineRequest
+        self._requests = {}
+        # The descriptors handed out by open, fd -> gpioId, the events
+        # read for each, fd -> deque, and the handles of each line, gpioId
+        # -> set of fds.
+        self._handles = {}
+        self._queues = {}
+        self._lines = {}
+        self._lock = threading.Lock()
+        # A pipe that is never written, it takes the place of handles whose
+        # line is released.
+        self._idle = None
+
+    def _chipFd(self, chip):
+        fd = self._chipFds.get(chip)
+
+        if fd is None:
+            if not 0 <= chip < len(self._chips):
+                raise InvalidArgumentsException(
+                    "Invalid chip {}, must be 0 - {}.".format(
+                        chip, len(self._chips) - 1))
+
+            fd = self._chipFds[chip] = self._io.open(self._chips[chip])
+
+        return fd
+
+    def chipInfo(self, chip):
+        """
+        Return the (name, label, number of lines) of a chip.
+        """
+        buf = bytearray(CHIP_INFO.size)
+        self._io.ioctl(self._chipFd(chip), GPIO_GET_CHIPINFO_IOCTL, buf)
+        name, label, lines = CHIP_INFO.unpack(buf)
+        return (name.rstrip(b'\0').decode('ascii'),
+                label.rstrip(b'\0').decode('ascii'), lines)
+
+    def _makeFlags(self, direction='in', edge=None, bias=None,
+                   activeLow=False):
+        if direction not in _DIRECTION_FLAGS:
+            raise InvalidArgumentsException(
+                "Invalid direction {}, must be one of {}.".format(
+                    direction, sorted(_DIRECTION_FLAGS)))
+
+        if (edge or 'none') not in _EDGE_FLAGS:
+            raise InvalidArgumentsException(
+                "Invalid edge {}, must be one of {}.".format(
+                    edge, sorted(_EDGE_FLAGS)))
+
+        if bias not in _BIAS_FLAGS:
+            raise InvalidArgumentsException(
+                "Invalid bias {}, must be one of {}.".format(
+                    bias, [b for b in _BIAS_FLAGS if b]))
+
+        flags = _DIRECTION_FLAGS[direction] | _BIAS_FLAGS[bias]
+        flags |= _EDGE_FLAGS[edge or 'none']
+
+        if flags & _EDGE_MASK and not flags & FLAG_INPUT:
+            raise InvalidArgumentsException(
+                "An edge can only be set on an input.")
+
+        return flags | (FLAG_ACTIVE_LOW if activeLow else 0)
+
+    def request(self, gpioIds, direction='in', edge=None, bias=None,
+                debounce=0, activeLow=False, values=None):
+        """
+        Claim gpioIds, all on one chip, with a single line request and
+        return the LineRequest. Lines already claimed by this backend are
+        released first. The per pin methods keep working on the lines.
+
+        debounce -- The debounce period in microseconds, inputs only.
+        values   -- The initial values of outputs.
+        """
+        gpioIds = tuple(gpioIds)
+        chips = set(gpioId // self._linesPerChip for gpioId in gpioIds)
+
+        if not gpioIds or len(gpioIds) > LINES_MAX or len(chips) != 1:
+            raise InvalidArgumentsException(
+                "A request must have 1 - {} lines all on one chip, found: "
+                "{}".format(LINES_MAX, gpioIds))
+
+        flags = self._makeFlags(direction, edge, bias, activeLow)
+
+        for gpioId in gpioIds:
+            self.release(gpioId)
+
+        num = len(gpioIds)
+        request = LineRequest(self, chips.pop(), gpioIds, [flags] * num,
+                              [debounce] * num,
+                              values if values is not None else [0] * num,
+                              self._consumer)
+
+        for gpioId in gpioIds:
+            self._requests[gpioId] = request
+
+        return request
+
+    def _getRequest(self, gpioId):
+        try:
+            return self._requests[gpioId]
+        except KeyError:
+            raise InvalidArgumentsException(
+                "Line {} has not been requested.".format(gpioId))
+
+    def read(self, gpioId):
+        request = self._getRequest(gpioId)
+        return int(bool(request.getValues(1 << request.index(gpioId))))
+
+    def write(self, gpioId, value):
+        request = self._getRequest(gpioId)
+        bit = 1 << request.index(gpioId)
+        request.setValues(bit if value else 0, bit)
+
+    def readLines(self, gpioIds):
+        """
+        Return the values of gpioIds with one ioctl per line request.
+        """
+        masks = {}
+
+        for gpioId in gpioIds:
+            request = self._getRequest(gpioId)
+            masks[request] = masks.get(request, 0) | 1 << request.index(
+                gpioId)
+
+        bits = dict((request, request.getValues(mask))
+                    for request, mask in masks.items())
+        return [int(bool(bits[self._requests[gpioId]] >> self._requests[
+            gpioId].index(gpioId) & 1)) for gpioId in gpioIds]
+
+    def writeLines(self, gpioIds, values):
+        """
+        Write values to gpioIds with one ioctl per line request, the lines
+        of a request change together.
+        """
+        changes = {}
+
+        for gpioId, value in zip(gpioIds, values):
+            request = self._getRequest(gpioId)
+            bit = 1 << request.index(gpioId)
+            bits, mask = changes.get(request, (0, 0))
+            changes[request] = (bits | (bit if value else 0), mask | bit)
+
+        for request, (bits, mask) in changes.items():
+            request.setValues(bits, mask)
+
+    def open(self, gpioId):
+        """
+        Return a duplicate of the descriptor of the line request holding
+        gpioId. When the line is released the duplicate is pointed at an
+        idle pipe, so the kernel frees the line while the descriptor the
+        caller closes stays valid. The kernel drops it from any epoll it
+        was registered with.
+        """
+        fd = self._io.dup(self._getRequest(gpioId).fileno())
+        self._addHandle(fd, gpioId)
+        return fd
+
+    def _addHandle(self, fd, gpioId, queue=None):
+        with self._lock:
+            self._handles[fd] = gpioId
+            self._queues[fd] = queue if queue is not None else deque(
+                maxlen=self.HANDLE_QUEUE)
+            self._lines.setdefault(gpioId, set()).add(fd)
+
+    def _dropHandle(self, fd):
+        """
+        Forget the handle fd, returns its queue or None if it was not one.
+        """
+        with self._lock:
+            gpioId = self._handles.pop(fd, None)
+
+            if gpioId is None:
+                return None
+
+            fds = self._lines[gpioId]
+            fds.discard(fd)
+
+            if not fds:
+                del self._lines[gpioId]
+
+            return self._queues.pop(fd)
+
+    def readEvents(self, fd, maxEvents=64):
+        """
+        Read the edge events pending on a descriptor returned by open. All
+        the handles of a request share the kernel queue, the events read
+        for the other lines are kept for their own handles, every handle
+        of a line gets all of its events.
+        """
+        with self._lock:
+            try:
+                data = self._io.read(fd, maxEvents * LINE_EVENT.size)
+            except BlockingIOError:
+                data = b''
+
+            gpioId = self._handles.get(fd)
+
+            if gpioId is None:
+                return [(timestamp, 1 if id == EVENT_RISING_EDGE else 0)
+                        for timestamp, id, offset, seqno, lineSeqno
+                        in LINE_EVENT.iter_unpack(data)]
+
+            queues = self._queues
+            lines = self._lines
+            base = gpioId - gpioId % self._linesPerChip
+
+            for timestamp, id, offset, seqno, lineSeqno in \
+                    LINE_EVENT.iter_unpack(data):
+                event = (timestamp, 1 if id == EVENT_RISING_EDGE else 0)
+
+                for other in lines.get(base + offset, ()):
+                    queues[other].append(event)
+
+            queue = queues[fd]
+            events = list(queue)
+            queue.clear()
+            return events
+
+    def closeFd(self, fd):
+        self._dropHandle(fd)
+        self._io.close(fd)
+
+    def _idleHandles(self, gpioIds):
+        """
+        Point the handles of gpioIds at the idle pipe and forget them,
+        returns a dict of fd -> (gpioId, queue) of those handles.
+        """
+        moved = dict((fd, gpioId) for fd, gpioId in self._handles.items()
+                     if gpioId in gpioIds)
+
+        if moved and self._idle is None:
+            self._idle = self._io.pipe()
+
+        for fd, gpioId in moved.items():
+            self._io.dup2(self._idle[0], fd)
+            moved[fd] = (gpioId, self._dropHandle(fd))
+
+        return moved
+
+    def setMode(self, gpioId, direction=None, edge=None):
+        request = self._requests.get(gpioId)
+
+        if request is None:
+            self.request((gpioId,), direction=direction or 'in', edge=edge)
+            return True
+
+        if direction or edge:
+            kwargs = {}
+
+            if direction:
+                kwargs['direction'] = direction
+                # Outputs have no edge.
+                kwargs['edge'] = 'none' if direction == 'out' else None
+
+            if edge:
+                kwargs['edge'] = edge
+
+            self._setFlags(gpioId, **kwargs)
+            return True
+
+        return False
+
+    def release(self, gpioId=None):
+        if gpioId is None:
+            result = bool(self._requests)
+            self._idleHandles(set(self._requests))
+
+            for request in set(self._requests.values()):
+                request.close()
+
+            self._requests.clear()
+            return result
+
+        request = self._requests.pop(gpioId, None)
+
+        if request is None:
+            return False
+
+        # A request cannot shrink, claim the remaining lines again. The
+        # handles must let go of the old request first or its lines stay
+        # busy, those of the remaining lines then move to the new request.
+        rest = [g for g in request.gpioIds if g != gpioId]
+        handles = self._idleHandles(request.gpioIds)
+        request.close()
+
+        if rest:
+            idx = [request.index(g) for g in rest]
+            flags = [request._flags[i] for i in idx]
+            debounce = [request._debounce[i] for i in idx]
+            values = [request._values[i] for i in idx]
+            new = LineRequest(self, rest[0] // self._linesPerChip, rest,
+                              flags, debounce, values, self._consumer)
+
+            for g in rest:
+                self._requests[g] = new
+
+            # The events already read for them are kept.
+            for fd, (g, queue) in handles.items():
+                if g != gpioId:
+                    self._io.dup2(new.fileno(), fd)
+                    self._addHandle(fd, g, queue)
+
+        return True
+
+    def _setFlags(self, gpioId, **kwargs):
+        request = self._getRequest(gpioId)
+        flags = request.getFlags(gpioId)
+        current = {
+            'direction': _flagName(_DIRECTION_FLAGS, flags,
+                                   FLAG_INPUT | FLAG_OUTPUT),
+            'edge': _flagName(_EDGE_FLAGS, flags, _EDGE_MASK),
+            'bias': _flagName(_BIAS_FLAGS, flags, _BIAS_MASK),
+            'activeLow': bool(flags & FLAG_ACTIVE_LOW)}
+        current.update((k, v) for k, v in kwargs.items() if v is not None
+                       or k == 'bias')
+        request.reconfigure(gpioId, self._makeFlags(**current))
+
+    def setDirection(self, gpioId, direction):
+        self._setFlags(gpioId, direction=direction,
+                       edge='none' if direction == 'out' else None)
+
+    def getDirection(self, gpioId):
+        return _flagName(_DIRECTION_FLAGS, self._getRequest(
+            gpioId).getFlags(gpioId), FLAG_INPUT | FLAG_OUTPUT)
+
+    def setEdge(self, gpioId, edge):
+        self._setFlags(gpioId, edge=edge)
+
+    def getEdge(self, gpioId):
+        return _flagName(_EDGE_FLAGS, self._getRequest(
+            gpioId).getFlags(gpioId), _EDGE_MASK)
+
+    def setActiveLow(self, gpioId, activeLow):
+        self._setFlags(gpioId, activeLow=bool(activeLow))
+
+    def getActiveLow(self, gpioId):
+        return bool(self._getRequest(gpioId).getFlags(gpioId) &
+                    FLAG_ACTIVE_LOW)
+
+    def setBias(self, gpioId, bias):
+        """
+        Set the bias to PULL_UP, PULL_DOWN, BIAS_DISABLE or None for the
+        chip default.
+        """
+        self._setFlags(gpioId, bias=bias)
+
+    def getBias(self, gpioId):
+        return _flagName(_BIAS_FLAGS, self._getRequest(
+            gpioId).getFlags(gpioId), _BIAS_MASK)
+
+    def setDebounce(self, gpioId, period):
+        """
+        Set the kernel debounce period in microseconds, 0 turns it off.
+        """
+        self._getRequest(gpioId).reconfigure(gpioId, debounce=period)
+
+    def getDebounce(self, gpioId):
+        return self._getRequest(gpioId).getDebounce(gpioId)
+
+    def close(self):
+        self.release()
+
+        for fd in self._chipFds.values():
+            self._io.close(fd)
+
+        self._chipFds.clear()
+
+        if self._idle is not None:
+            for fd in self._idle:
+                self._io.close(fd)
+
+            self._idle = None
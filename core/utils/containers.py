@@ -14,10 +14,94 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import os, logging
+import os, time, logging, threading
+from array import array
 
 from .gpio import BaseGPIO
 from .events import Event
+from .aio import getAsyncEvent
+from .metrics import OP_READ
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class EdgeRing(object):
+    """
+    A fixed capacity ring buffer of (monotonic_ns, value) samples stored in
+    two arrays. When full the oldest sample is overwritten and counted in
+    overflows.
+    """
+    DEFAULT_CAPACITY = 1024
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._capacity = max(1, capacity)
+        self._times = array('q', [0]) * self._capacity
+        self._values = array('b', [0]) * self._capacity
+        self._head = 0
+        self._count = 0
+        self._overflows = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def overflows(self):
+        """
+        The number of samples lost because the buffer was full.
+        """
+        return self._overflows
+
+    def append(self, timestamp, value):
+        with self._lock:
+            head = self._head
+            self._times[head] = timestamp
+            self._values[head] = value
+            head += 1
+            self._head = 0 if head == self._capacity else head
+
+            if self._count == self._capacity:
+                self._overflows += 1
+            else:
+                self._count += 1
+
+    def drain(self):
+        """
+        Remove and return all the samples oldest first as a (timestamps,
+        values) tuple of int64 and int8 NumPy arrays if NumPy is installed
+        else of array.array objects.
+        """
+        with self._lock:
+            head, count = self._head, self._count
+            start = head - count
+
+            if start >= 0:
+                times = self._times[start:head]
+                values = self._values[start:head]
+            else:
+                times = self._times[start:] + self._times[:head]
+                values = self._values[start:] + self._values[:head]
+
+            self._count = 0
+
+        if numpy is not None:
+            times = numpy.frombuffer(times, dtype=numpy.int64)
+            values = numpy.frombuffer(values, dtype=numpy.int8)
+
+        return times, values
+
+    def clear(self):
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            self._overflows = 0
 
 
 class BaseContainer(object):
@@ -32,22 +116,36 @@ class BaseContainer(object):
 class Pin(BaseGPIO, BaseContainer):
 
     __trigger__ = Event.EDGE
+    __eventmask__ = Event.PRI_INPUT|Event.ERROR
 
-    def __init__(self, pin, logger=None, level=logging.INFO):
-        super(Pin, self).__init__(logger=logger, level=level)
+    def __init__(self, pin, logger=None, level=logging.INFO, backend=None):
+        super(Pin, self).__init__(logger=logger, level=level,
+                                  backend=backend)
         self._pin = pin
         self._gpioId = self._getGpioId(pin)
         self._fd = self._open()
         self._direction = ""
         self._edge = ""
+        self._ring = None
+        self._recorder = None
 
     def _open(self):
-        path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(self._gpioId),
-                            self._VALUE)
-        return self._openPin(path)
+        if self._backend is not None:
+            fd = self._backend.open(self._gpioId)
+
+            if fd is not None:
+                self.__eventmask__ = self._backend.EVENTMASK
+                return fd
+
+        return self._openPin(self._attrPath(self._gpioId, self._VALUE))
 
     def close(self):
-        os.close(self._fd)
+        if self._backend is not None:
+            self._backend.closeFd(self._fd)
+        else:
+            os.close(self._fd)
+
+        self._fdCache.close()
         self._fd = None
         self._direction = ""
         self._edge = ""
@@ -59,20 +157,122 @@ class Pin(BaseGPIO, BaseContainer):
     def fileno(self):
         return self._fd
 
+    @property
+    def value(self):
+        if self._metrics is not None:
+            start = time.perf_counter_ns()
+
+            try:
+                return self._readValue()
+            finally:
+                self._metrics.observe(OP_READ, self._gpioId,
+                                      time.perf_counter_ns() - start)
+
+        return self._readValue()
+
+    def _readValue(self):
+        if self._backend is not None:
+            return self._backend.read(self._gpioId)
+
+        return int(os.pread(self._fd, 2, 0)[:1])
+
+    def enableCapture(self, capacity=EdgeRing.DEFAULT_CAPACITY):
+        """
+        Timestamp and store the value of this pin each time an Event it is
+        registered with wakes for it.
+        """
+        self._ring = EdgeRing(capacity)
+
+    def disableCapture(self):
+        self._ring = None
+
+    @property
+    def isCapturing(self):
+        return self._ring is not None
+
+    @property
+    def captureOverflows(self):
+        return self._ring.overflows if self._ring is not None else 0
+
+    def capture(self):
+        """
+        Read the value and store it with time.monotonic_ns(), returns the
+        value.
+        """
+        value = self.value
+        self._ring.append(time.monotonic_ns(), value)
+        return value
+
+    def drain(self):
+        """
+        Remove and return the captured (timestamps, values) arrays.
+        """
+        return self._ring.drain()
+
+    def enableRecording(self, recorder):
+        """
+        Write the value of this pin to an EdgeRecorder each time an Event it
+        is registered with wakes for it.
+        """
+        self._recorder = recorder
+
+    def disableRecording(self):
+        self._recorder = None
+
+    def _onEvent(self, mask):
+        # Backends with their own edge events are drained every time, their
+        # kernel timestamps are captured in place of our own.
+        events = self._backend.readEvents(self._fd) \
+                 if self._backend is not None else None
+
+        if self._ring is None and self._recorder is None:
+            return
+
+        if events is None:
+            events = ((time.monotonic_ns(), self.value),)
+
+        if self._ring is not None:
+            for timestamp, value in events:
+                self._ring.append(timestamp, value)
+
+        if self._recorder is not None:
+            for timestamp, value in events:
+                self._recorder.record(self._gpioId, value, timestamp)
+
     @property
     def direction(self):
         if not self._direction:
-            path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(self._gpioId),
-                                self._DIRECTION)
-            self._direction = self._readPin(path)
+            self._direction = self._backend.getDirection(self._gpioId) \
+                              if self._configures else \
+                              self._readAttr(self._gpioId, self._DIRECTION)
 
         return self._direction
 
     @property
     def edge(self):
         if not self._edge:
-            path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(self._gpioId),
-                                self._EDGE)
-            self._edge = self._readPin(path)
+            self._edge = self._backend.getEdge(self._gpioId) \
+                         if self._configures else \
+                         self._readAttr(self._gpioId, self._EDGE)
 
         return self._edge
+
+    def edges(self, asyncEvent=None):
+        """
+        An asynchronous iterator of the value of this pin after each edge.
+
+        asyncEvent -- The AsyncEvent to use, defaults to the one shared by
+                      the running loop.
+        """
+        asyncEvent = asyncEvent if asyncEvent is not None else \
+                     getAsyncEvent()
+        return asyncEvent.edges(self)
+
+    async def waitFor(self, value, timeout=None, asyncEvent=None):
+        """
+        Wait until this pin has value, raises asyncio.TimeoutError after
+        timeout seconds.
+        """
+        asyncEvent = asyncEvent if asyncEvent is not None else \
+                     getAsyncEvent()
+        return await asyncEvent.waitFor(self, value, timeout=timeout)
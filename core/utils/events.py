@@ -14,7 +14,10 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import select, subprocess
+import time, select, subprocess
+
+from .trace import getTracer, OP_EVENT
+from .metrics import getMetrics, OP_EVENT_WAIT
 
 
 class Event(object):
@@ -31,7 +34,13 @@ class Event(object):
         self.__epoll = None
         self._queue = {}
         self._events = {}
-        self._containers = []
+        self._ready = []
+        self._hooks = {}
+        self._filters = {}
+        self._settling = {}
+        self._maxevents = 1
+        self._tracer = getTracer()
+        self._metrics = getMetrics()
 
     def _getEpoll(self):
         if not self.__epoll:
@@ -45,30 +54,141 @@ class Event(object):
     def close(self):
         self.__epoll is not None and self.__epoll.close()
 
-    def register(self, container, eventmask=INPUT|ERROR, trigger=None,
-                 identifier=None):
+    def register(self, container, eventmask=None, trigger=None,
+                 identifier=None, filter=None):
+        """
+        Register a container, the eventmask and trigger default to the
+        container's __eventmask__ and __trigger__ attributes if it has them
+        else to INPUT|ERROR and LEVEL. If the container has an _onEvent
+        method it is called with the eventmask each time it fires.
+
+        filter -- An optional filter from core.utils.filters, events it
+                  rejects are dropped by eventWait.
+        """
         fd = container.fileno()
+        eventmask = eventmask and eventmask or getattr(
+            container, '__eventmask__', self.INPUT|self.ERROR)
         self._queue[fd] = identifier is not None and identifier or container
         trigger = trigger and trigger or getattr(
             container, '__trigger__', self.LEVEL)
         events = eventmask|(select.EPOLLET*trigger)
         #print "events: {}".format(events)
         self._getEpoll().register(fd, eventmask=events)
+        self._maxevents = max(len(self._queue), 1)
+        hook = getattr(container, '_onEvent', None)
+
+        if hook is not None:
+            self._hooks[fd] = hook
+
+        if filter is not None:
+            self._filters[fd] = (filter, container)
 
     def unregister(self, container):
         fd = container.fileno()
-        self._getEpoll().unregister(fd)
+
+        try:
+            self._getEpoll().unregister(fd)
+        except FileNotFoundError:
+            # The backend released the line under it, the kernel has
+            # already dropped it.
+            pass
+
+        return self.discard(fd)
+
+    def discard(self, fd):
+        """
+        Forget the container registered as fd without touching the epoll,
+        for a container already closed, the kernel dropped it when it
+        closed and the fd may belong to something else by now.
+        """
         self._events.pop(fd, 0)
-        return self._queue.pop(fd, 0)
+        self._hooks.pop(fd, None)
+        self._filters.pop(fd, None)
+        self._settling.pop(fd, None)
+        result = self._queue.pop(fd, 0)
+        self._maxevents = max(len(self._queue), 1)
+        return result
 
     def eventWait(self, timeout=-1):
-        readyEvents = self._getEpoll().poll(timeout, maxevents=len(self._queue))
-        #print "readyEvents: {}".format(readyEvents)
+        """
+        Wait for events and return a list of (container, eventmask) pairs of
+        only the containers that fired during this call, or whose filter
+        settled on an event it held back. If an identifier was given to
+        register it is returned in place of the container. The list is
+        reused, it is only valid until the next call.
+
+        timeout -- The time to wait in seconds, -1 waits forever. The wait
+                   is cut short when a filter deadline comes first.
+        """
+        ready = self._ready
+        events = self._events
+        queue = self._queue
+        hooks = self._hooks
+        filters = self._filters
+        settling = self._settling
+        tracer = self._tracer
+        now = None
+
+        if settling:
+            wait = max(0, min(filters[fd][0].deadline or 0 for fd in settling)
+                       - time.monotonic_ns()) / 1e9
+
+            if timeout < 0 or wait < timeout:
+                timeout = wait
+
+        polled = self._getEpoll().poll(timeout, self._maxevents)
+        start = time.perf_counter_ns() if self._metrics is not None else 0
+        del ready[:]
+        events.clear()
+
+        for fd, mask in polled:
+            # The hook drains the container even if the filter drops it.
+            if fd in hooks:
+                hooks[fd](mask)
+
+            if fd in filters:
+                filter, container = filters[fd]
+
+                if now is None:
+                    now = time.monotonic_ns()
+
+                value = container.value if filter.USES_VALUE else None
+
+                if not filter.accept(now, value):
+                    if filter.deadline is not None:
+                        settling[fd] = mask
+
+                    continue
+
+            events[fd] = mask
+            ready.append((queue[fd], mask))
+
+            if tracer is not None:
+                tracer.record(OP_EVENT, fd, mask)
+
+        if settling:
+            now = time.monotonic_ns()
+
+            for fd in [fd for fd in settling
+                       if (filters[fd][0].deadline or 0) <= now]:
+                mask = settling.pop(fd)
+
+                if filters[fd][0].expire(now) and fd not in events:
+                    events[fd] = mask
+                    ready.append((queue[fd], mask))
+
+                    if tracer is not None:
+                        tracer.record(OP_EVENT, fd, mask)
+
+        if start and polled:
+            # Wake to dispatch, the filters and hooks run for this wake.
+            self._metrics.observe(OP_EVENT_WAIT, self._metrics.NO_PIN,
+                                  time.perf_counter_ns() - start)
+
+        return ready
 
-        if readyEvents:
-            self._events.update(dict(readyEvents))
-            self._containers[:] = [c for fd, c in self._queue.items()
-                                   if fd in self._events]
+    def getFilter(self, container):
+        return self._filters.get(container.fileno(), (None,))[0]
 
     def hasInput(self, container):
         return bool(self._events.get(container.fileno(), 0) & self.INPUT)
@@ -44,3 +44,16 @@ class InvalidEdgeException(BaseGPIOException):
 class InvalidArgumentsException(BaseGPIOException):
     def __init__(self, msg):
         super(InvalidArgumentsException, self).__init__(msg)
+
+
+class TransactionException(BaseGPIOException):
+    def __init__(self, errors):
+        """
+        errors -- A dict of the exceptions raised keyed by gpioId.
+        """
+        msg = ("Pin configuration failed and was rolled back, found: "
+               "{}").format(", ".join("gpio{}: {}".format(gpioId, error)
+                                      for gpioId, error
+                                      in sorted(errors.items())))
+        super(TransactionException, self).__init__(msg)
+        self.errors = errors
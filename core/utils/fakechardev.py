@@ -0,0 +1,247 @@
+#
+# core/utils/fakechardev.py
+#
+
+"""
+An in-process fake of the GPIO character device ioctls used by
+ChardevBackend, for testing without hardware. Line request descriptors are
+real pipes so they can be polled, drive() writes edge event records to them
+as the kernel does.
+
+    fake = FakeChardev()
+    backend = ChardevBackend(chips=fake.paths, io=fake)
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, time, errno
+
+from .chardev import (
+    CHIP_INFO, LINE_REQUEST, LINE_VALUES, LINE_EVENT, LINES_MAX,
+    GPIO_GET_CHIPINFO_IOCTL, GPIO_V2_GET_LINE_IOCTL,
+    GPIO_V2_LINE_SET_CONFIG_IOCTL, GPIO_V2_LINE_GET_VALUES_IOCTL,
+    GPIO_V2_LINE_SET_VALUES_IOCTL, FLAG_INPUT, FLAG_OUTPUT, FLAG_EDGE_RISING,
+    FLAG_EDGE_FALLING, EVENT_RISING_EDGE, EVENT_FALLING_EDGE, unpackConfig)
+
+
+class _FakeRequest(object):
+
+    def __init__(self, chip, offsets, rfd, wfd):
+        self.chip = chip
+        self.offsets = offsets
+        self.rfd = rfd
+        self.wfd = wfd
+        self.seqno = 0
+
+
+class FakeChardev(object):
+    """
+    numChips chips of linesPerChip lines, every line starts as an input at
+    0. Implements the io interface of ChardevBackend, each ioctl is counted
+    in ioctls.
+    """
+
+    def __init__(self, numChips=4, linesPerChip=32):
+        self.paths = tuple('/dev/gpiochip{}'.format(n)
+                           for n in range(numChips))
+        self._linesPerChip = linesPerChip
+        num = numChips * linesPerChip
+        self._values = [0] * num
+        self._flags = [0] * num
+        self._debounce = [0] * num
+        self._lineSeqno = [0] * num
+        self._owners = {}
+        self._chipFds = {}
+        self._requests = {}
+        # Every descriptor of a request, a request holds its lines until the
+        # last one is closed.
+        self._refs = {}
+        self.ioctls = 0
+
+    def _error(self, code):
+        return OSError(code, os.strerror(code))
+
+    def open(self, path):
+        if path not in self.paths:
+            raise self._error(errno.ENOENT)
+
+        fd = os.open(os.devnull, os.O_RDONLY)
+        self._chipFds[fd] = self.paths.index(path)
+        return fd
+
+    def ioctl(self, fd, request, buf):
+        self.ioctls += 1
+
+        if request == GPIO_GET_CHIPINFO_IOCTL and fd in self._chipFds:
+            chip = self._chipFds[fd]
+            CHIP_INFO.pack_into(buf, 0, self.paths[chip][5:].encode(),
+                                b'fake', self._linesPerChip)
+        elif request == GPIO_V2_GET_LINE_IOCTL and fd in self._chipFds:
+            self._getLine(self._chipFds[fd], buf)
+        elif request == GPIO_V2_LINE_SET_CONFIG_IOCTL and \
+                 fd in self._requests:
+            req = self._requests[fd]
+            self._configure(req, bytes(buf))
+        elif request == GPIO_V2_LINE_GET_VALUES_IOCTL and \
+                 fd in self._requests:
+            gpioIds = self._gpioIds(self._requests[fd])
+            bits, mask = LINE_VALUES.unpack(buf)
+            bits = sum(self._values[gpioId] << idx
+                       for idx, gpioId in enumerate(gpioIds)
+                       if mask >> idx & 1)
+            LINE_VALUES.pack_into(buf, 0, bits, mask)
+        elif request == GPIO_V2_LINE_SET_VALUES_IOCTL and \
+                 fd in self._requests:
+            gpioIds = self._gpioIds(self._requests[fd])
+            bits, mask = LINE_VALUES.unpack(buf)
+
+            for idx, gpioId in enumerate(gpioIds):
+                if mask >> idx & 1:
+                    if not self._flags[gpioId] & FLAG_OUTPUT:
+                        raise self._error(errno.EPERM)
+
+                    self._values[gpioId] = bits >> idx & 1
+        else:
+            raise self._error(errno.EINVAL)
+
+    def _gpioIds(self, req):
+        base = req.chip * self._linesPerChip
+        return [base + offset for offset in req.offsets]
+
+    def _getLine(self, chip, buf):
+        fields = LINE_REQUEST.unpack(buf)
+        numLines = fields[LINES_MAX + 2]
+
+        if not 0 < numLines <= LINES_MAX:
+            raise self._error(errno.EINVAL)
+
+        offsets = fields[:numLines]
+        base = chip * self._linesPerChip
+
+        for offset in offsets:
+            if offset >= self._linesPerChip:
+                raise self._error(errno.EINVAL)
+
+            if base + offset in self._owners:
+                raise self._error(errno.EBUSY)
+
+        rfd, wfd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        req = _FakeRequest(chip, offsets, rfd, wfd)
+
+        try:
+            self._configure(req, fields[LINES_MAX + 1])
+        except OSError:
+            os.close(rfd)
+            os.close(wfd)
+            raise
+
+        for gpioId in self._gpioIds(req):
+            self._owners[gpioId] = req
+
+        self._requests[rfd] = req
+        self._refs[rfd] = req
+        LINE_REQUEST.pack_into(buf, 0, *(fields[:-1] + (rfd,)))
+
+    def _configure(self, req, config):
+        gpioIds = self._gpioIds(req)
+        flags, debounce, values = unpackConfig(config, len(gpioIds))
+
+        for lineFlags in flags:
+            direction = lineFlags & (FLAG_INPUT | FLAG_OUTPUT)
+            edges = lineFlags & (FLAG_EDGE_RISING | FLAG_EDGE_FALLING)
+
+            if direction == FLAG_INPUT | FLAG_OUTPUT or \
+                   edges and direction != FLAG_INPUT:
+                raise self._error(errno.EINVAL)
+
+        for idx, gpioId in enumerate(gpioIds):
+            self._flags[gpioId] = flags[idx]
+            self._debounce[gpioId] = debounce[idx]
+
+            if flags[idx] & FLAG_OUTPUT:
+                self._values[gpioId] = values[idx]
+
+    def read(self, fd, size):
+        return os.read(fd, size)
+
+    def dup(self, fd):
+        newFd = os.dup(fd)
+
+        if fd in self._refs:
+            self._refs[newFd] = self._refs[fd]
+
+        return newFd
+
+    def dup2(self, fd, fd2):
+        self._drop(fd2)
+        os.dup2(fd, fd2, inheritable=False)
+
+        if fd in self._refs:
+            self._refs[fd2] = self._refs[fd]
+
+    def pipe(self):
+        return os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    def _drop(self, fd):
+        req = self._refs.pop(fd, None)
+
+        if req is not None and req not in self._refs.values():
+            for gpioId in self._gpioIds(req):
+                self._owners.pop(gpioId, None)
+                self._flags[gpioId] = 0
+                self._debounce[gpioId] = 0
+
+            os.close(req.wfd)
+
+    def close(self, fd):
+        self._requests.pop(fd, None)
+        self._drop(fd)
+        self._chipFds.pop(fd, None)
+        os.close(fd)
+
+    def drive(self, gpioId, value, timestamp=None):
+        """
+        Set an input line as an external signal does, an edge event is
+        queued if the line is requested with that edge. Returns True if an
+        event was queued.
+        """
+        value = 1 if value else 0
+
+        if self._values[gpioId] == value:
+            return False
+
+        self._values[gpioId] = value
+        flags = self._flags[gpioId]
+        req = self._owners.get(gpioId)
+
+        if req is None or not flags & (FLAG_EDGE_RISING if value
+                                       else FLAG_EDGE_FALLING):
+            return False
+
+        req.seqno += 1
+        self._lineSeqno[gpioId] += 1
+        os.write(req.wfd, LINE_EVENT.pack(
+            timestamp if timestamp is not None else time.monotonic_ns(),
+            EVENT_RISING_EDGE if value else EVENT_FALLING_EDGE,
+            gpioId % self._linesPerChip, req.seqno, self._lineSeqno[gpioId]))
+        return True
+
+    def value(self, gpioId):
+        return self._values[gpioId]
+
+    def lineFlags(self, gpioId):
+        return self._flags[gpioId]
+
+    def lineDebounce(self, gpioId):
+        return self._debounce[gpioId]
+
+    def isRequested(self, gpioId):
+        return gpioId in self._owners
@@ -0,0 +1,139 @@
+#
+# core/utils/fakesysfs.py
+#
+
+"""
+A fake /sys/class/gpio tree made of regular files and a pollable pipe
+container, used by the tests and the benchmarks so they can run on any Linux
+box.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, shutil, tempfile
+
+from .basegpio import BaseGPIO
+
+
+class FakeSysfs(object):
+    """
+    Creates a temporary directory, on tmpfs when available, that looks like
+    /sys/class/gpio and points BaseGPIO._GPIO_PATH at it while used as a
+    context manager.
+
+    pins -- The gpioIds to create as already exported.
+    """
+    _TMPFS = '/dev/shm'
+    _DEFAULTS = ((BaseGPIO._ACTIVE_LOW, '0'), (BaseGPIO._DIRECTION, 'in'),
+                 (BaseGPIO._EDGE, 'none'), (BaseGPIO._UEVENT, ''),
+                 (BaseGPIO._VALUE, '0'))
+
+    def __init__(self, pins=(), root=None):
+        if root is None and os.path.isdir(self._TMPFS):
+            root = self._TMPFS
+
+        self.path = tempfile.mkdtemp(prefix='fake-gpio-', dir=root)
+        self._oldPath = None
+
+        for name in ('export', 'unexport'):
+            self._writeFile(os.path.join(self.path, name), '')
+
+        for gpioId in pins:
+            self.exportPin(gpioId)
+
+    def _writeFile(self, path, value):
+        with open(path, 'w') as f:
+            f.write('{}\n'.format(value) if value != '' else '')
+
+    def pinPath(self, gpioId, attr=''):
+        return os.path.join(self.path, 'gpio{}'.format(gpioId), attr)
+
+    def exportPin(self, gpioId):
+        """
+        Emulate the kernel creating the gpioN directory on export.
+        """
+        path = self.pinPath(gpioId)
+
+        if not os.path.isdir(path):
+            os.mkdir(path)
+
+            for attr, value in self._DEFAULTS:
+                self._writeFile(os.path.join(path, attr), value)
+
+    def unexportPin(self, gpioId):
+        shutil.rmtree(self.pinPath(gpioId), ignore_errors=True)
+
+    def read(self, gpioId, attr):
+        with open(self.pinPath(gpioId, attr)) as f:
+            return f.readline().strip()
+
+    def write(self, gpioId, attr, value):
+        self._writeFile(self.pinPath(gpioId, attr), value)
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        self._oldPath = BaseGPIO._GPIO_PATH
+        BaseGPIO._GPIO_PATH = self.path
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        BaseGPIO._GPIO_PATH = self._oldPath
+        self.remove()
+
+
+class PipeContainer(object):
+    """
+    A container with a pollable file descriptor that can be registered with
+    an Event, fire() makes it readable and drain() clears it. Reading value
+    drains it and returns the last byte fired as an int.
+    """
+
+    def __init__(self):
+        self._rfd, self._wfd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self._value = 0
+
+    def fileno(self):
+        return self._rfd
+
+    def fire(self, data=b'1'):
+        os.write(self._wfd, data)
+
+    def drain(self):
+        try:
+            return os.read(self._rfd, 4096)
+        except BlockingIOError:
+            return b''
+
+    @property
+    def value(self):
+        data = self.drain()
+
+        if data:
+            self._value = int(data[-1:])
+
+        return self._value
+
+    @property
+    def isClosed(self):
+        return self._rfd is None
+
+    def close(self):
+        os.close(self._rfd)
+        os.close(self._wfd)
+        self._rfd = self._wfd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,196 @@
+#
+# core/utils/filters.py
+#
+
+"""
+Debounce and glitch filters that can be attached to a container when it is
+registered with an Event. Events the filter rejects are dropped by
+Event.eventWait before they reach the caller, a filter with a deadline is
+checked again by eventWait when it passes and may then report the event it
+held back. All times are in nanoseconds from time.monotonic_ns().
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from .exceptions import InvalidArgumentsException
+
+
+class BaseFilter(object):
+    """
+    Subclasses implement _accept. If USES_VALUE is True the Event reads the
+    container's value property and passes it in, else value is None.
+    """
+    USES_VALUE = False
+
+    def __init__(self):
+        self._accepted = 0
+        self._suppressed = 0
+
+    @property
+    def accepted(self):
+        return self._accepted
+
+    @property
+    def suppressed(self):
+        """
+        The number of events dropped by this filter.
+        """
+        return self._suppressed
+
+    def accept(self, timestamp, value=None):
+        if self._accept(timestamp, value):
+            self._accepted += 1
+            return True
+
+        self._suppressed += 1
+        return False
+
+    def _accept(self, timestamp, value):
+        raise NotImplementedError()
+
+    @property
+    def deadline(self):
+        """
+        When expire must be called even if no other event comes, None if
+        the filter is not holding an event back.
+        """
+        return None
+
+    def expire(self, timestamp):
+        """
+        Called at or after the deadline, returns True to report the event
+        held back.
+        """
+        return False
+
+    def reset(self):
+        self._accepted = 0
+        self._suppressed = 0
+
+
+class FixedWindowFilter(BaseFilter):
+    """
+    Accepts an event then drops every event for the next window
+    nanoseconds.
+    """
+
+    def __init__(self, window):
+        super(FixedWindowFilter, self).__init__()
+        self._window = window
+        self._until = None
+
+    def _accept(self, timestamp, value):
+        if self._until is not None and timestamp < self._until:
+            return False
+
+        self._until = timestamp + self._window
+        return True
+
+    def reset(self):
+        super(FixedWindowFilter, self).reset()
+        self._until = None
+
+
+class SettleTimeFilter(BaseFilter):
+    """
+    Reports a value only once the line has been stable for settle
+    nanoseconds. Every event restarts the settle time, when it passes the
+    event is reported if the value the line settled on differs from the
+    last value reported, so a glitch that returns the line to where it was
+    is never reported.
+
+    initial -- The value the line is assumed to start at, None reports the
+               first value the line settles on whatever it is.
+    """
+    USES_VALUE = True
+
+    def __init__(self, settle, initial=None):
+        super(SettleTimeFilter, self).__init__()
+        self._settle = settle
+        self._initial = initial
+        self.reset()
+
+    def accept(self, timestamp, value=None):
+        # Nothing is reported as it happens, only when expire is called.
+        self._candidate = value
+        self._since = timestamp
+        self._pending += 1
+        return False
+
+    @property
+    def deadline(self):
+        return self._since + self._settle if self._since is not None \
+               else None
+
+    def expire(self, timestamp):
+        if self._since is None or timestamp < self._since + self._settle:
+            return False
+
+        pending, self._pending = self._pending, 0
+        self._since = None
+
+        if self._candidate == self._value:
+            self._suppressed += pending
+            return False
+
+        self._value = self._candidate
+        self._accepted += 1
+        self._suppressed += pending - 1
+        return True
+
+    def reset(self):
+        super(SettleTimeFilter, self).reset()
+        self._value = self._initial
+        self._candidate = None
+        self._since = None
+        self._pending = 0
+
+
+class MajorityVoteFilter(BaseFilter):
+    """
+    Keeps the values of the last samples events and accepts an event when
+    the majority value of those samples changes.
+
+    samples -- An odd number of samples.
+    initial -- The value the pin is assumed to start at.
+    """
+    USES_VALUE = True
+
+    def __init__(self, samples=5, initial=0):
+        super(MajorityVoteFilter, self).__init__()
+
+        if samples < 1 or not samples & 1:
+            raise InvalidArgumentsException(
+                "Invalid number of samples {}, must be odd.".format(samples))
+
+        self._samples = samples
+        self._initial = initial
+        self.reset()
+
+    def _accept(self, timestamp, value):
+        history = self._history
+        self._ones += value - history[self._idx]
+        history[self._idx] = value
+        self._idx = (self._idx + 1) % self._samples
+        majority = int(self._ones > self._samples // 2)
+
+        if majority == self._value:
+            return False
+
+        self._value = majority
+        return True
+
+    def reset(self):
+        super(MajorityVoteFilter, self).reset()
+        self._history = [self._initial] * self._samples
+        self._ones = self._initial * self._samples
+        self._idx = 0
+        self._value = self._initial
@@ -14,12 +14,45 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import os, logging
+import time, logging, threading
 
 from .exceptions import (
     InvalidPinNomenclatureException, InvalidDirectionException,
     InvalidEdgeException, InvalidArgumentsException)
-from .basegpio import BaseGPIO
+from .basegpio import BaseGPIO, FDCache
+from .metrics import timed, OP_SET_MODE, OP_WRITE, OP_READ
+from .transaction import Transaction
+
+
+class ShadowState(object):
+    """
+    The last known direction, edge, active_low and output value of each
+    pin, as this process wrote or read them.
+    """
+
+    def __init__(self):
+        self._state = {}
+
+    def get(self, gpioId, attr):
+        try:
+            return self._state[gpioId][attr]
+        except KeyError:
+            return None
+
+    def set(self, gpioId, attr, value):
+        try:
+            self._state[gpioId][attr] = value
+        except KeyError:
+            self._state[gpioId] = {attr: value}
+
+    def discard(self, gpioId, attr):
+        self._state.get(gpioId, {}).pop(attr, None)
+
+    def invalidate(self, gpioId=None):
+        if gpioId is None:
+            self._state.clear()
+        else:
+            self._state.pop(gpioId, None)
 
 
 class GPIO(BaseGPIO):
@@ -31,8 +64,49 @@ class GPIO(BaseGPIO):
     HIGH = 1
     LOW = 0
 
-    def __init__(self, logger=None, level=logging.INFO):
-        super(GPIO, self).__init__(logger=logger, level=level)
+    __BACKEND_SETTERS = {BaseGPIO._DIRECTION: 'setDirection',
+                         BaseGPIO._EDGE: 'setEdge',
+                         BaseGPIO._ACTIVE_LOW: 'setActiveLow'}
+    __BACKEND_GETTERS = {BaseGPIO._DIRECTION: 'getDirection',
+                         BaseGPIO._EDGE: 'getEdge',
+                         BaseGPIO._ACTIVE_LOW: 'getActiveLow'}
+
+    def __init__(self, logger=None, level=logging.INFO,
+                 cacheSize=FDCache.DEFAULT_SIZE, backend=None, shadow=False,
+                 coalesce=0, stateFile=None):
+        """
+        cacheSize -- The maximum number of sysfs files kept open.
+        backend   -- An optional backend for pin values, ex. MMapBackend.
+        shadow    -- Keep the last known direction, edge, active_low and
+                     output value of each pin. Writes of the value a pin
+                     already has are skipped and reads of them answered
+                     from memory, call invalidate() if another process
+                     changes a pin.
+        coalesce  -- A tick in seconds, implies shadow. An output set again
+                     within a tick of its last write is written when the
+                     tick ends, with the latest value set.
+        stateFile -- A file the pins exported by this process are kept in.
+                     Pins left in it by a process that died are cleaned up
+                     with ours.
+        """
+        super(GPIO, self).__init__(logger=logger, level=level,
+                                   cacheSize=cacheSize, backend=backend)
+
+        if stateFile is not None:
+            self._registry.setStateFile(stateFile)
+        self._shadow = ShadowState() if shadow or coalesce else None
+        self._tick = coalesce
+        self._pending = {}
+        self._lastWrite = {}
+        self._flusher = None
+        self._flushCond = threading.Condition()
+
+    def _instrument(self, metrics):
+        super(GPIO, self)._instrument(metrics)
+        resolve = self._getGpioId
+        self.setMode = timed(self.setMode, metrics, OP_SET_MODE, resolve)
+        self.setValue = timed(self.setValue, metrics, OP_WRITE, resolve)
+        self.getValue = timed(self.getValue, metrics, OP_READ, resolve)
 
     def setMode(self, pin, direction=None, edge=None):
         """
@@ -48,83 +122,354 @@ class GPIO(BaseGPIO):
         edge      -- Sets the pin trigger edge to GPIO.RISING, GPIO.FALLING, or
                      GPIO.BOTH.
         """
-        self._log.debug("pin: %s, direction: %s, edge: %s",
-                        pin, direction, edge)
+        if self._debug:
+            self._log.debug("pin: %s, direction: %s, edge: %s",
+                            pin, direction, edge)
+
         gpioId = self._getGpioId(pin)
+
+        if self._configures:
+            if direction and direction not in (self.IN, self.OUT):
+                raise InvalidDirectionException(pin)
+
+            if edge and edge not in (self.RISING, self.FALLING, self.BOTH):
+                raise InvalidEdgeException(pin)
+
+            if self._shadow is not None:
+                self._shadow.invalidate(gpioId)
+
+            return self._backend.setMode(gpioId, direction=direction,
+                                         edge=edge)
+
         result = self._export(gpioId)
+
+        if result and self._shadow is not None:
+            # A newly exported pin has none of the state we knew of.
+            self._shadow.invalidate(gpioId)
+
         # Need to wait even if no direction or edge as they can be set
-        # immediately after this call. TO-DO Find a better way to do this.
-        self._waitForFile(timeout=0.35)
+        # immediately after this call.
+        self._waitForExport((gpioId,))
 
         if direction:
             if direction not in (self.IN, self.OUT):
                 raise InvalidDirectionException(pin)
 
-            path = os.path.join(
-                self._GPIO_PATH, 'gpio{}'.format(gpioId), self._DIRECTION)
-            self._writePin(path, direction)
+            self._setDirection(gpioId, direction)
             result = True
 
         if edge:
             if edge not in (self.RISING, self.FALLING, self.BOTH):
                 raise InvalidEdgeException(pin)
 
-            path = os.path.join(
-                self._GPIO_PATH, 'gpio{}'.format(gpioId), self._EDGE)
-            self._writePin(path, edge)
+            self._setState(gpioId, self._EDGE, edge)
             result = True
 
         return result
 
-    def cleanup(self, pin=None):
-        result = False
+    def transaction(self, workers=Transaction.DEFAULT_WORKERS):
+        """
+        Return a Transaction that stages the modes of many pins and applies
+        them together with this object.
+        """
+        return Transaction(self, workers)
+
+    def cleanup(self, pin=None, force=False):
+        """
+        Unexport pin, or if None every pin this process exported, returns
+        True if any pin was unexported.
+
+        force -- With no pin, unexport every exported pin including those
+                 of other processes.
+        """
+        gpioId = self._getGpioId(pin) if pin is not None else None
+
+        if self._shadow is not None:
+            self._dropState(gpioId)
+
+        if self._configures:
+            return self._backend.release(gpioId)
 
         if pin is not None:
-            gpioId = self._getGpioId(pin)
-            result = self._unexport(gpioId)
-        elif any([self._unexport(gpioId) for gpioId in self._findActivePins()]):
-            result = True
+            return self._unexport(gpioId)
 
-        return result
+        return self._unexportAll(self._findActivePins() if force
+                                 else self._registry.pins())
+
+    def _setState(self, gpioId, attr, value):
+        """
+        Write a direction, edge or active_low unless the shadow state says
+        the pin already has it. Returns True if it was written.
+        """
+        shadow = self._shadow
+
+        if shadow is not None and shadow.get(gpioId, attr) == value:
+            return False
+
+        if self._configures:
+            getattr(self._backend, self.__BACKEND_SETTERS[attr])(gpioId,
+                                                                 value)
+        else:
+            self._writeAttr(gpioId, attr, value)
+
+        if shadow is not None:
+            shadow.set(gpioId, attr, value)
+
+        return True
+
+    def _getState(self, gpioId, attr):
+        shadow = self._shadow
+
+        if shadow is not None:
+            value = shadow.get(gpioId, attr)
+
+            if value is not None:
+                return value
+
+        if self._configures:
+            value = getattr(self._backend, self.__BACKEND_GETTERS[attr])(
+                gpioId)
+        else:
+            value = self._readAttr(gpioId, attr)
+
+        if attr == self._ACTIVE_LOW:
+            value = int(value)
+
+        if shadow is not None:
+            shadow.set(gpioId, attr, value)
+
+        return value
+
+    def _setDirection(self, gpioId, direction):
+        if self._setState(gpioId, self._DIRECTION, direction) and \
+               self._shadow is not None:
+            # Changing the direction changes the value, high and low are
+            # outputs with that value.
+            self._shadow.discard(gpioId, self._VALUE)
+
+            if direction in ('high', 'low'):
+                self._shadow.set(gpioId, self._DIRECTION, self.OUT)
+                self._shadow.set(gpioId, self._VALUE,
+                                 int(direction == 'high'))
 
     def setDirection(self, pin, direction):
-        gpioId = self._getGpioId(pin)
-        path = os.path.join(
-            self._GPIO_PATH, 'gpio{}'.format(gpioId), self._DIRECTION)
-        self._writePin(path, direction)
+        self._setDirection(self._getGpioId(pin), direction)
 
     def getDirection(self, pin):
-        gpioId = self._getGpioId(pin)
-        path = os.path.join(
-            self._GPIO_PATH, 'gpio{}'.format(gpioId), self._DIRECTION)
-        return self._readPin(path)
+        return self._getState(self._getGpioId(pin), self._DIRECTION)
 
     def setEdge(self, pin, edge):
-        gpioId = self._getGpioId(pin)
-        path = os.path.join(
-            self._GPIO_PATH, 'gpio{}'.format(gpioId), self._EDGE)
-        self._writePin(path, edge)
+        self._setState(self._getGpioId(pin), self._EDGE, edge)
 
     def getEdge(self, pin):
+        return self._getState(self._getGpioId(pin), self._EDGE)
+
+    def setActiveLow(self, pin, activeLow):
+        """
+        Invert the value of pin when activeLow is True.
+        """
         gpioId = self._getGpioId(pin)
-        path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(gpioId),
-                            self._EDGE)
-        return self._readPin(path)
+        self._setState(gpioId, self._ACTIVE_LOW, 1 if activeLow else 0)
+
+        if self._shadow is not None:
+            # The logical value inverted with active_low.
+            with self._flushCond:
+                self._shadow.discard(gpioId, self._VALUE)
+
+    def getActiveLow(self, pin):
+        return bool(self._getState(self._getGpioId(pin), self._ACTIVE_LOW))
 
     def setValue(self, pin, value):
         gpioId = self._getGpioId(pin)
-        path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(gpioId),
-                            self._VALUE)
-        self._writePin(path, value)
+        shadow = self._shadow
+
+        if shadow is not None:
+            value = 1 if int(value) else 0
+
+            if self._tick:
+                self._coalesce(gpioId, value)
+                return
+
+            if shadow.get(gpioId, self._VALUE) == value:
+                return
+
+        self._putValue(gpioId, value)
+
+        if shadow is not None:
+            shadow.set(gpioId, self._VALUE, value)
+
+    def _putValue(self, gpioId, value):
+        if self._backend is not None:
+            self._backend.write(gpioId, value)
+        else:
+            self._writeAttr(gpioId, self._VALUE, value)
 
     def getValue(self, pin):
         gpioId = self._getGpioId(pin)
-        path = os.path.join(self._GPIO_PATH, 'gpio{}'.format(gpioId),
-                            self._VALUE)
-        return int(self._readPin(path))
+        shadow = self._shadow
+        output = False
+
+        if shadow is not None and \
+               shadow.get(gpioId, self._DIRECTION) == self.OUT:
+            # Only this process changes the value of an output.
+            value = self._pending.get(gpioId)
+
+            if value is None:
+                value = shadow.get(gpioId, self._VALUE)
+
+            if value is not None:
+                return value
+
+            output = True
+
+        if self._backend is not None:
+            value = self._backend.read(gpioId)
+        else:
+            value = int(self._readAttr(gpioId, self._VALUE))
+
+        if output:
+            shadow.set(gpioId, self._VALUE, value)
+
+        return value
+
+    def _coalesce(self, gpioId, value):
+        with self._flushCond:
+            if gpioId in self._pending:
+                self._pending[gpioId] = value
+                return
+
+            now = time.monotonic()
+
+            if now - self._lastWrite.get(gpioId, -self._tick) >= self._tick:
+                self._writeValue(gpioId, value, now)
+            else:
+                self._pending[gpioId] = value
+
+                if self._flusher is None:
+                    self._flusher = threading.Thread(
+                        target=self._runFlusher, name='GPIOFlusher')
+                    self._flusher.daemon = True
+                    self._flusher.start()
+                else:
+                    self._flushCond.notify()
+
+    def _writeValue(self, gpioId, value, now, put=None):
+        if self._shadow.get(gpioId, self._VALUE) != value:
+            (put or self._putValue)(gpioId, value)
+            self._shadow.set(gpioId, self._VALUE, value)
+            self._lastWrite[gpioId] = now
+
+    def _flushValue(self, gpioId, value):
+        # The FDCache is not thread safe, the flusher uses its own fds.
+        if self._backend is not None:
+            self._backend.write(gpioId, value)
+        else:
+            self._writePin(self._attrPath(gpioId, self._VALUE),
+                           '{}\n'.format(value))
+
+    def _runFlusher(self):
+        cond = self._flushCond
+        pending = self._pending
+        thread = threading.current_thread()
+
+        with cond:
+            while self._flusher is thread:
+                if not pending:
+                    cond.wait()
+                    continue
+
+                now = time.monotonic()
+                tick = self._tick
+                lastWrite = self._lastWrite
+
+                for gpioId in [gpioId for gpioId in pending
+                               if now - lastWrite.get(gpioId, -tick) >= tick]:
+                    value = pending.pop(gpioId)
+
+                    try:
+                        self._writeValue(gpioId, value, now,
+                                         self._flushValue)
+                    except OSError as e:
+                        self._log.error("Coalesced write of %s to gpio%s "
+                                        "failed, %s", value, gpioId, e)
+
+                if pending:
+                    cond.wait(max(0.0, min(
+                        lastWrite.get(gpioId, now) for gpioId in pending) +
+                                  tick - now))
+
+    def flush(self):
+        """
+        Write the values still waiting for their coalescing tick now.
+        """
+        with self._flushCond:
+            now = time.monotonic()
+
+            while self._pending:
+                gpioId, value = self._pending.popitem()
+                self._writeValue(gpioId, value, now)
+
+    def invalidate(self, pin=None):
+        """
+        Forget the shadow state of pin, or of every pin if None, after it
+        was changed outside this object.
+        """
+        if self._shadow is not None:
+            self._shadow.invalidate(
+                self._getGpioId(pin) if pin is not None else None)
+
+    def _dropState(self, gpioId=None):
+        # The pins are going away, their pending values with them.
+        with self._flushCond:
+            if gpioId is None:
+                self._pending.clear()
+                self._lastWrite.clear()
+                flusher, self._flusher = self._flusher, None
+                self._flushCond.notify()
+            else:
+                self._pending.pop(gpioId, None)
+                self._lastWrite.pop(gpioId, None)
+                flusher = None
+
+            self._shadow.invalidate(gpioId)
+
+        if flusher is not None:
+            flusher.join()
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.cleanup()
+
+
+def setupMultiplePins(pinHeader, startPin, pinRange=8, direction=GPIO.OUT,
+                      gpio=None):
+    """
+    Sets up a range of pins to a specified direction. (GPIO.IN or GPIO.OUT)
+    Returns the list of pin names in header order.
+
+    gpio -- An optional GPIO object to configure the pins with.
+    """
+    validHeaders = (8, 9)
+    validDir = (GPIO.IN, GPIO.OUT)
+
+    if pinHeader not in validHeaders:
+        raise TypeError("Invalid header number {} must be one of {}.".format(
+            pinHeader, validHeaders))
+
+    if direction not in validDir:
+        raise TypeError("Invalid pin direction {} must be one of {}.".format(
+            direction, validDir))
+
+    if gpio is None:
+        gpio = GPIO()
+
+    pins = ["P{}_{}".format(pinHeader, startPin + idx)
+            for idx in range(pinRange)]
+
+    with gpio.transaction() as txn:
+        for pin in pins:
+            txn.stage(pin, direction=direction)
+
+    return pins
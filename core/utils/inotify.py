@@ -0,0 +1,189 @@
+#
+# core/utils/inotify.py
+#
+
+"""
+A minimal ctypes wrapper around the Linux inotify API and a function that
+waits for files to become accessible, used to detect when udev has finished
+with a newly exported pin.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, time, select, struct
+import ctypes, ctypes.util
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                        use_errno=True)
+    _libc.inotify_init1
+except (OSError, AttributeError):
+    _libc = None
+
+
+def isAvailable():
+    return _libc is not None
+
+
+class Inotify(object):
+    """
+    An inotify instance, the file descriptor is non-blocking and can be
+    registered with poll, epoll or an event loop.
+    """
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        if _libc is None:
+            raise OSError("inotify is not available.")
+
+        self._fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        if self._fd < 0:
+            self._raise()
+
+    def _raise(self, path=None):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+    def fileno(self):
+        return self._fd
+
+    def addWatch(self, path, mask):
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+
+        if wd < 0:
+            self._raise(path)
+
+        return wd
+
+    def read(self):
+        """
+        Read all the pending events, returns a list of
+        (wd, mask, cookie, name) tuples.
+        """
+        events = []
+
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return events
+
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, cookie, size = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + size].rstrip(b'\0')
+            offset += size
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+
+        return events
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def waitForAccess(paths, timeout, mode=os.W_OK, useInotify=True,
+                  interval=0.005):
+    """
+    Wait until every path is accessible with mode or timeout seconds have
+    passed. The directories holding the paths are watched with inotify for
+    attribute and create events, if inotify is not available the paths are
+    polled every interval seconds. Returns the list of paths that are still
+    not accessible.
+
+    paths      -- An iterable of file paths.
+    timeout    -- The maximum time to wait in seconds.
+    mode       -- The access mode passed to os.access.
+    useInotify -- Set to False to force polling.
+    interval   -- The polling interval in seconds.
+    """
+    pending = [path for path in paths if not os.access(path, mode)]
+
+    if not pending:
+        return pending
+
+    deadline = time.monotonic() + timeout
+    notify = None
+
+    if useInotify and isAvailable():
+        try:
+            notify = Inotify()
+        except OSError:
+            notify = None
+
+    try:
+        poller = None
+        watched = set()
+
+        if notify is not None:
+            poller = select.poll()
+            poller.register(notify, select.POLLIN)
+
+        while True:
+            if notify is not None:
+                _addWatches(notify, pending, watched)
+
+            pending = [path for path in pending if not os.access(path, mode)]
+            remaining = deadline - time.monotonic()
+
+            if not pending or remaining <= 0:
+                break
+
+            if notify is not None:
+                # Wake at least every interval * 10 in case a change was
+                # not reported, some sysfs attributes never are.
+                wait = min(remaining, interval * 10)
+
+                if poller.poll(wait * 1000):
+                    notify.read()
+            else:
+                time.sleep(min(remaining, interval))
+    finally:
+        if notify is not None:
+            notify.close()
+
+    return pending
+
+
+def _addWatches(notify, paths, watched):
+    mask = IN_ATTRIB | IN_CREATE | IN_MOVED_TO
+
+    for path in paths:
+        directory = os.path.dirname(path)
+
+        # Watch the nearest existing parent so the creation of missing
+        # directories is seen as well.
+        while directory and directory not in watched:
+            try:
+                notify.addWatch(directory, mask)
+            except OSError:
+                parent = os.path.dirname(directory)
+
+                if parent == directory:
+                    break
+
+                directory = parent
+            else:
+                watched.add(directory)
+                break
@@ -17,46 +17,293 @@ SOFTWARE.
 """
 
 import os
+import copy
+import time
 import logging
+import threading
+import logging.handlers
+from collections import deque
+
+from .exceptions import InvalidArgumentsException
 
 
 def getBasePath():
     return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Appends records to a collections.deque without ever blocking or waking
+    another thread, records that do not fit in its maxlen are discarded and
+    counted in dropped. The message is merged with its args by the caller,
+    so args changed later cannot change the record, all other formatting is
+    left to the writer thread. No lock is taken, deque appends are atomic.
+    """
+    _excFormatter = logging.Formatter()
+
+    def __init__(self, queue, writer=None):
+        super(DroppingQueueHandler, self).__init__(queue)
+        self.writer = writer
+        self.dropped = 0
+
+    def handle(self, record):
+        result = self.filter(record)
+
+        if result:
+            self.emit(result if isinstance(result, logging.LogRecord)
+                      else record)
+
+        return result
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            # The traceback keeps frames alive, render it now.
+            record.exc_text = self._excFormatter.formatException(
+                record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record):
+        records = self.queue
+
+        if records.maxlen is None or len(records) < records.maxlen:
+            records.append(record)
+        else:
+            self.dropped += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.stop()
+
+        super(DroppingQueueHandler, self).close()
+
+
+class BatchFileWriter(threading.Thread):
+    """
+    Takes records off a deque, formats them and writes them to a file in
+    batches. The deque is polled every pollInterval seconds, so logging
+    never wakes this thread. A batch is written and flushed when it reaches
+    batchSize records or flushBytes, or flushInterval seconds after the
+    last write, whichever comes first.
+
+    handler     -- The DroppingQueueHandler feeding the queue, its drops
+                   are reported in the file.
+    maxBytes    -- Rotate the file when a write would grow it past this
+                   size, 0 never rotates.
+    backupCount -- The number of rotated files kept as path.1 - path.N.
+    """
+    # Records formatted between giving up the GIL, a thread logging waits
+    # at most this many formats for it.
+    _YIELD_EVERY = 16
+
+    def __init__(self, path, queue, formatter, handler=None, maxBytes=0,
+                 backupCount=3, batchSize=256, flushBytes=65536,
+                 flushInterval=0.5, pollInterval=0.02):
+        super(BatchFileWriter, self).__init__(name='BatchFileWriter')
+        self.daemon = True
+        self._path = path
+        self._queue = queue
+        self._formatter = formatter
+        self._maxBytes = maxBytes
+        self._backupCount = backupCount
+        self._batchSize = batchSize
+        self._flushBytes = flushBytes
+        self._flushInterval = flushInterval
+        self._pollInterval = pollInterval
+        self._stopped = threading.Event()
+        self._handler = handler
+        self._reported = 0
+        self._file = open(path, 'a')
+        self._size = self._file.tell()
+        self.writes = 0
+        self.rotations = 0
+
+    def _format(self, record):
+        try:
+            return self._formatter.format(record) + '\n'
+        except Exception:
+            return "Unformattable log record: {!r}\n".format(record.msg)
+
+    def run(self):
+        popleft = self._queue.popleft
+        stopped = self._stopped
+        yieldEvery = self._YIELD_EVERY
+        lines = []
+        size = 0
+        last = time.monotonic()
+        running = True
+
+        while running:
+            # Everything queued is written once stop() is called.
+            running = not stopped.wait(self._pollInterval)
+            count = 0
+
+            while True:
+                try:
+                    record = popleft()
+                except IndexError:
+                    break
+
+                line = self._format(record)
+                lines.append(line)
+                size += len(line)
+                count += 1
+
+                if count % yieldEvery == 0:
+                    # Let a thread that is logging have the GIL.
+                    time.sleep(0)
+
+                if len(lines) >= self._batchSize or size >= self._flushBytes:
+                    self._write(lines)
+                    lines = []
+                    size = 0
+                    last = time.monotonic()
+
+            if lines and (not running or
+                          time.monotonic() - last >= self._flushInterval):
+                self._write(lines)
+                lines = []
+                size = 0
+                last = time.monotonic()
+
+        self._file.close()
+
+    def _write(self, lines):
+        dropped = self._handler.dropped if self._handler is not None else 0
+
+        if dropped != self._reported:
+            lines.append("{} WARNING {} log records dropped, the queue was "
+                         "full.\n".format(time.strftime('%Y-%m-%d %H:%M:%S'),
+                                          dropped - self._reported))
+            self._reported = dropped
+
+        if self._maxBytes:
+            # Split the batch where the file needs rotating.
+            start = 0
+            size = self._size
+
+            for idx, line in enumerate(lines):
+                if size and size + len(line) > self._maxBytes:
+                    self._writeData(''.join(lines[start:idx]))
+                    self._rotate()
+                    start = idx
+                    size = 0
+
+                size += len(line)
+
+            lines = lines[start:]
+
+        self._writeData(''.join(lines))
+
+    def _writeData(self, data):
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self.writes += 1
+
+    def _rotate(self):
+        self._file.close()
+
+        if self._backupCount > 0:
+            for idx in range(self._backupCount - 1, 0, -1):
+                src = "{}.{}".format(self._path, idx)
+
+                if os.path.exists(src):
+                    os.replace(src, "{}.{}".format(self._path, idx + 1))
+
+            os.replace(self._path, self._path + '.1')
+
+        self._file = open(self._path, 'w')
+        self._size = 0
+        self.rotations += 1
+
+    def stop(self):
+        """
+        Write what is queued and stop the thread.
+        """
+        if self.is_alive():
+            self._stopped.set()
+            self.join()
+
+
 class ConfigLogger(object):
     """
     Setup some basic logging.
     """
     _DEFAULT_FORMAT = ("%(asctime)s %(levelname)s %(module)s %(funcName)s "
                        "[line:%(lineno)d] %(message)s")
+    QUEUE_SIZE = 10000
 
     def __init__(self, logPath=None):
-        if logPath:
-            self._logPath = logPath.rstrip('/')
+        if not logPath:
+            logPath = os.path.join(getBasePath(), 'logs')
 
+        self._logPath = logPath.rstrip('/')
         self._format = self._DEFAULT_FORMAT
 
-    def config(self, loggerName=None, filename=None, level=logging.INFO):
+    def config(self, loggerName=None, filename=None, level=logging.INFO,
+               queued=False, maxBytes=0, backupCount=3,
+               queueSize=QUEUE_SIZE):
         """
-        Config the logger.
+        Config the logger and return it.
+
+        queued      -- Log to filename through a bounded queue and a writer
+                       thread that writes in batches, logging never blocks
+                       the caller. Records that do not fit in the queue are
+                       dropped and counted. Needs a filename.
+        maxBytes    -- Rotate filename when it would grow past this size, 0
+                       never rotates.
+        backupCount -- The number of rotated files to keep.
+        queueSize   -- The number of records the queue holds.
         """
         if filename is not None:
             filePath = os.path.join(self._logPath, filename)
+        elif queued:
+            raise InvalidArgumentsException(
+                "A queued logger needs a filename.")
         else:
             filePath = None
 
-        if loggerName and filePath:
+        if filePath and (loggerName or queued):
             logger = logging.getLogger(loggerName)
             logger.setLevel(level)
-            handler = logging.FileHandler(filePath)
             formatter = logging.Formatter(self._format)
-            handler.setFormatter(formatter)
+
+            if queued:
+                handler = self._queuedHandler(filePath, formatter, maxBytes,
+                                              backupCount, queueSize)
+            else:
+                if maxBytes:
+                    handler = logging.handlers.RotatingFileHandler(
+                        filePath, maxBytes=maxBytes, backupCount=backupCount)
+                else:
+                    handler = logging.FileHandler(filePath)
+
+                handler.setFormatter(formatter)
+
             logger.addHandler(handler)
         else:
             logging.basicConfig(filename=filePath, format=self._format,
                                 level=level)
 
+        return logging.getLogger(loggerName)
+
+    def _queuedHandler(self, filePath, formatter, maxBytes, backupCount,
+                       queueSize):
+        records = deque(maxlen=queueSize)
+        handler = DroppingQueueHandler(records)
+        handler.writer = BatchFileWriter(
+            filePath, records, formatter, handler=handler, maxBytes=maxBytes,
+            backupCount=backupCount)
+        handler.writer.start()
+        return handler
+
     def setFormat(self, fmt=None, default=_DEFAULT_FORMAT):
         """
         Must be called before the config method or it will have no effect.
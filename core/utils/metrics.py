@@ -0,0 +1,237 @@
+#
+# core/utils/metrics.py
+#
+
+"""
+Operation counters and latency histograms for the GPIO, Pin and Event
+classes. Like tracing, metrics are off unless enableMetrics() is called
+and only objects constructed after that record. All the counts live in
+flat lists allocated up front, recording an operation is a bucket search
+and two index updates under a lock, so pins used on several threads and
+a reset() from another thread never lose or mix counts.
+
+    metrics = enableMetrics()
+    gpio = GPIO()
+    ...
+    metrics.dump('/var/lib/node_exporter/gpio.prom', format='prometheus')
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, json, time, threading
+from bisect import bisect_left
+
+from .exceptions import InvalidArgumentsException
+
+# Operations, the index in OPS.
+OPS = ('read', 'write', 'export', 'setMode', 'eventWait')
+OP_READ, OP_WRITE, OP_EXPORT, OP_SET_MODE, OP_EVENT_WAIT = range(len(OPS))
+# Histogram bucket upper bounds in nanoseconds, the last bucket is +Inf.
+BUCKETS = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000,
+           1000000, 2000000, 5000000, 10000000, 50000000, 100000000)
+
+_metrics = None
+
+
+class Metrics(object):
+    """
+    A count, sum and histogram of the latency of each operation on each
+    gpioId below numPins. Operations not on a pin, the Event wakes, are
+    kept under NO_PIN.
+    """
+    DEFAULT_PINS = 128
+
+    def __init__(self, numPins=DEFAULT_PINS, buckets=BUCKETS):
+        if list(buckets) != sorted(set(buckets)):
+            raise InvalidArgumentsException(
+                "Invalid buckets {}, must be increasing.".format(buckets))
+
+        self.NO_PIN = numPins
+        self._numPins = numPins + 1
+        self._buckets = tuple(buckets)
+        self._numBuckets = len(buckets) + 1
+        # Lists rather than arrays, indexing an array boxes a new int each
+        # time and is several times slower.
+        series = len(OPS) * self._numPins
+        self._sums = [0] * series
+        self._hist = [0] * (series * self._numBuckets)
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def observe(self, op, gpioId, ns):
+        """
+        Record one op on gpioId that took ns nanoseconds. gpioIds out of
+        range are counted under NO_PIN.
+        """
+        if not 0 <= gpioId < self._numPins:
+            gpioId = self.NO_PIN
+
+        series = op * self._numPins + gpioId
+        bucket = series * self._numBuckets + bisect_left(self._buckets, ns)
+
+        with self._lock:
+            self._sums[series] += ns
+            self._hist[bucket] += 1
+
+    def count(self, op, gpioId=None):
+        """
+        The number of op recorded on gpioId, or on all of them if None.
+        """
+        op = OPS.index(op) if isinstance(op, str) else op
+        size = self._numBuckets
+        start = op * self._numPins * size
+
+        if gpioId is None:
+            return sum(self._hist[start:start + self._numPins * size])
+
+        start += gpioId * size
+        return sum(self._hist[start:start + size])
+
+    def reset(self):
+        with self._lock:
+            for values in (self._sums, self._hist):
+                values[:] = [0] * len(values)
+
+            self._started = time.time()
+
+    def snapshot(self):
+        """
+        Return a dict of the recorded series keyed by operation then pin,
+        'none' for NO_PIN. Each series has count, sum_ns, mean_ns and the
+        cumulative bucket counts keyed by upper bound, 'inf' for the last.
+        """
+        with self._lock:
+            sums = self._sums[:]
+            hist = self._hist[:]
+
+        labels = [str(b) for b in self._buckets] + ['inf']
+        result = {}
+
+        for op, name in enumerate(OPS):
+            for gpioId in range(self._numPins):
+                series = op * self._numPins + gpioId
+                start = series * self._numBuckets
+                cumulative = 0
+                buckets = {}
+
+                for label, value in zip(labels, hist[start:start +
+                                                     self._numBuckets]):
+                    cumulative += value
+                    buckets[label] = cumulative
+
+                count = cumulative
+
+                if not count:
+                    continue
+
+                pin = 'none' if gpioId == self.NO_PIN else str(gpioId)
+                result.setdefault(name, {})[pin] = {
+                    'count': count, 'sum_ns': sums[series],
+                    'mean_ns': sums[series] / count, 'buckets': buckets}
+
+        return result
+
+    def toJSON(self):
+        return json.dumps({'started': self._started, 'time': time.time(),
+                           'ops': self.snapshot()}, indent=2, sort_keys=True)
+
+    def toPrometheus(self, prefix='gpio'):
+        """
+        Return the histograms in the Prometheus text exposition format, in
+        seconds.
+        """
+        name = '{}_op_duration_seconds'.format(prefix)
+        lines = ['# HELP {} Duration of GPIO operations.'.format(name),
+                 '# TYPE {} histogram'.format(name)]
+
+        for op, pins in sorted(self.snapshot().items()):
+            for pin, series in sorted(pins.items()):
+                labels = 'op="{}",pin="{}"'.format(op, pin)
+
+                for bound, value in series['buckets'].items():
+                    le = '+Inf' if bound == 'inf' else repr(int(bound) / 1e9)
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        name, labels, le, value))
+
+                lines.append('{}_sum{{{}}} {!r}'.format(
+                    name, labels, series['sum_ns'] / 1e9))
+                lines.append('{}_count{{{}}} {}'.format(
+                    name, labels, series['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path, format='json'):
+        """
+        Write a snapshot to path as 'json' or 'prometheus'. The file is
+        replaced atomically so a reader never sees a partial file.
+        """
+        if format == 'json':
+            data = self.toJSON()
+        elif format == 'prometheus':
+            data = self.toPrometheus()
+        else:
+            raise InvalidArgumentsException(
+                "Invalid format {}, must be 'json' or 'prometheus'.".format(
+                    format))
+
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(tmp, 'w') as f:
+            f.write(data)
+
+        os.replace(tmp, path)
+
+
+def timed(method, metrics, op, resolve=None):
+    """
+    Wrap method, whose first argument is a pin, to record its duration as
+    op. resolve turns the pin into a gpioId, the identity if None.
+    """
+    observe = metrics.observe
+    clock = time.perf_counter_ns
+
+    def wrapper(pin, *args, **kwargs):
+        try:
+            gpioId = resolve(pin) if resolve is not None else pin
+        except Exception:
+            # Let the method raise its own error.
+            return method(pin, *args, **kwargs)
+
+        start = clock()
+
+        try:
+            return method(pin, *args, **kwargs)
+        finally:
+            observe(op, gpioId, clock() - start)
+
+    return wrapper
+
+
+def enableMetrics(numPins=Metrics.DEFAULT_PINS, buckets=BUCKETS):
+    """
+    Start recording the operations of objects constructed from now on into
+    a new Metrics object, which is returned.
+    """
+    global _metrics
+    _metrics = Metrics(numPins, buckets)
+    return _metrics
+
+
+def disableMetrics():
+    global _metrics
+    _metrics = None
+
+
+def getMetrics():
+    """
+    Return the current Metrics object or None if metrics are disabled.
+    """
+    return _metrics
@@ -0,0 +1,125 @@
+#
+# core/utils/pinbank.py
+#
+
+"""
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, logging
+
+from .exceptions import InvalidArgumentsException
+from .basegpio import BaseGPIO
+from .gpio import GPIO, setupMultiplePins
+from .containers import BaseContainer
+
+
+class PinBank(BaseGPIO, BaseContainer):
+    """
+    A run of header pins read and written as one integer, bit 0 being the
+    first pin. The value files stay open and a write only touches the pins
+    whose bits changed, so a byte update costs one pwrite per changed bit.
+
+    pinHeader -- The header number, 8 or 9.
+    startPin  -- The first pin on the header.
+    pinRange  -- The number of pins (bits) in the bank.
+    direction -- GPIO.OUT (default) or GPIO.IN.
+    order     -- The bit numbers in the order they are written, ex.
+                 reversed(range(8)) to write the MSB first. Defaults to the
+                 LSB first.
+    gpio      -- An optional GPIO object used to configure the pins.
+    """
+    __VALUES = (b'0\n', b'1\n')
+
+    def __init__(self, pinHeader, startPin, pinRange=8, direction=GPIO.OUT,
+                 order=None, gpio=None, logger=None, level=logging.INFO):
+        super(PinBank, self).__init__(logger=logger, level=level)
+
+        if gpio is None:
+            gpio = GPIO(logger=logger, level=level)
+
+        self._pins = setupMultiplePins(pinHeader, startPin, pinRange,
+                                       direction=direction, gpio=gpio)
+        self._direction = direction
+        self._order = self._checkOrder(order)
+        self._mask = (1 << pinRange) - 1
+        self._fds = []
+
+        for pin in self._pins:
+            path = self._attrPath(self._getGpioId(pin), self._VALUE)
+            flags = os.O_RDWR if direction == GPIO.OUT else os.O_RDONLY
+            self._fds.append(os.open(path, flags))
+
+        self._value = self.read()
+
+    def _checkOrder(self, order):
+        if order is None:
+            return tuple(range(len(self._pins)))
+
+        order = tuple(order)
+
+        if sorted(order) != list(range(len(self._pins))):
+            raise InvalidArgumentsException(
+                "Invalid bit order {}, must contain each bit of the bank "
+                "exactly once.".format(order))
+
+        return order
+
+    @property
+    def pins(self):
+        return tuple(self._pins)
+
+    @property
+    def value(self):
+        """
+        The last value written or read.
+        """
+        return self._value
+
+    def setOrder(self, order=None):
+        self._order = self._checkOrder(order)
+
+    def write(self, value, order=None):
+        """
+        Write value to the bank, only the pins whose bits changed are
+        written, in the bank order or the order passed in.
+        """
+        value &= self._mask
+        changed = value ^ self._value
+        order = self._order if order is None else self._checkOrder(order)
+        fds = self._fds
+        values = self.__VALUES
+
+        for bit in order:
+            if changed >> bit & 1:
+                os.pwrite(fds[bit], values[value >> bit & 1], 0)
+
+        self._value = value
+
+    def read(self):
+        value = 0
+
+        for bit, fd in enumerate(self._fds):
+            if os.pread(fd, 2, 0)[:1] == b'1':
+                value |= 1 << bit
+
+        self._value = value
+        return value
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+
+        self._fds[:] = []
+
+    @property
+    def isClosed(self):
+        return not self._fds
@@ -0,0 +1,224 @@
+#
+# core/utils/pinset.py
+#
+
+"""
+Compact handles for large numbers of input pins. A PinHandle holds only
+its gpioId, value fd and cached attributes in __slots__, everything else,
+the logger, descriptor cache and backend, is shared through the PinSet
+that owns it.
+
+    with PinSet(('P8_7', 'P8_8', 'P8_9')) as pins, Event() as event:
+        pins.register(event)
+
+        for handle, mask in event.eventWait():
+            print(handle.gpioId, handle.value)
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, logging
+from array import array
+
+from .basegpio import BaseGPIO
+from .events import Event
+from .containers import BaseContainer
+
+
+class PinHandle(object):
+    """
+    One pin of a PinSet, usable as an Event container. The direction and
+    edge are read once through the owning set and cached.
+    """
+    __slots__ = ('gpioId', '_fd', '_owner', '_direction', '_edge')
+    __trigger__ = Event.EDGE
+    __eventmask__ = Event.PRI_INPUT|Event.ERROR
+
+    def __init__(self, owner, gpioId, fd):
+        self.gpioId = gpioId
+        self._fd = fd
+        self._owner = owner
+        self._direction = ""
+        self._edge = ""
+
+    def __repr__(self):
+        return "<PinHandle gpio{} fd {}>".format(self.gpioId, self._fd)
+
+    def fileno(self):
+        return self._fd
+
+    @property
+    def isClosed(self):
+        return self._fd is None
+
+    def _onEvent(self, mask):
+        # Backends with their own edge events queue them, they are drained
+        # every time or the queue fills and edges are lost.
+        backend = self._owner._backend
+
+        if backend is not None:
+            backend.readEvents(self._fd)
+
+    @property
+    def value(self):
+        backend = self._owner._backend
+
+        if backend is not None:
+            return backend.read(self.gpioId)
+
+        return int(os.pread(self._fd, 2, 0)[:1])
+
+    @property
+    def direction(self):
+        if not self._direction:
+            self._direction = self._owner._getAttr(
+                self.gpioId, self._owner._DIRECTION)
+
+        return self._direction
+
+    @property
+    def edge(self):
+        if not self._edge:
+            self._edge = self._owner._getAttr(self.gpioId, self._owner._EDGE)
+
+        return self._edge
+
+
+class PinSet(BaseGPIO, BaseContainer):
+    """
+    Owns a PinHandle for each of many already exported pins. The gpioIds
+    and fds are kept in arrays and the value files of all the pins are
+    opened, closed and registered with an Event in bulk.
+
+    pins    -- The pin names, ints are taken as gpioIds as they are.
+               A pin may appear more than once, each gets its own handle.
+    backend -- An optional backend, the fds come from its open method.
+    """
+
+    def __init__(self, pins, logger=None, level=logging.INFO, backend=None):
+        super(PinSet, self).__init__(logger=logger, level=level,
+                                     backend=backend)
+        self._gpioIds = array('i', [pin if isinstance(pin, int)
+                                    else self._getGpioId(pin)
+                                    for pin in pins])
+        self._fds = array('i')
+        self._handles = []
+        self._index = {}
+        self._eventmask = PinHandle.__eventmask__
+        self.open()
+
+    def __len__(self):
+        return len(self._gpioIds)
+
+    def __iter__(self):
+        return iter(self._handles)
+
+    def __getitem__(self, idx):
+        return self._handles[idx]
+
+    @property
+    def gpioIds(self):
+        return self._gpioIds
+
+    @property
+    def fds(self):
+        """
+        The value fds in pin order, empty when the set is closed.
+        """
+        return self._fds
+
+    @property
+    def isClosed(self):
+        return not self._handles
+
+    def handle(self, pin):
+        """
+        Return the first handle of pin, a name or gpioId.
+        """
+        return self._handles[self._index[
+            pin if isinstance(pin, int) else self._getGpioId(pin)]]
+
+    def open(self):
+        """
+        Open the value file of every pin, does nothing if already open. If
+        an open fails those already opened are closed again.
+        """
+        if self._handles:
+            return
+
+        backend = self._backend
+
+        try:
+            for gpioId in self._gpioIds:
+                fd = backend.open(gpioId) if backend is not None else None
+
+                if fd is not None:
+                    self._eventmask = backend.EVENTMASK
+                else:
+                    fd = self._openPin(self._attrPath(gpioId, self._VALUE))
+
+                self._fds.append(fd)
+                self._handles.append(PinHandle(self, gpioId, fd))
+                self._index.setdefault(gpioId, len(self._handles) - 1)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        close = self._backend.closeFd if self._backend is not None \
+                else os.close
+
+        for fd in self._fds:
+            close(fd)
+
+        for handle in self._handles:
+            handle._fd = None
+
+        del self._fds[:]
+        self._handles = []
+        self._index.clear()
+        self._fdCache.close()
+
+    def _getAttr(self, gpioId, attr):
+        if self._configures:
+            return (self._backend.getDirection if attr == self._DIRECTION
+                    else self._backend.getEdge)(gpioId)
+
+        return self._readAttr(gpioId, attr)
+
+    def values(self):
+        """
+        Return the value of every pin in pin order.
+        """
+        if self._backend is not None:
+            read = self._backend.read
+            return [read(gpioId) for gpioId in self._gpioIds]
+
+        pread = os.pread
+        return [int(pread(fd, 2, 0)[:1]) for fd in self._fds]
+
+    def register(self, event, eventmask=None, trigger=None,
+                 filterFactory=None):
+        """
+        Register every handle with event, eventWait returns the handles.
+
+        filterFactory -- An optional callable returning a new filter, each
+                         pin gets its own since filters keep state.
+        """
+        eventmask = eventmask or self._eventmask
+
+        for handle in self._handles:
+            event.register(handle, eventmask=eventmask, trigger=trigger,
+                           filter=filterFactory() if filterFactory else None)
+
+    def unregister(self, event):
+        for handle in self._handles:
+            event.unregister(handle)
@@ -0,0 +1,301 @@
+#
+# core/utils/pwm.py
+#
+
+"""
+A software PWM engine driving many pins from one timing thread.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, math, time, logging, threading, functools
+
+from .exceptions import InvalidArgumentsException
+from .gpio import GPIO
+
+
+class SoftPWM(object):
+    """
+    All the channels share one period. At the start of each period every
+    channel with a duty cycle between 0 and 1 is set high, then the channels
+    are set low in the order of a schedule of falling edges sorted by time.
+    The thread sleeps to absolute deadlines so the timing does not drift.
+    Duty cycle and frequency changes take effect at the next period. Channels
+    at a duty cycle of 0 or 1 are written once and left alone.
+
+    frequency -- The PWM frequency in Hz.
+    gpio      -- An optional GPIO object used to configure the pins, its
+                 backend if it has one is used for the writes else each
+                 channel keeps its value file open.
+    spin      -- Busy wait this many microseconds before each deadline
+                 instead of sleeping, trading CPU for precision.
+    """
+    __HIGH = b'1\n'
+    __LOW = b'0\n'
+
+    def __init__(self, frequency=100, gpio=None, spin=0, logger=None,
+                 level=logging.INFO):
+        self._gpio = gpio if gpio is not None else GPIO(logger=logger,
+                                                        level=level)
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._fds = {}
+        self._retired = []
+        self._period = self._checkFrequency(frequency)
+        self._spin = int(spin * 1000)
+        self._dirty = True
+        self._rising = ()
+        self._falling = ()
+        self._thread = None
+        self._running = False
+        self.resetStats()
+
+    def _checkFrequency(self, frequency):
+        if not frequency > 0:
+            raise InvalidArgumentsException(
+                "Invalid frequency {}, must be greater than 0.".format(
+                    frequency))
+
+        return int(1e9 / frequency)
+
+    def _checkDuty(self, duty):
+        if not 0.0 <= duty <= 1.0:
+            raise InvalidArgumentsException(
+                "Invalid duty cycle {}, must be 0.0 - 1.0.".format(duty))
+
+        return duty
+
+    def _writers(self, gpioId):
+        backend = self._gpio._backend
+
+        if backend is not None:
+            return (functools.partial(backend.write, gpioId, 1),
+                    functools.partial(backend.write, gpioId, 0))
+
+        # Keep our own descriptor, the GPIO fd cache may evict its own.
+        fd = os.open(self._gpio._attrPath(gpioId, self._gpio._VALUE),
+                     os.O_RDWR)
+        self._fds[gpioId] = fd
+        return (functools.partial(os.pwrite, fd, self.__HIGH, 0),
+                functools.partial(os.pwrite, fd, self.__LOW, 0))
+
+    def addChannel(self, pin, duty=0.0):
+        """
+        Set pin as an output and add it to the engine, a pin already in it
+        under any name is rejected, use setDuty to change it.
+        """
+        duty = self._checkDuty(duty)
+        gpioId = self._gpio._getGpioId(pin)
+
+        if gpioId in self._channels:
+            raise InvalidArgumentsException(
+                "Pin {} is already a channel.".format(pin))
+
+        self._gpio.setMode(pin, direction=GPIO.OUT)
+        high, low = self._writers(gpioId)
+
+        with self._lock:
+            self._channels[gpioId] = [duty, high, low]
+            self._dirty = True
+
+    def removeChannel(self, pin, value=GPIO.LOW):
+        """
+        Remove pin from the engine leaving it set to value.
+        """
+        self._removeChannel(self._gpio._getGpioId(pin), value)
+
+    def _removeChannel(self, gpioId, value):
+        with self._lock:
+            duty, high, low = self._channels.pop(gpioId)
+            self._retired.append((high if value else low,
+                                  self._fds.pop(gpioId, None)))
+            self._dirty = True
+
+        if self._thread is None:
+            with self._lock:
+                self._retire()
+
+    def setDuty(self, pin, duty):
+        duty = self._checkDuty(duty)
+        gpioId = self._gpio._getGpioId(pin)
+
+        with self._lock:
+            self._channels[gpioId][0] = duty
+            self._dirty = True
+
+    def getDuty(self, pin):
+        return self._channels[self._gpio._getGpioId(pin)][0]
+
+    def setFrequency(self, frequency):
+        period = self._checkFrequency(frequency)
+
+        with self._lock:
+            self._period = period
+            self._dirty = True
+
+    @property
+    def frequency(self):
+        return 1e9 / self._period
+
+    def _build(self):
+        """
+        Rebuild the schedule, called by the timing thread at the start of a
+        period.
+        """
+        with self._lock:
+            period = self._period
+            rising = []
+            falling = {}
+
+            for duty, high, low in self._channels.values():
+                if duty <= 0.0:
+                    low()
+                elif duty >= 1.0:
+                    high()
+                else:
+                    rising.append(high)
+                    offset = int(period * duty)
+                    falling.setdefault(offset, []).append(low)
+
+            self._rising = tuple(rising)
+            self._falling = tuple((offset, tuple(falling[offset]))
+                                  for offset in sorted(falling))
+            self._dirty = False
+            self._retire()
+
+        return period
+
+    def _retire(self):
+        # Channels removed since the last build are no longer in the
+        # schedule and can be given their final value.
+        for write, fd in self._retired:
+            write()
+            fd is not None and os.close(fd)
+
+        del self._retired[:]
+
+    def _sleepUntil(self, deadline):
+        remaining = deadline - time.monotonic_ns() - self._spin
+
+        if remaining > 0:
+            time.sleep(remaining / 1e9)
+
+        while time.monotonic_ns() < deadline:
+            pass
+
+    def _record(self, deadline):
+        # Welford's running mean and variance of the lateness.
+        late = time.monotonic_ns() - deadline
+        self._count += 1
+        delta = late - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (late - self._mean)
+
+        if late < self._min: self._min = late
+        if late > self._max: self._max = late
+
+    def _run(self):
+        nextPeriod = time.monotonic_ns()
+        period = self._period
+
+        while self._running:
+            if self._dirty:
+                period = self._build()
+
+            start = nextPeriod
+            self._sleepUntil(start)
+
+            if self._rising:
+                self._record(start)
+
+                for write in self._rising:
+                    write()
+
+            for offset, writes in self._falling:
+                deadline = start + offset
+                self._sleepUntil(deadline)
+                self._record(deadline)
+
+                for write in writes:
+                    write()
+
+            self._periods += 1
+            nextPeriod = start + period
+            behind = time.monotonic_ns() - nextPeriod
+
+            if behind > 0:
+                # Skip the periods that can no longer be met.
+                missed = behind // period + 1
+                self._overruns += missed
+                nextPeriod += missed * period
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='SoftPWM')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, value=GPIO.LOW):
+        """
+        Stop the timing thread and set all channels to value.
+        """
+        if self._thread is not None:
+            self._running = False
+            self._thread.join()
+            self._thread = None
+
+        with self._lock:
+            for duty, high, low in self._channels.values():
+                (high if value else low)()
+
+            self._retire()
+            self._dirty = True
+
+    def close(self, value=GPIO.LOW):
+        """
+        Stop the engine and remove all the channels.
+        """
+        self.stop(value)
+
+        for gpioId in list(self._channels):
+            self._removeChannel(gpioId, value)
+
+    def stats(self):
+        """
+        Return the lateness of the edges written in nanoseconds since the
+        last reset, and the number of periods run and skipped.
+        """
+        count = self._count
+        return {'frequency': self.frequency,
+                'channels': len(self._channels),
+                'periods': self._periods,
+                'overruns': self._overruns,
+                'edges': count,
+                'mean_ns': self._mean if count else 0.0,
+                'stdev_ns': math.sqrt(self._m2 / count) if count else 0.0,
+                'min_ns': self._min if count else 0,
+                'max_ns': self._max if count else 0}
+
+    def resetStats(self):
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = float('inf')
+        self._max = 0
+        self._periods = 0
+        self._overruns = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
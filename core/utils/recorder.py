@@ -0,0 +1,238 @@
+#
+# core/utils/recorder.py
+#
+
+"""
+Record the edges seen on pins to a file and replay them through a
+SimBackend, so traffic captured on the robot can be decoded again anywhere.
+
+    with EdgeRecorder('encoder.edges') as recorder:
+        pinA.enableRecording(recorder)
+        pinB.enableRecording(recorder)
+        ...
+
+    sim = SimBackend()
+    replayer = EdgeReplayer(sim, 'encoder.edges', speed=1.0)
+    replayer.start()
+
+A file is a HEADER followed by fixed-width RECORDs of (monotonic_ns,
+gpioId, value) in the order they were seen, so it can be appended to while
+it is being read and cut anywhere on a record boundary.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time, struct
+
+from .exceptions import InvalidArgumentsException
+from .simulator import EdgeGenerator
+
+MAGIC = b'GPER'
+VERSION = 1
+# magic, version, record size, reserved
+HEADER = struct.Struct('=4sHHQ')
+# monotonic_ns, gpioId, value
+RECORD = struct.Struct('=qIi')
+
+
+def checkHeader(data, path):
+    if len(data) < HEADER.size:
+        raise InvalidArgumentsException(
+            "Not an edge recording, too short: {}".format(path))
+
+    magic, version, size, reserved = HEADER.unpack(data[:HEADER.size])
+
+    if magic != MAGIC or version != VERSION or size != RECORD.size:
+        raise InvalidArgumentsException(
+            "Not a version {} edge recording: {}".format(VERSION, path))
+
+
+def readRecords(path, chunk=4096):
+    """
+    Yield the (monotonic_ns, gpioId, value) records of path, a partly
+    written last record is ignored.
+    """
+    with open(path, 'rb') as f:
+        checkHeader(f.read(HEADER.size), path)
+        size = RECORD.size * chunk
+
+        while True:
+            data = f.read(size)
+            data = data[:len(data) - len(data) % RECORD.size]
+
+            if not data:
+                break
+
+            yield from RECORD.iter_unpack(data)
+
+
+class EdgeRecorder(object):
+    """
+    Append records to path through a buffered file, safe to share between
+    pins read on different threads. An existing recording is appended to.
+
+    bufferSize -- Bytes buffered before they are written.
+    """
+    DEFAULT_BUFFER = 65536
+
+    def __init__(self, path, bufferSize=DEFAULT_BUFFER):
+        self._path = path
+        self._file = open(path, 'ab', buffering=bufferSize)
+
+        try:
+            if self._file.tell() == 0:
+                self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+                self._count = 0
+            else:
+                with open(path, 'rb') as f:
+                    checkHeader(f.read(HEADER.size), path)
+
+                self._count = (self._file.tell() - HEADER.size) // \
+                              RECORD.size
+        except Exception:
+            self._file.close()
+            raise
+
+        self._pack = RECORD.pack
+        self._write = self._file.write
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def count(self):
+        """
+        The records in the file, including those still buffered.
+        """
+        return self._count
+
+    @property
+    def isClosed(self):
+        return self._file.closed
+
+    def record(self, gpioId, value, timestamp=None):
+        self._write(self._pack(timestamp if timestamp is not None
+                               else time.monotonic_ns(), gpioId, value))
+        self._count += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class EdgeReplayer(EdgeGenerator):
+    """
+    Drive the lines of a SimBackend with a recording.
+
+    path   -- The recording.
+    speed  -- 1.0 keeps the recorded timing, 2.0 plays twice as fast and 0
+              as fast as possible.
+    gpioMap -- An optional dict of recorded gpioId to line, lines not in it
+               are driven as recorded.
+    count  -- Stop after this many records.
+
+    A consumer on another thread misses edges that come faster than it
+    wakes, as on the robot. Passing an Event and handler to play() instead
+    dispatches after every record on the calling thread, so nothing is
+    missed however fast the replay.
+    """
+
+    def __init__(self, backend, path, speed=1.0, gpioMap=None, count=None):
+        if speed < 0:
+            raise InvalidArgumentsException(
+                "Invalid speed {}, must be 0 or greater.".format(speed))
+
+        super(EdgeReplayer, self).__init__(backend, count=count)
+        self._path = path
+        self._speed = speed
+        self._gpioMap = gpioMap or {}
+        self._event = None
+        self._handler = None
+        self.lateness = 0
+
+    def _generate(self):
+        gpioMap = self._gpioMap
+
+        for timestamp, gpioId, value in readRecords(self._path):
+            yield timestamp, gpioMap.get(gpioId, gpioId), value
+
+    def _run(self):
+        drive = self._backend.drive
+        speed = self._speed
+        count = self._count
+        minSleep = self._MIN_SLEEP
+        event, handler = self._event, self._handler
+        origin = None
+        lateness = 0
+        start = time.monotonic_ns()
+
+        for timestamp, gpioId, value in self._generate():
+            if not self._running or count is not None and \
+                   self._generated >= count:
+                break
+
+            if speed:
+                if origin is None:
+                    origin = timestamp
+
+                deadline = start + int((timestamp - origin) / speed)
+                remaining = deadline - time.monotonic_ns()
+
+                if remaining > minSleep:
+                    time.sleep(remaining / 1e9)
+
+                while time.monotonic_ns() < deadline:
+                    pass
+
+                lateness += time.monotonic_ns() - deadline
+
+            drive(gpioId, value)
+            self._generated += 1
+
+            if event is not None:
+                for container, mask in event.eventWait(0):
+                    handler(container, mask)
+
+        self._elapsed = time.monotonic_ns() - start
+        self.lateness = lateness // max(1, self._generated) if speed else 0
+        self._running = False
+
+    def play(self, event=None, handler=None):
+        """
+        Replay on the calling thread, returns the number of records driven.
+
+        event   -- An optional Event the driven lines are registered with.
+        handler -- Called with (container, eventmask) for each container
+                   ready after each record.
+        """
+        if event is not None and handler is None:
+            raise InvalidArgumentsException(
+                "A handler is needed to dispatch the events.")
+
+        self._event, self._handler = event, handler
+        self._generated = 0
+        self._running = True
+
+        try:
+            self._run()
+        finally:
+            self._event = self._handler = None
+
+        return self._generated
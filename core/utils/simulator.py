@@ -0,0 +1,449 @@
+#
+# core/utils/simulator.py
+#
+
+"""
+A simulated GPIO chip for testing and load testing without hardware. The
+SimBackend holds thousands of virtual lines, each with a real pollable file
+descriptor (an eventfd, or a pipe where eventfd is not available) so the
+Event class and epoll behave as they do with the sysfs value files. Edge
+generators drive the lines from a thread at a configured rate.
+
+    sim = SimBackend()
+    gpio = GPIO(backend=sim)
+    gpio.setMode('P8_7', direction=GPIO.IN, edge=GPIO.BOTH)
+    pin = Pin('P8_7', backend=sim)
+    sim.drive(66, 1)
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, sys, time, random, select, threading
+
+from .exceptions import InvalidArgumentsException
+from .backends import BaseBackend
+from .events import Event
+
+# An eventfd counter increment, also what is written to a pipe.
+_ONE = (1).to_bytes(8, sys.byteorder)
+
+
+class SimBackend(BaseBackend):
+    """
+    numLines virtual lines numbered from 0, every line starts as an input
+    at 0 with no edge. A line's descriptor is created the first time it is
+    opened and becomes readable each time drive changes the value of the
+    line in the direction of its edge setting.
+
+    numLines -- The number of lines.
+    """
+    CONFIGURES = True
+    EVENTMASK = select.EPOLLIN
+    DEFAULT_LINES = 4096
+    __EDGES = {'none': 0, 'rising': 1, 'falling': 2, 'both': 3}
+    __EDGE_NAMES = dict((v, k) for k, v in __EDGES.items())
+
+    def __init__(self, numLines=DEFAULT_LINES):
+        self._numLines = numLines
+        self._values = bytearray(numLines)
+        self._outputs = bytearray(numLines)
+        self._edges = bytearray(numLines)
+        self._inUse = set()
+        self._fds = {}
+        self._lock = threading.Lock()
+        self._signalled = 0
+
+    def __len__(self):
+        return self._numLines
+
+    @property
+    def signalled(self):
+        """
+        The number of edges signalled on line descriptors.
+        """
+        return self._signalled
+
+    def _check(self, gpioId):
+        if not 0 <= gpioId < self._numLines:
+            raise InvalidArgumentsException(
+                "Invalid line {}, must be 0 - {}.".format(
+                    gpioId, self._numLines - 1))
+
+        return gpioId
+
+    def _lineFds(self, gpioId):
+        """
+        Return the (read, write) descriptors of gpioId creating them if
+        needed, both are the same eventfd when eventfd is available.
+        """
+        fds = self._fds.get(gpioId)
+
+        if fds is None:
+            with self._lock:
+                fds = self._fds.get(gpioId)
+
+                if fds is None:
+                    if hasattr(os, 'eventfd'):
+                        fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+                        fds = (fd, fd)
+                    else:
+                        fds = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+                    self._fds[gpioId] = fds
+
+        return fds
+
+    def _signal(self, gpioId):
+        fds = self._fds.get(gpioId)
+
+        if fds is not None:
+            rfd, wfd = fds
+
+            try:
+                os.write(wfd, _ONE)
+            except BlockingIOError:
+                # A full pipe, nobody is reading it, make room.
+                os.read(rfd, 65536)
+                os.write(wfd, _ONE)
+
+            self._signalled += 1
+
+    def read(self, gpioId):
+        return self._values[gpioId]
+
+    def write(self, gpioId, value):
+        """
+        Set the value of a line as the GPIO side does, no edge is signalled.
+        """
+        self._values[gpioId] = 1 if value else 0
+
+    def drive(self, gpioId, value):
+        """
+        Set the value of a line as an external signal does, signals the line
+        descriptor if the change matches its edge setting. Returns True if
+        an edge was signalled.
+        """
+        value = 1 if value else 0
+
+        if self._values[gpioId] == value:
+            return False
+
+        self._values[gpioId] = value
+
+        if self._edges[gpioId] & (1 if value else 2):
+            self._signal(gpioId)
+            return True
+
+        return False
+
+    def toggle(self, gpioId):
+        return self.drive(gpioId, not self._values[gpioId])
+
+    def open(self, gpioId):
+        return os.dup(self._lineFds(self._check(gpioId))[0])
+
+    def line(self, gpioId):
+        """
+        Return a SimLine container for gpioId, lines outside the range of
+        pin names can only be used this way.
+        """
+        return SimLine(self, gpioId)
+
+    def setMode(self, gpioId, direction=None, edge=None):
+        self._check(gpioId)
+        result = gpioId not in self._inUse
+        self._inUse.add(gpioId)
+
+        if direction:
+            self.setDirection(gpioId, direction)
+            result = True
+
+        if edge:
+            self.setEdge(gpioId, edge)
+            result = True
+
+        return result
+
+    def release(self, gpioId=None):
+        gpioIds = list(self._inUse) if gpioId is None else [gpioId]
+        result = False
+
+        for gpioId in gpioIds:
+            if gpioId in self._inUse:
+                self._inUse.discard(gpioId)
+                self._outputs[gpioId] = 0
+                self._edges[gpioId] = 0
+                result = True
+
+        return result
+
+    def setDirection(self, gpioId, direction):
+        self._outputs[self._check(gpioId)] = direction == 'out'
+
+    def getDirection(self, gpioId):
+        return 'out' if self._outputs[self._check(gpioId)] else 'in'
+
+    def setEdge(self, gpioId, edge):
+        if edge not in self.__EDGES:
+            raise InvalidArgumentsException(
+                "Invalid edge {}, must be one of {}.".format(
+                    edge, sorted(self.__EDGES)))
+
+        self._edges[self._check(gpioId)] = self.__EDGES[edge]
+
+    def getEdge(self, gpioId):
+        return self.__EDGE_NAMES[self._edges[self._check(gpioId)]]
+
+    def close(self):
+        with self._lock:
+            for rfd, wfd in self._fds.values():
+                os.close(rfd)
+                wfd != rfd and os.close(wfd)
+
+            self._fds.clear()
+
+
+class SimLine(object):
+    """
+    A container for one line of a SimBackend that can be registered with an
+    Event. It keeps its own duplicate of the line descriptor.
+    """
+    __trigger__ = Event.EDGE
+    __eventmask__ = SimBackend.EVENTMASK
+
+    def __init__(self, backend, gpioId):
+        self._backend = backend
+        self._gpioId = gpioId
+        self._fd = backend.open(gpioId)
+
+    @property
+    def gpioId(self):
+        return self._gpioId
+
+    def fileno(self):
+        return self._fd
+
+    @property
+    def value(self):
+        return self._backend.read(self._gpioId)
+
+    @property
+    def isClosed(self):
+        return self._fd is None
+
+    def close(self):
+        if self._fd is not None:
+            self._backend.closeFd(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class EdgeGenerator(object):
+    """
+    Drives the lines of a SimBackend from a thread. Subclasses implement
+    _generate, an iterator of (gpioId, value) pairs.
+
+    backend -- The SimBackend to drive.
+    rate    -- Edges per second, 0 runs as fast as possible. The thread
+               sleeps to absolute deadlines so the average rate holds even
+               when single edges are late.
+    count   -- Stop after this many edges, None runs until stopped or the
+               edges run out.
+    """
+    # Deadlines closer than this are not slept for, sleeping is too coarse.
+    _MIN_SLEEP = 100000
+
+    def __init__(self, backend, rate=0, count=None):
+        if rate < 0:
+            raise InvalidArgumentsException(
+                "Invalid rate {}, must be 0 or greater.".format(rate))
+
+        self._backend = backend
+        self._period = int(1e9 / rate) if rate else 0
+        self._count = count
+        self._generated = 0
+        self._thread = None
+        self._running = False
+        self._elapsed = 0
+
+    @property
+    def generated(self):
+        """
+        The number of values driven, including those that did not change
+        the line.
+        """
+        return self._generated
+
+    @property
+    def rate(self):
+        """
+        The achieved rate in edges per second of the last or current run.
+        """
+        elapsed = self._elapsed or 1
+        return self._generated * 1e9 / elapsed
+
+    @property
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _generate(self):
+        raise NotImplementedError()
+
+    def _run(self):
+        drive = self._backend.drive
+        period = self._period
+        count = self._count
+        minSleep = self._MIN_SLEEP
+        start = deadline = time.monotonic_ns()
+
+        for gpioId, value in self._generate():
+            if not self._running or count is not None and \
+                   self._generated >= count:
+                break
+
+            if period:
+                deadline += period
+                remaining = deadline - time.monotonic_ns()
+
+                if remaining > minSleep:
+                    time.sleep(remaining / 1e9)
+                else:
+                    # Spin but let other threads have the GIL.
+                    while time.monotonic_ns() < deadline:
+                        time.sleep(0)
+
+            drive(gpioId, value)
+            self._generated += 1
+
+        self._elapsed = time.monotonic_ns() - start
+        self._running = False
+
+    def start(self):
+        if self._thread is None:
+            self._generated = 0
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                                            name=self.__class__.__name__)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def join(self, timeout=None):
+        """
+        Wait for the edges to run out, returns True if they have.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+            if self._thread.is_alive():
+                return False
+
+            self._thread = None
+
+        return True
+
+    def stop(self):
+        self._running = False
+        self.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class ScriptedEdges(EdgeGenerator):
+    """
+    Drives the (gpioId, value) pairs of script in order.
+
+    repeat -- Start the script again when it ends.
+    """
+
+    def __init__(self, backend, script, rate=0, count=None, repeat=False):
+        super(ScriptedEdges, self).__init__(backend, rate=rate, count=count)
+        self._script = tuple(script)
+        self._repeat = repeat
+
+    def _generate(self):
+        while True:
+            for pair in self._script:
+                yield pair
+
+            if not self._repeat or not self._script:
+                break
+
+
+class RandomEdges(EdgeGenerator):
+    """
+    Toggles lines picked at random from gpioIds.
+
+    seed -- An optional seed to make the sequence repeatable.
+    """
+
+    def __init__(self, backend, gpioIds, rate=0, count=None, seed=None):
+        super(RandomEdges, self).__init__(backend, rate=rate, count=count)
+        self._gpioIds = tuple(gpioIds)
+        self._random = random.Random(seed)
+
+    def _generate(self):
+        values = self._backend._values
+        gpioIds = self._gpioIds
+        choice = self._random.choice
+
+        while True:
+            gpioId = choice(gpioIds)
+            yield gpioId, not values[gpioId]
+
+
+class QuadratureEdges(EdgeGenerator):
+    """
+    Drives two lines as a quadrature encoder turning, every edge is one
+    step.
+
+    phaseA    -- The gpioId of phase A.
+    phaseB    -- The gpioId of phase B.
+    direction -- 1 or -1, 1 is counted up by the RotaryEncoder.
+    """
+    # The phase values in forward order 00, 01, 11, 10 as (A, B).
+    _CYCLE = ((0, 0), (0, 1), (1, 1), (1, 0))
+
+    def __init__(self, backend, phaseA, phaseB, rate=0, count=None,
+                 direction=1):
+        super(QuadratureEdges, self).__init__(backend, rate=rate, count=count)
+
+        if direction not in (1, -1):
+            raise InvalidArgumentsException(
+                "Invalid direction {}, must be 1 or -1.".format(direction))
+
+        self._phaseA = phaseA
+        self._phaseB = phaseB
+        self._direction = direction
+
+    def _generate(self):
+        values = self._backend._values
+        cycle = self._CYCLE
+        state = cycle.index((values[self._phaseA], values[self._phaseB]))
+
+        while True:
+            state = (state + self._direction) % 4
+            a, b = cycle[state]
+
+            # Exactly one phase changes per step.
+            if a != values[self._phaseA]:
+                yield self._phaseA, a
+            else:
+                yield self._phaseB, b
@@ -0,0 +1,282 @@
+#
+# core/utils/snapshot.py
+#
+
+"""
+Pin values and encoder positions published to a memory mapped file so any
+number of processes can read them without a syscall per read.
+
+    with SnapshotPublisher(('P8_7', 'P8_8'), encoders={'left': re}) as pub:
+        pub.start(interval=0.001)
+        ...
+
+    reader = SnapshotReader()
+    print(reader.snapshot())    # {'P8_7': 0, 'P8_8': 1, 'left': 1234}
+
+The file is a header, a table of slot names and a block of int64 values
+guarded by a sequence number. The publisher makes the sequence odd, writes
+the block and makes it even again. A reader copies the block between two
+reads of the sequence and keeps the copy only if both are the same even
+number, so it never blocks the publisher and never sees half a publish.
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os, mmap, time, struct, logging, threading
+
+from .pinset import PinSet
+from .exceptions import InvalidArgumentsException
+
+DEFAULT_PATH = '/dev/shm/gpio-snapshot'
+MAGIC = b'GPSS'
+VERSION = 1
+# magic, version, number of slots, reserved
+HEADER = struct.Struct('=4sIII')
+NAME_SIZE = 32
+SEQUENCE = struct.Struct('=Q')
+
+
+def _layout(numSlots):
+    """
+    Return the offset of the sequence number and the struct of the
+    timestamp and values that follow it.
+    """
+    return (HEADER.size + numSlots * NAME_SIZE,
+            struct.Struct('=q{}q'.format(numSlots)))
+
+
+class SnapshotPublisher(object):
+    """
+    Publish the values of already exported pins and the positions of
+    encoders to path.
+
+    pins     -- The pin names, each slot is named by the pin as given.
+    encoders -- An optional dict of objects with a position attribute, ex.
+                RotaryEncoder, keyed by slot name.
+    backend  -- An optional backend the pins are read through.
+    """
+
+    def __init__(self, pins=(), encoders=None, path=DEFAULT_PATH,
+                 backend=None, logger=None, level=logging.INFO):
+        self._log = logging.getLogger(logger or '')
+        self._encoders = tuple((encoders or {}).values())
+        self._names = tuple(str(pin) for pin in pins) + tuple(encoders or ())
+        self._path = path
+
+        if len(set(self._names)) != len(self._names):
+            raise InvalidArgumentsException(
+                "Slot names must be unique, found: {}".format(self._names))
+
+        for name in self._names:
+            if len(name.encode('utf-8')) > NAME_SIZE:
+                raise InvalidArgumentsException(
+                    "Slot name longer than {} bytes, found: {}".format(
+                        NAME_SIZE, name))
+
+        self._pins = PinSet(pins, logger=logger, level=level,
+                            backend=backend)
+        self._offset, self._block = _layout(len(self._names))
+        self._map = self._create()
+        self._sequence = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self.publish()
+
+    def _create(self):
+        """
+        Write the new file under a temporary name and rename it into place,
+        readers never open a file without its header.
+        """
+        size = self._offset + SEQUENCE.size + self._block.size
+        tmp = '{}.{}'.format(self._path, os.getpid())
+        fd = os.open(tmp, os.O_RDWR|os.O_CREAT|os.O_TRUNC, 0o644)
+
+        try:
+            os.ftruncate(fd, size)
+            buf = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        HEADER.pack_into(buf, 0, MAGIC, VERSION, len(self._names), 0)
+
+        for idx, name in enumerate(self._names):
+            buf[HEADER.size + idx * NAME_SIZE:
+                HEADER.size + idx * NAME_SIZE + len(name.encode('utf-8'))] = \
+                name.encode('utf-8')
+
+        os.rename(tmp, self._path)
+        return buf
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def names(self):
+        return self._names
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    def publish(self):
+        """
+        Read every pin and encoder and publish the values, returns the new
+        sequence number.
+        """
+        values = self._pins.values()
+        values.extend(encoder.position for encoder in self._encoders)
+        buf, offset = self._map, self._offset
+        sequence = self._sequence
+        SEQUENCE.pack_into(buf, offset, sequence + 1)
+        self._block.pack_into(buf, offset + SEQUENCE.size,
+                              time.monotonic_ns(), *values)
+        self._sequence = sequence = sequence + 2
+        SEQUENCE.pack_into(buf, offset, sequence)
+        return sequence
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.publish()
+            except OSError as e:
+                self._log.error("Could not publish the snapshot, %s", e)
+
+    def start(self, interval=0.01):
+        """
+        Publish every interval seconds from a thread until stop() is called.
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            args=(interval,),
+                                            name='SnapshotPublisher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stop publishing and remove the file, readers keep the last values.
+        """
+        self.stop()
+        self._pins.close()
+
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SnapshotReader(object):
+    """
+    Read consistent snapshots published by a SnapshotPublisher.
+
+    path    -- The file the publisher writes.
+    timeout -- Seconds to retry while a publish is in progress before
+               giving up with a TimeoutError, a publisher that died in the
+               middle of one never finishes it.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, timeout=1.0):
+        fd = os.open(path, os.O_RDONLY)
+
+        try:
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        magic, version, numSlots, reserved = HEADER.unpack_from(self._map, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise InvalidArgumentsException(
+                "Not a version {} snapshot: {}".format(VERSION, path))
+
+        self._names = tuple(
+            self._map[HEADER.size + idx * NAME_SIZE:
+                      HEADER.size + (idx + 1) * NAME_SIZE].rstrip(
+                          b'\0').decode('utf-8')
+            for idx in range(numSlots))
+        self._index = {name: idx for idx, name in enumerate(self._names)}
+        self._offset, self._block = _layout(numSlots)
+        self._timeout = timeout
+        self.retries = 0
+
+    @property
+    def names(self):
+        return self._names
+
+    def read(self):
+        """
+        Return the sequence number, publish time in monotonic ns and a
+        tuple of the values in slot order of one publish.
+        """
+        buf = self._map
+        offset = self._offset
+        unpackSequence = SEQUENCE.unpack_from
+        unpackBlock = self._block.unpack_from
+        start = None
+
+        while True:
+            sequence = unpackSequence(buf, offset)[0]
+
+            if not sequence & 1:
+                block = unpackBlock(buf, offset + SEQUENCE.size)
+
+                if unpackSequence(buf, offset)[0] == sequence:
+                    return sequence, block[0], block[1:]
+
+            self.retries += 1
+
+            if start is None:
+                start = time.monotonic()
+            elif time.monotonic() - start > self._timeout:
+                raise TimeoutError("The snapshot publisher did not finish "
+                                   "publishing sequence {}.".format(sequence))
+
+    def values(self):
+        return self.read()[2]
+
+    def snapshot(self):
+        """
+        Return a dict of the values of one publish keyed by slot name.
+        """
+        return dict(zip(self._names, self.read()[2]))
+
+    def get(self, name):
+        return self.read()[2][self._index[name]]
+
+    @property
+    def sequence(self):
+        return SEQUENCE.unpack_from(self._map, self._offset)[0]
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -12,17 +12,52 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import asyncio
+import collections
 import logging
-import os, select
+import os, sys, json, time, select, shutil, socket, struct
+import tempfile, subprocess, threading
 import unittest
-from unittest import skip
+from unittest import skipUnless
 
-from central.utils.gpio import GPIO
-from central.utils.events import Event
-from central.utils.containers import Pin
-from central.utils.exceptions import *
+from core.utils.gpio import GPIO
+from core.utils.basegpio import BaseGPIO
+from core.utils.events import Event
+from core.utils.containers import Pin, EdgeRing
+from core.utils.exceptions import *
+from core.utils.pinbank import PinBank
+from core.utils.backends import MMapBackend
+from core.utils.aio import AsyncEvent, AsyncGPIO
+from core.utils.pwm import SoftPWM
+from core.utils.filters import (
+    FixedWindowFilter, SettleTimeFilter, MajorityVoteFilter)
+from core.utils.inotify import waitForAccess, isAvailable
+from core.utils.fakesysfs import FakeSysfs, PipeContainer
+from core.utils.simulator import (
+    SimBackend, ScriptedEdges, RandomEdges, QuadratureEdges)
+from core.utils.chardev import (
+    ChardevBackend, packConfig, unpackConfig, FLAG_INPUT, FLAG_OUTPUT,
+    FLAG_EDGE_RISING, FLAG_BIAS_PULL_UP)
+from core.utils.fakechardev import FakeChardev
+from core.utils.trace import (
+    TraceRing, enableTracing, disableTracing, readTrace, OP_WRITE)
+from core.utils.logging_config import (
+    ConfigLogger, DroppingQueueHandler, BatchFileWriter)
+from core.utils.pinset import PinSet
+from core.utils.transaction import Transaction
+from core.utils.broker import (
+    GPIOBroker, GPIOProxy, MESSAGE, OP_GET_VALUE, OP_EVENT)
+from core.utils.recorder import (
+    EdgeRecorder, EdgeReplayer, readRecords, RECORD)
+from core.utils.snapshot import SnapshotPublisher, SnapshotReader, SEQUENCE
+from core.utils.metrics import (
+    Metrics, enableMetrics, disableMetrics, OP_READ as METRIC_READ)
+from core.utils import benchmarks
 
+HAS_GPIO = os.path.isdir(BaseGPIO._GPIO_PATH)
 
+
+@skipUnless(HAS_GPIO, "Requires {}".format(BaseGPIO._GPIO_PATH))
 class TestGPIO(unittest.TestCase):
 
     def __init__(self, name):
@@ -112,6 +147,7 @@ class TestGPIO(unittest.TestCase):
                         u"should have been: {}.".format(e, GPIO.LOW))
 
 
+@skipUnless(HAS_GPIO, "Requires {}".format(BaseGPIO._GPIO_PATH))
 class TestPin(unittest.TestCase):
 
     def __init__(self, name):
@@ -168,6 +204,7 @@ class TestPin(unittest.TestCase):
                                     ce, ge))
 
 
+@skipUnless(HAS_GPIO, "Requires {}".format(BaseGPIO._GPIO_PATH))
 class TestEvent(unittest.TestCase):
 
     def __init__(self, name):
@@ -200,14 +237,14 @@ class TestEvent(unittest.TestCase):
                 try:
                     event.eventWait(timeout=-1) # Bocking
                     msg = u"Poll has an error."
-                    print "queue: {}\nevents: {},\ncontainers: {}".format(
-                        event._queue, event._events, event._containers)
-                    print bin(event._events.get(cont.fileno()))
+                    print("queue: {}\nevents: {},\nready: {}".format(
+                        event._queue, event._events, event._ready))
+                    print(bin(event._events.get(cont.fileno())))
 
 
                     self.assertTrue(event.hasError(cont) == False, msg)
                 except select.error as e:
-                    print e
+                    print(e)
 
 
 
@@ -219,6 +256,1858 @@ class TestEvent(unittest.TestCase):
         ## print "hasPriorityInput: {}".format(event.hasPriorityInput(cont))
 
 
+class TestPinIndex(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestPinIndex, self).__init__(name)
+
+    def setUp(self):
+        self.gpio = GPIO()
+
+    def test__getGpioId(self):
+        validPins = ('p8.7', 'p8_7', 'P8_7', 'gpio2_2', 'GPIO2.2', 'gpio_66',
+                     'Gpio_66', 'gPiO2_2', 'P8_07',)
+        validPin = 66
+        msg = u"Invalid pin value found: {}, should have been: {}."
+
+        for pin in validPins:
+            gpioId = self.gpio._getGpioId(pin)
+            self.assertTrue(gpioId == validPin, msg.format(gpioId, validPin))
+
+        invalidPins = ('q8_7', 'gpio_125', 'P9_27', '', None, ['P8_7'],)
+
+        for pin in invalidPins:
+            with self.assertRaises(InvalidPinNomenclatureException):
+                gpioId = self.gpio._getGpioId(pin)
+
+    def test__getPinPaths(self):
+        paths = self.gpio._getPinPaths(66)
+        path = os.path.join(BaseGPIO._GPIO_PATH, 'gpio66', GPIO._VALUE)
+        self.assertTrue(paths[GPIO._VALUE] == path, msg=u"Invalid path, "
+                        u"found: {}, should have been: {}".format(
+                            paths[GPIO._VALUE], path))
+
+        with FakeSysfs() as fake:
+            path = self.gpio._attrPath(66, GPIO._EDGE)
+            self.assertTrue(path == fake.pinPath(66, GPIO._EDGE))
+
+
+class TestPinBank(unittest.TestCase):
+    PINS = (45, 44, 23, 26, 47, 46, 27, 65) # P8_11 - P8_18
+
+    def __init__(self, name):
+        super(TestPinBank, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=self.PINS).__enter__()
+
+    def tearDown(self):
+        self.fake.__exit__(None, None, None)
+
+    def _bankValue(self):
+        return sum(int(self.fake.read(gpioId, GPIO._VALUE)) << bit
+                   for bit, gpioId in enumerate(self.PINS))
+
+    def test_write_read(self):
+        with PinBank(8, 11) as bank:
+            d = self.fake.read(self.PINS[0], GPIO._DIRECTION)
+            self.assertTrue(d == GPIO.OUT, msg=u"Invalid direction, found: "
+                            u"{}, should have been: {}".format(d, GPIO.OUT))
+
+            for value in (0b10110010, 0, 0xFF, 0x55):
+                bank.write(value)
+                found = self._bankValue()
+                self.assertTrue(found == value, msg=u"Invalid bank value, "
+                                u"found: {}, should have been: {}".format(
+                                    bin(found), bin(value)))
+                self.assertTrue(bank.read() == value)
+
+        self.assertTrue(bank.isClosed)
+
+    def test_only_changed_bits_written(self):
+        with PinBank(8, 11) as bank:
+            bank.write(0b00000001)
+            # Change the file behind the bank's back, an unchanged bit
+            # must not be rewritten.
+            self.fake.write(self.PINS[0], GPIO._VALUE, 0)
+            bank.write(0b00000011)
+            self.assertTrue(self._bankValue() == 0b00000010)
+
+    def test_order(self):
+        with self.assertRaises(InvalidArgumentsException):
+            PinBank(8, 11, order=(0, 1, 2))
+
+        with PinBank(8, 11, order=reversed(range(8))) as bank:
+            bank.write(0xA5)
+            self.assertTrue(self._bankValue() == 0xA5)
+
+
+class TestWaitForAccess(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestWaitForAccess, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs()
+
+    def tearDown(self):
+        self.fake.remove()
+
+    def _waitForExport(self, gpioIds, delay=0.05, **kwargs):
+        paths = [self.fake.pinPath(gpioId, GPIO._VALUE) for gpioId in gpioIds]
+        timers = [threading.Timer(delay, self.fake.exportPin, (gpioId,))
+                  for gpioId in gpioIds]
+        [timer.start() for timer in timers]
+        start = time.monotonic()
+        pending = waitForAccess(paths, 2.0, **kwargs)
+        elapsed = time.monotonic() - start
+        [timer.join() for timer in timers]
+        return pending, elapsed
+
+    @skipUnless(isAvailable(), "Requires inotify")
+    def test_inotify(self):
+        pending, elapsed = self._waitForExport((66, 67, 69))
+        self.assertTrue(pending == [], msg=u"Found pending paths: {}".format(
+            pending))
+        self.assertTrue(elapsed < 1.0, msg=u"Waited too long: {}".format(
+            elapsed))
+
+    def test_polling(self):
+        pending, elapsed = self._waitForExport((66, 67), useInotify=False)
+        self.assertTrue(pending == [], msg=u"Found pending paths: {}".format(
+            pending))
+        self.assertTrue(elapsed < 1.0, msg=u"Waited too long: {}".format(
+            elapsed))
+
+    def test_ready_and_timeout(self):
+        self.fake.exportPin(66)
+        path = self.fake.pinPath(66, GPIO._VALUE)
+        start = time.monotonic()
+        self.assertTrue(waitForAccess([path], 1.0) == [])
+        self.assertTrue(time.monotonic() - start < 0.1)
+        path = self.fake.pinPath(67, GPIO._VALUE)
+        self.assertTrue(waitForAccess([path], 0.05) == [path])
+
+
+class TestMMapBackend(unittest.TestCase):
+    BASES = (0x0000, 0x1000, 0x2000, 0x3000)
+
+    def __init__(self, name):
+        super(TestMMapBackend, self).__init__(name)
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.ftruncate(fd, len(self.BASES) * MMapBackend.BANK_SIZE)
+        os.close(fd)
+        self.backend = MMapBackend(self.path, bases=self.BASES)
+
+    def tearDown(self):
+        self.backend.close()
+        os.remove(self.path)
+
+    def _register(self, bank, offset):
+        with open(self.path, 'rb') as f:
+            f.seek(self.BASES[bank] + offset)
+            return struct.unpack('I', f.read(4))[0]
+
+    def _setRegister(self, bank, offset, value):
+        with open(self.path, 'r+b') as f:
+            f.seek(self.BASES[bank] + offset)
+            f.write(struct.pack('I', value))
+
+    def test_write(self):
+        gpioId = 66 # Bank 2 bit 2
+        self.backend.write(gpioId, GPIO.HIGH)
+        value = self._register(2, MMapBackend.SETDATAOUT)
+        self.assertTrue(value == 1 << 2, msg=u"Invalid set register, found: "
+                        u"{}, should have been: {}".format(bin(value), 1 << 2))
+        self.backend.write(gpioId, GPIO.LOW)
+        value = self._register(2, MMapBackend.CLEARDATAOUT)
+        self.assertTrue(value == 1 << 2)
+
+    def test_read(self):
+        self._setRegister(1, MMapBackend.DATAIN, 1 << 12)
+        self.assertTrue(self.backend.read(44) == GPIO.HIGH)
+        self.assertTrue(self.backend.read(45) == GPIO.LOW)
+        self.assertTrue(self.backend.readBank(1) == 1 << 12)
+
+    def test_writeBank(self):
+        self.backend.writeBank(3, 0xDEADBEEF)
+        self.assertTrue(self._register(3, MMapBackend.DATAOUT) == 0xDEADBEEF)
+        self.backend.writeBank(0, 0b1010, mask=0b1111)
+        self.assertTrue(self._register(0, MMapBackend.SETDATAOUT) == 0b1010)
+        self.assertTrue(self._register(0, MMapBackend.CLEARDATAOUT) == 0b0101)
+
+        with self.assertRaises(InvalidArgumentsException):
+            self.backend.setBits(4, 1)
+
+    def test_gpio_backend(self):
+        with FakeSysfs(pins=(66,)):
+            gpio = GPIO(backend=self.backend)
+            gpio.setValue(u'P8_7', GPIO.HIGH)
+            self.assertTrue(
+                self._register(2, MMapBackend.SETDATAOUT) == 1 << 2)
+            self._setRegister(2, MMapBackend.DATAIN, 1 << 2)
+            self.assertTrue(gpio.getValue(u'P8_7') == GPIO.HIGH)
+
+            with Pin(u'P8_7', backend=self.backend) as pin:
+                self.assertTrue(pin.value == GPIO.HIGH)
+
+
+class TestEventReadySet(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestEventReadySet, self).__init__(name)
+
+    def setUp(self):
+        self.event = Event()
+        self.conts = [PipeContainer() for i in range(3)]
+
+    def tearDown(self):
+        self.event.close()
+        [cont.close() for cont in self.conts]
+
+    def test_empty(self):
+        result = self.event.eventWait(timeout=0)
+        self.assertTrue(result == [], msg=u"Found events: {}".format(result))
+
+    def test_ready_pairs(self):
+        for cont in self.conts:
+            self.event.register(cont)
+
+        self.conts[1].fire()
+        result = self.event.eventWait(timeout=0)
+        self.assertTrue(len(result) == 1, msg=u"Found events: {}".format(
+            result))
+        cont, mask = result[0]
+        self.assertTrue(cont is self.conts[1] and mask & Event.INPUT)
+        self.assertTrue(self.event.hasInput(self.conts[1]))
+
+        # Readiness does not persist once cleared.
+        self.conts[1].drain()
+        result = self.event.eventWait(timeout=0)
+        self.assertTrue(result == [], msg=u"Found events: {}".format(result))
+        self.assertFalse(self.event.hasInput(self.conts[1]))
+
+    def test_identifier(self):
+        self.event.register(self.conts[0], identifier='first')
+        self.conts[0].fire()
+        result = self.event.eventWait(timeout=0)
+        self.assertTrue(result[0][0] == 'first', msg=u"Found events: "
+                        u"{}".format(result))
+        self.assertTrue(self.event.unregister(self.conts[0]) == 'first')
+        self.assertTrue(self.event.eventWait(timeout=0) == [])
+
+
+class TestAsyncEvent(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestAsyncEvent, self).__init__(name)
+
+    def _run(self, coro):
+        return asyncio.run(coro)
+
+    def test_edges(self):
+        async def run():
+            asyncEvent = AsyncEvent()
+
+            with PipeContainer() as cont:
+                loop = asyncio.get_running_loop()
+                loop.call_soon(cont.fire, b'1')
+                loop.call_later(0.01, cont.fire, b'0')
+                values = []
+
+                async for value in asyncEvent.edges(cont):
+                    values.append(value)
+
+                    if len(values) == 2:
+                        break
+
+            asyncEvent.close()
+            return values
+
+        values = self._run(run())
+        self.assertTrue(values == [1, 0], msg=u"Invalid values, found: "
+                        u"{}".format(values))
+
+    def test_waitFor(self):
+        async def run():
+            asyncEvent = AsyncEvent()
+
+            with PipeContainer() as cont:
+                # Already has the value.
+                self.assertTrue(await asyncEvent.waitFor(cont, 0) == 0)
+                asyncio.get_running_loop().call_later(0.01, cont.fire, b'1')
+                value = await asyncEvent.waitFor(cont, 1, timeout=1.0)
+                self.assertTrue(value == 1)
+                self.assertTrue(asyncEvent._subscribers == {})
+
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncEvent.waitFor(cont, 0, timeout=0.01)
+
+            asyncEvent.close()
+
+        self._run(run())
+
+    def test_many_waits(self):
+        async def run():
+            asyncEvent = AsyncEvent()
+            conts = [PipeContainer() for i in range(500)]
+            loop = asyncio.get_running_loop()
+
+            for cont in conts:
+                loop.call_soon(cont.fire, b'1')
+
+            values = await asyncio.gather(
+                *[asyncEvent.waitFor(cont, 1, timeout=5.0) for cont in conts])
+            [cont.close() for cont in conts]
+            asyncEvent.close()
+            return values
+
+        values = self._run(run())
+        self.assertTrue(values == [1] * 500)
+
+    def test_closed(self):
+        """
+        Test that a container closed while waited for leaves nothing
+        behind, the next container on its fd is still woken.
+        """
+        async def run():
+            asyncEvent = AsyncEvent()
+            cont = PipeContainer()
+            fd = cont.fileno()
+
+            wait = asyncio.ensure_future(asyncEvent.waitFor(cont, 1,
+                                                            timeout=0.01))
+            # Let it subscribe and start waiting.
+            await asyncio.sleep(0.001)
+            cont.close()
+
+            with self.assertRaises(asyncio.TimeoutError):
+                await wait
+
+            self.assertTrue(asyncEvent._subscribers == {})
+            self.assertTrue(asyncEvent._containers == {})
+
+            with PipeContainer() as cont:
+                self.assertTrue(cont.fileno() == fd)
+                asyncio.get_running_loop().call_later(0.01, cont.fire, b'1')
+                value = await asyncEvent.waitFor(cont, 1, timeout=1.0)
+
+            asyncEvent.close()
+            return value
+
+        self.assertTrue(self._run(run()) == 1)
+
+    def test_AsyncGPIO(self):
+        async def run():
+            with FakeSysfs(pins=(66,)):
+                agpio = AsyncGPIO(GPIO())
+                await agpio.setMode(u'P8_7', direction=GPIO.OUT,
+                                    edge=GPIO.BOTH)
+                d = await agpio.getDirection(u'P8_7')
+                e = await agpio.getEdge(u'P8_7')
+                agpio.close()
+                return d, e
+
+        d, e = self._run(run())
+        self.assertTrue(d == GPIO.OUT and e == GPIO.BOTH, msg=u"Invalid "
+                        u"direction or edge, found: {}, {}".format(d, e))
+
+
+class TestEdgeCapture(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestEdgeCapture, self).__init__(name)
+
+    def test_EdgeRing(self):
+        ring = EdgeRing(4)
+
+        for idx in range(3):
+            ring.append(idx * 10, idx & 1)
+
+        times, values = ring.drain()
+        self.assertTrue(list(times) == [0, 10, 20], msg=u"Invalid times, "
+                        u"found: {}".format(list(times)))
+        self.assertTrue(list(values) == [0, 1, 0])
+        self.assertTrue(len(ring) == 0 and ring.overflows == 0)
+
+        for idx in range(6):
+            ring.append(idx * 10, idx & 1)
+
+        times, values = ring.drain()
+        self.assertTrue(list(times) == [20, 30, 40, 50], msg=u"Invalid "
+                        u"times, found: {}".format(list(times)))
+        self.assertTrue(list(values) == [0, 1, 0, 1])
+        self.assertTrue(ring.overflows == 2)
+
+    def test_Pin_capture(self):
+        with FakeSysfs(pins=(66,)) as fake, Pin(u'P8_7') as pin:
+            pin.enableCapture(8)
+
+            for value in (1, 0, 1):
+                fake.write(66, GPIO._VALUE, value)
+                pin.capture()
+
+            times, values = pin.drain()
+            self.assertTrue(list(values) == [1, 0, 1], msg=u"Invalid values, "
+                            u"found: {}".format(list(values)))
+            self.assertTrue(list(times) == sorted(times))
+            self.assertTrue(pin.captureOverflows == 0)
+
+    def test_Event_hook(self):
+        class Capturing(PipeContainer):
+            def __init__(self):
+                super(Capturing, self).__init__()
+                self.masks = []
+
+            def _onEvent(self, mask):
+                self.masks.append(mask)
+
+        with Capturing() as cont, Event() as event:
+            event.register(cont)
+            cont.fire()
+            event.eventWait(timeout=0)
+            self.assertTrue(len(cont.masks) == 1)
+            event.unregister(cont)
+            event.eventWait(timeout=0)
+            self.assertTrue(len(cont.masks) == 1)
+
+
+class TestSoftPWM(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestSoftPWM, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67, 69)).__enter__()
+        self.pwm = SoftPWM(frequency=500)
+
+    def tearDown(self):
+        self.pwm.close()
+        self.fake.__exit__(None, None, None)
+
+    def test_full_and_off(self):
+        self.pwm.addChannel(u'P8_7', 1.0)
+        self.pwm.addChannel(u'P8_8', 0.0)
+        self.pwm.start()
+        time.sleep(0.02)
+        self.pwm.stop(GPIO.HIGH)
+        self.assertTrue(self.fake.read(66, GPIO._VALUE) == u'1')
+        self.assertTrue(self.fake.read(67, GPIO._VALUE) == u'1')
+        self.assertTrue(self.fake.read(66, GPIO._DIRECTION) == GPIO.OUT)
+
+    def test_schedule_and_stats(self):
+        self.pwm.addChannel(u'P8_7', 0.25)
+        self.pwm.addChannel(u'P8_8', 0.75)
+        self.pwm.addChannel(u'P8_9', 0.25)
+        self.pwm.start()
+        time.sleep(0.05)
+        self.pwm.setDuty(u'P8_9', 0.5)
+        self.pwm.setFrequency(1000)
+        time.sleep(0.05)
+        self.pwm.stop()
+        offsets = [offset for offset, writes in self.pwm._falling]
+        self.assertTrue(offsets == [250000, 500000, 750000], msg=u"Invalid "
+                        u"schedule, found: {}".format(offsets))
+        stats = self.pwm.stats()
+        self.assertTrue(stats['edges'] > 0 and stats['periods'] > 0,
+                        msg=u"Invalid stats: {}".format(stats))
+        self.assertTrue(stats['max_ns'] >= stats['min_ns'] >= 0)
+
+        for gpioId in (66, 67, 69):
+            self.assertTrue(self.fake.read(gpioId, GPIO._VALUE) == u'0')
+
+    def test_removeChannel(self):
+        self.pwm.addChannel(u'P8_7', 0.5)
+        self.pwm.removeChannel(u'P8_7', GPIO.HIGH)
+        self.assertTrue(self.fake.read(66, GPIO._VALUE) == u'1')
+        self.assertTrue(self.pwm._fds == {})
+
+        with self.assertRaises(InvalidArgumentsException):
+            self.pwm.addChannel(u'P8_7', 1.5)
+
+    def test_duplicate(self):
+        """
+        Test that adding a channel twice, under any name, is rejected
+        without opening the pin again.
+        """
+        self.pwm.addChannel(u'P8_7', 0.5)
+        fd = self.pwm._fds[66]
+
+        for pin in (u'P8_7', u'GPIO_66', u'GPIO2_2'):
+            with self.assertRaises(InvalidArgumentsException):
+                self.pwm.addChannel(pin, 0.25)
+
+        self.assertTrue(self.pwm._fds == {66: fd})
+        self.pwm.setDuty(u'GPIO_66', 0.75)
+        self.assertTrue(self.pwm.getDuty(u'P8_7') == 0.75)
+        self.pwm.removeChannel(u'GPIO_66')
+        self.assertTrue(self.pwm._channels == {} and self.pwm._fds == {})
+
+
+class TestFilters(unittest.TestCase):
+    MS = 1000000
+
+    def __init__(self, name):
+        super(TestFilters, self).__init__(name)
+
+    def _accepted(self, filter, samples):
+        return [t for t, v in samples if filter.accept(t, v)]
+
+    def test_FixedWindowFilter(self):
+        f = FixedWindowFilter(10 * self.MS)
+        samples = [(t * self.MS, 0) for t in (0, 1, 2, 9, 10, 11, 25)]
+        accepted = self._accepted(f, samples)
+        self.assertTrue(accepted == [0, 10 * self.MS, 25 * self.MS],
+                        msg=u"Invalid accepted, found: {}".format(accepted))
+        self.assertTrue(f.suppressed == 4 and f.accepted == 3)
+
+    def test_SettleTimeFilter(self):
+        f = SettleTimeFilter(5 * self.MS)
+        # A bouncing press is reported once it settles.
+        for t, v in ((0, 1), (1 * self.MS, 0), (2 * self.MS, 1)):
+            self.assertFalse(f.accept(t, v))
+
+        self.assertTrue(f.deadline == 7 * self.MS)
+        self.assertFalse(f.expire(6 * self.MS))
+        self.assertTrue(f.expire(7 * self.MS) and f.deadline is None)
+        # A glitch that returns the line to 1 is never reported.
+        f.accept(20 * self.MS, 0)
+        f.accept(21 * self.MS, 1)
+        self.assertFalse(f.expire(30 * self.MS))
+        f.accept(40 * self.MS, 0)
+        self.assertTrue(f.expire(45 * self.MS))
+        self.assertTrue(f.accepted == 2 and f.suppressed == 4,
+                        msg=u"Invalid counts, found: {}, {}".format(
+                            f.accepted, f.suppressed))
+
+    def test_Event_settle(self):
+        """
+        Test that a glitch then recovery is not reported and the value the
+        line settles on is, without another event to wake for.
+        """
+        sim = SimBackend(68)
+        sim.setMode(66, direction=GPIO.IN, edge=GPIO.BOTH)
+
+        with Pin('P8_7', backend=sim) as pin, Event() as event:
+            event.register(pin, filter=SettleTimeFilter(20 * self.MS,
+                                                         initial=0))
+            pin.enableCapture()
+            sim.drive(66, 1)
+            self.assertTrue(event.eventWait(timeout=0) == [])
+            sim.drive(66, 0)
+            self.assertTrue(event.eventWait(timeout=0) == [])
+            self.assertTrue(event.eventWait(timeout=0.1) == [])
+            sim.drive(66, 1)
+            start = time.monotonic()
+            # The wake for the edge itself reports nothing.
+            self.assertTrue(event.eventWait(timeout=5) == [])
+            ready = event.eventWait(timeout=5)
+            elapsed = time.monotonic() - start
+            self.assertTrue(len(ready) == 1 and ready[0][0] is pin and
+                            pin.value == 1,
+                            msg=u"Invalid ready, found: {}".format(ready))
+            self.assertTrue(elapsed < 1, msg=u"Invalid elapsed, found: "
+                            u"{}".format(elapsed))
+            # The pin saw every wake, the filtered ones too.
+            self.assertTrue(list(pin.drain()[1]) == [1, 0, 1])
+            event.unregister(pin)
+
+        sim.close()
+
+    def test_MajorityVoteFilter(self):
+        with self.assertRaises(InvalidArgumentsException):
+            MajorityVoteFilter(4)
+
+        f = MajorityVoteFilter(3)
+        samples = list(enumerate((1, 0, 1, 1, 0, 1, 0, 0)))
+        accepted = self._accepted(f, samples)
+        self.assertTrue(accepted == [2, 6], msg=u"Invalid accepted, found: "
+                        u"{}".format(accepted))
+        self.assertTrue(f.suppressed == 6)
+
+    def test_Event_filter(self):
+        with PipeContainer() as cont, Event() as event:
+            f = FixedWindowFilter(60 * 1000 * self.MS)
+            event.register(cont, filter=f)
+            self.assertTrue(event.getFilter(cont) is f)
+            cont.fire()
+            self.assertTrue(len(event.eventWait(timeout=0)) == 1)
+            # Level triggered so it fires again and is dropped.
+            self.assertTrue(event.eventWait(timeout=0) == [])
+            self.assertFalse(event.hasInput(cont))
+            self.assertTrue(f.suppressed == 1)
+
+
+class TestSimBackend(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestSimBackend, self).__init__(name)
+
+    def setUp(self):
+        self.sim = SimBackend()
+        self.gpio = GPIO(backend=self.sim)
+
+    def tearDown(self):
+        self.sim.close()
+
+    def test_configure(self):
+        """
+        Test that the GPIO configuration calls go to the backend.
+        """
+        self.assertTrue(self.gpio.setMode('P8_7', direction=GPIO.OUT))
+        self.assertFalse(self.gpio.setMode('P8_7'))
+        self.assertTrue(self.gpio.getDirection('P8_7') == GPIO.OUT)
+        self.gpio.setEdge('P8_7', GPIO.RISING)
+        self.assertTrue(self.gpio.getEdge('P8_7') == GPIO.RISING)
+        self.gpio.setValue('P8_7', 1)
+        self.assertTrue(self.gpio.getValue('P8_7') == 1)
+
+        with self.assertRaises(InvalidEdgeException):
+            self.gpio.setMode('P8_7', edge='sideways')
+
+        self.assertTrue(self.gpio.cleanup())
+        self.assertTrue(self.sim.getEdge(66) == 'none')
+        self.assertFalse(self.gpio.cleanup('P8_7'))
+
+    def test_Pin_events(self):
+        """
+        Test that a Pin on the backend wakes an Event only on the
+        configured edge.
+        """
+        self.gpio.setMode('P8_7', direction=GPIO.IN, edge=GPIO.RISING)
+
+        with Pin('P8_7', backend=self.sim) as pin, Event() as event:
+            self.assertTrue(pin.edge == GPIO.RISING)
+            event.register(pin)
+            self.assertTrue(event.eventWait(timeout=0) == [])
+            self.assertTrue(self.sim.drive(66, 1))
+            self.assertTrue(event.eventWait(timeout=0) == [
+                (pin, Event.INPUT)])
+            self.assertTrue(pin.value == 1)
+            self.assertFalse(self.sim.drive(66, 0))
+            self.assertTrue(event.eventWait(timeout=0) == [])
+
+    def test_line_fan_in(self):
+        """
+        Test lines beyond the pin names with one Event.
+        """
+        lines = [self.sim.line(gpioId) for gpioId in range(1000, 1100)]
+
+        with Event() as event:
+            for line in lines:
+                self.sim.setEdge(line.gpioId, 'both')
+                event.register(line, identifier=line.gpioId)
+
+            for gpioId in (1003, 1050, 1099):
+                self.sim.toggle(gpioId)
+
+            ready = sorted(gpioId for gpioId, mask in event.eventWait(0))
+            self.assertTrue(ready == [1003, 1050, 1099],
+                            msg=u"Invalid ready, found: {}".format(ready))
+
+        [line.close() for line in lines]
+
+        with self.assertRaises(InvalidArgumentsException):
+            self.sim.line(SimBackend.DEFAULT_LINES)
+
+    def test_generators(self):
+        """
+        Test the scripted, random and quadrature edge generators.
+        """
+        for gpioId in (1, 2, 3):
+            self.sim.setEdge(gpioId, 'both')
+
+        with ScriptedEdges(self.sim, ((1, 1), (2, 1), (1, 0)),
+                           rate=1000) as gen:
+            self.assertTrue(gen.join(1.0))
+
+        self.assertTrue(gen.generated == 3 and self.sim.signalled == 0)
+        self.assertTrue(self.sim.read(1) == 0 and self.sim.read(2) == 1)
+
+        gen = RandomEdges(self.sim, (1, 2, 3), count=50, seed=3)
+        gen.start()
+        self.assertTrue(gen.join(1.0) and gen.generated == 50)
+
+        self.sim.write(1, 0)
+        self.sim.write(2, 0)
+        states = []
+
+        for step in range(4):
+            gen = QuadratureEdges(self.sim, 1, 2, count=1, direction=-1)
+            gen.start()
+            gen.join(1.0)
+            states.append((self.sim.read(1), self.sim.read(2)))
+
+        self.assertTrue(states == [(1, 0), (1, 1), (0, 1), (0, 0)],
+                        msg=u"Invalid states, found: {}".format(states))
+
+
+class TestChardevBackend(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestChardevBackend, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeChardev()
+        self.backend = ChardevBackend(chips=self.fake.paths, io=self.fake)
+        self.gpio = GPIO(backend=self.backend)
+
+    def tearDown(self):
+        self.backend.close()
+
+    def test_packConfig(self):
+        """
+        Test that per line flags, debounce and values survive packing.
+        """
+        flags = [FLAG_INPUT, FLAG_OUTPUT, FLAG_INPUT | FLAG_EDGE_RISING,
+                 FLAG_INPUT]
+        config = packConfig(flags, [0, 0, 500, 0], [0, 1, 0, 0])
+        self.assertTrue(unpackConfig(config, 4) == (
+            flags, [0, 0, 500, 0], [0, 1, 0, 0]))
+
+    def test_setMode(self):
+        """
+        Test that the GPIO calls claim and configure lines.
+        """
+        self.assertTrue(self.backend.chipInfo(2) == ('gpiochip2', 'fake', 32))
+        self.assertTrue(self.gpio.setMode('P8_7', direction=GPIO.IN,
+                                          edge=GPIO.BOTH))
+        self.assertTrue(self.fake.isRequested(66))
+        self.assertTrue(self.gpio.getEdge('P8_7') == GPIO.BOTH)
+        self.backend.setBias(66, ChardevBackend.PULL_UP)
+        self.backend.setDebounce(66, 1000)
+        self.assertTrue(self.fake.lineFlags(66) & FLAG_BIAS_PULL_UP)
+        self.assertTrue(self.fake.lineDebounce(66) == 1000)
+        # Going to an output drops the edge and keeps the bias.
+        self.gpio.setDirection('P8_7', GPIO.OUT)
+        self.assertTrue(self.gpio.getEdge('P8_7') == 'none')
+        self.assertTrue(self.backend.getBias(66) == ChardevBackend.PULL_UP)
+        self.gpio.setValue('P8_7', 1)
+        self.assertTrue(self.fake.value(66) == 1)
+        self.assertTrue(self.gpio.getValue('P8_7') == 1)
+
+        with self.assertRaises(InvalidArgumentsException):
+            self.gpio.setEdge('P8_7', GPIO.RISING)
+
+        self.assertTrue(self.gpio.cleanup('P8_7'))
+        self.assertFalse(self.fake.isRequested(66))
+
+        with self.assertRaises(InvalidArgumentsException):
+            self.gpio.getValue('P8_7')
+
+    def test_bulk(self):
+        """
+        Test that the lines of a request are written with one ioctl and a
+        released line leaves the others claimed.
+        """
+        gpioIds = (44, 45, 46, 47)
+        request = self.backend.request(gpioIds, direction='out',
+                                       values=(1, 0, 0, 1))
+        self.assertTrue([self.fake.value(g) for g in gpioIds] == [1, 0, 0, 1])
+        ioctls = self.fake.ioctls
+        self.backend.writeLines(gpioIds, (0, 1, 1, 0))
+        self.assertTrue(self.fake.ioctls - ioctls == 1)
+        self.assertTrue(request.getValues() == 0b0110)
+        self.assertTrue(self.backend.readLines((47, 45)) == [0, 1])
+
+        with self.assertRaises(InvalidArgumentsException):
+            self.backend.request((44, 66))
+
+        self.assertTrue(self.backend.release(45))
+        self.assertFalse(self.fake.isRequested(45))
+        self.assertTrue(self.backend.readLines((44, 46, 47)) == [0, 1, 0])
+        self.assertTrue(self.backend.getDirection(46) == GPIO.OUT)
+
+    def test_events(self):
+        """
+        Test that a Pin captures the kernel timestamps of the edge events.
+        """
+        self.gpio.setMode('P8_7', direction=GPIO.IN, edge=GPIO.BOTH)
+
+        with Pin('P8_7', backend=self.backend) as pin, Event() as event:
+            pin.enableCapture()
+            event.register(pin)
+            self.fake.drive(66, 1, timestamp=1000)
+            self.fake.drive(66, 0, timestamp=2000)
+            self.fake.drive(66, 1, timestamp=3000)
+            self.assertTrue(len(event.eventWait(timeout=0)) == 1)
+            times, values = pin.drain()
+            self.assertTrue(list(times) == [1000, 2000, 3000],
+                            msg=u"Invalid times, found: {}".format(times))
+            self.assertTrue(list(values) == [1, 0, 1])
+            self.assertTrue(pin.value == 1)
+
+    def test_handles(self):
+        """
+        Test that a handle only sees the events of its own line, keeps
+        those of the other lines for them and lets go of its line when it
+        is released.
+        """
+        self.backend.request((44, 45), edge=GPIO.BOTH)
+        fdA = self.backend.open(44)
+        fdB = self.backend.open(45)
+
+        try:
+            self.fake.drive(44, 1, timestamp=1000)
+            self.fake.drive(45, 1, timestamp=2000)
+            events = self.backend.readEvents(fdA)
+            self.assertTrue(events == [(1000, 1)],
+                            msg=u"Invalid events, found: {}".format(events))
+            # The remaining line is claimed again and its handle follows.
+            self.assertTrue(self.backend.release(44))
+            self.assertFalse(self.fake.isRequested(44))
+            self.assertTrue(self.fake.isRequested(45))
+            self.fake.drive(45, 0, timestamp=3000)
+            events = self.backend.readEvents(fdB)
+            self.assertTrue(events == [(2000, 1), (3000, 0)],
+                            msg=u"Invalid events, found: {}".format(events))
+            self.assertTrue(self.backend.readEvents(fdA) == [])
+            self.assertTrue(self.backend.release())
+            self.assertFalse(self.fake.isRequested(45))
+        finally:
+            self.backend.closeFd(fdA)
+            self.backend.closeFd(fdB)
+
+    def test_shared(self):
+        """
+        Test that two Pins on one request each capture their own edges
+        whichever reads the kernel queue first.
+        """
+        self.backend.request((44, 45), edge=GPIO.BOTH)
+
+        with Pin('GPIO_44', backend=self.backend) as pinA, \
+                 Pin('GPIO_45', backend=self.backend) as pinB, \
+                 Event() as event:
+            pinA.enableCapture()
+            pinB.enableCapture()
+            event.register(pinA)
+            event.register(pinB)
+            self.fake.drive(44, 1, timestamp=1000)
+            self.fake.drive(45, 1, timestamp=2000)
+            self.fake.drive(44, 0, timestamp=3000)
+            event.eventWait(timeout=0)
+            self.fake.drive(45, 0, timestamp=4000)
+            event.eventWait(timeout=0)
+            times, values = pinA.drain()
+            self.assertTrue(list(times) == [1000, 3000],
+                            msg=u"Invalid times, found: {}".format(times))
+            self.assertTrue(list(values) == [1, 0])
+            times, values = pinB.drain()
+            self.assertTrue(list(times) == [2000, 4000],
+                            msg=u"Invalid times, found: {}".format(times))
+            self.assertTrue(list(values) == [1, 0])
+
+
+class TestTracing(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestTracing, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66,)).__enter__()
+
+    def tearDown(self):
+        disableTracing()
+        self.fake.__exit__(None, None, None)
+
+    def test_ring(self):
+        """
+        Test that the ring keeps the newest records and dumps them.
+        """
+        ring = TraceRing(3)
+
+        for value in range(5):
+            ring.record(OP_WRITE, 66, value)
+
+        records = ring.records()
+        self.assertTrue(len(ring) == 3)
+        self.assertTrue([r[3] for r in records] == [2, 3, 4],
+                        msg=u"Invalid records, found: {}".format(records))
+        self.assertTrue(records[0][1:3] == ('write', 66))
+
+        with tempfile.NamedTemporaryFile() as f:
+            ring.dump(f.name)
+            self.assertTrue(readTrace(f.name) == records)
+
+        ring.clear()
+        self.assertTrue(ring.records() == [] and ring.text() == '')
+        # Event records carry an fd in place of the gpioId, either can be
+        # more than a short holds.
+        ring.record(OP_WRITE, 70000, 0x8000000)
+        self.assertTrue(ring.records()[0][1:] == ('write', 70000, 0x8000000))
+
+    def test_disabled(self):
+        """
+        Test that objects made while tracing is off run the plain methods.
+        """
+        gpio = GPIO()
+        self.assertTrue(gpio._tracer is None)
+        self.assertFalse('_writeAttr' in vars(gpio))
+        gpio.cleanup()
+
+    def test_enabled(self):
+        """
+        Test that GPIO and Event operations are recorded.
+        """
+        tracer = enableTracing(16)
+        gpio = GPIO()
+        gpio.setMode('P8_7', direction=GPIO.OUT)
+        gpio.setValue('P8_7', 1)
+        self.assertTrue(gpio.getValue('P8_7') == 1)
+        gpio._export(70)
+
+        with PipeContainer() as cont, Event() as event:
+            event.register(cont)
+            cont.fire()
+            event.eventWait(timeout=0)
+            fd = cont.fileno()
+
+        ops = [(op, gpioId, value) for t, op, gpioId, value
+               in tracer.records()]
+        self.assertTrue(ops[:4] == [('setDirection', 66, 1),
+                                    ('write', 66, 1), ('read', 66, 1),
+                                    ('export', 70, 0)],
+                        msg=u"Invalid records, found: {}".format(ops))
+        self.assertTrue(ops[4][:2] == ('event', fd))
+        gpio.cleanup()
+
+
+class TestCleanup(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestCleanup, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(67,)).__enter__()
+        self.tracer = enableTracing()
+
+    def tearDown(self):
+        disableTracing()
+        BaseGPIO._registry.setStateFile(None)
+        self.fake.__exit__(None, None, None)
+
+    def _export(self, gpio, gpioId):
+        # The fake tree does not create the pin directory on export.
+        self.assertTrue(gpio._export(gpioId))
+        self.fake.exportPin(gpioId)
+
+    def _unexported(self):
+        return sorted(gpioId for t, op, gpioId, value
+                      in self.tracer.records() if op == 'unexport')
+
+    def test_owned(self):
+        """
+        Test that cleanup only unexports the pins this process exported.
+        """
+        gpio = GPIO()
+
+        for gpioId in (66, 68, 69):
+            self._export(gpio, gpioId)
+
+        self.assertTrue(BaseGPIO._registry.pins() == [66, 68, 69])
+        self.assertTrue(sorted(gpio._findActivePins()) == [66, 67, 68, 69])
+        self.assertTrue(gpio.cleanup())
+        self.assertTrue(self._unexported() == [66, 68, 69],
+                        msg=u"Invalid unexports, found: {}".format(
+                            self._unexported()))
+        self.assertTrue(BaseGPIO._registry.pins() == [])
+        self.tracer.clear()
+        self.assertTrue(gpio.cleanup(force=True))
+        self.assertTrue(67 in self._unexported())
+
+    def test_state_file(self):
+        """
+        Test that pins left by a dead process are adopted and cleaned up.
+        """
+        with tempfile.TemporaryDirectory() as path:
+            name = os.path.join(path, 'gpio.state')
+            child = subprocess.Popen(['true'])
+            child.wait()
+
+            with open(name, 'w') as f:
+                json.dump({'pid': child.pid, 'pins': [69]}, f)
+
+            self.fake.exportPin(69)
+            gpio = GPIO(stateFile=name)
+            self._export(gpio, 66)
+
+            with open(name) as f:
+                state = json.load(f)
+
+            self.assertTrue(state == {'pid': os.getpid(), 'pins': [66, 69]},
+                            msg=u"Invalid state, found: {}".format(state))
+            gpio.cleanup()
+            self.assertTrue(self._unexported() == [66, 69])
+
+            with open(name) as f:
+                self.assertTrue(json.load(f)['pins'] == [])
+
+            BaseGPIO._registry.setStateFile(None)
+
+            with open(name, 'w') as f:
+                json.dump({'pid': os.getppid(), 'pins': [69]}, f)
+
+            self.assertRaises(InvalidArgumentsException, GPIO,
+                              stateFile=name)
+
+
+class TestTransaction(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestTransaction, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67, 69)).__enter__()
+
+    def tearDown(self):
+        self.fake.__exit__(None, None, None)
+
+    def test_commit(self):
+        """
+        Test that staged modes are applied together and timed per pin.
+        """
+        gpio = GPIO()
+
+        with gpio.transaction(workers=2) as txn:
+            txn.stage('P8_7', direction=GPIO.OUT)
+            txn.stage('P8_8', direction=GPIO.IN).stage('P8_8', edge=GPIO.BOTH)
+            txn.stage('P8_9', activeLow=True)
+            self.assertTrue(len(txn) == 3)
+            self.assertRaises(InvalidDirectionException, txn.stage, 'P8_7',
+                              direction='up')
+
+        attrs = [self.fake.read(gpioId, attr) for gpioId, attr in (
+            (66, 'direction'), (67, 'direction'), (67, 'edge'),
+            (69, 'active_low'))]
+        self.assertTrue(attrs == ['out', 'in', 'both', '1'],
+                        msg=u"Invalid attributes, found: {}".format(attrs))
+        self.assertTrue(sorted(txn.report['pins']) == [66, 67, 69])
+        self.assertTrue(txn.report['total'] >= txn.report['configure'])
+
+        with self.assertRaises(ValueError):
+            with gpio.transaction() as txn:
+                txn.stage('P8_7', direction=GPIO.IN)
+                raise ValueError()
+
+        self.assertTrue(self.fake.read(66, 'direction') == 'out')
+
+    def test_rollback(self):
+        """
+        Test that a failed pin puts every pin back as it was.
+        """
+        gpio = GPIO()
+        path = self.fake.pinPath(67, 'edge')
+        os.remove(path)
+        os.mkdir(path)
+        txn = Transaction(gpio)
+        txn.stage('P8_7', direction=GPIO.OUT)
+        txn.stage('P8_9', activeLow=True)
+        txn.stage('P8_8', edge=GPIO.RISING)
+
+        with self.assertRaises(TransactionException) as cm:
+            txn.commit()
+
+        self.assertTrue(list(cm.exception.errors) == [67])
+        self.assertTrue(self.fake.read(66, 'direction') == 'in')
+        self.assertTrue(self.fake.read(69, 'active_low') == '0')
+
+    def test_backend(self):
+        """
+        Test that a backend failure releases the lines claimed.
+        """
+        sim = SimBackend(68)
+        gpio = GPIO(backend=sim)
+        txn = gpio.transaction()
+        txn.stage('P8_7', direction=GPIO.OUT)
+        txn.stage('P8_8', direction=GPIO.IN, edge=GPIO.FALLING)
+        txn.commit()
+        self.assertTrue(sim.getEdge(67) == GPIO.FALLING)
+        self.assertTrue(sim.getDirection(66) == GPIO.OUT)
+        gpio.cleanup()
+        txn.stage('P8_7', direction=GPIO.OUT)
+        txn.stage('P8_9', direction=GPIO.IN)
+        self.assertRaises(TransactionException, txn.commit)
+        self.assertFalse(sim.release(66))
+        sim.close()
+
+
+class TestShadowState(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestShadowState, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67)).__enter__()
+
+    def tearDown(self):
+        self.fake.__exit__(None, None, None)
+
+    def test_redundant_writes(self):
+        """
+        Test that writes of known state are skipped and reads answered.
+        """
+        gpio = GPIO(shadow=True)
+        gpio.setMode('P8_7', direction=GPIO.OUT)
+        gpio.setValue('P8_7', 1)
+        # Only changes made outside the GPIO object show redundant writes.
+        self.fake.write(66, 'value', '0')
+        self.fake.write(66, 'direction', 'in')
+        gpio.setValue('P8_7', True)
+        gpio.setDirection('P8_7', GPIO.OUT)
+        self.assertTrue(self.fake.read(66, 'value') == '0')
+        self.assertTrue(gpio.getValue('P8_7') == 1)
+        self.assertTrue(gpio.getDirection('P8_7') == GPIO.OUT)
+        gpio.invalidate('P8_7')
+        self.assertTrue(gpio.getDirection('P8_7') == GPIO.IN)
+        gpio.setDirection('P8_7', 'high')
+        self.assertTrue(gpio.getValue('P8_7') == 1)
+        self.assertFalse(gpio.getActiveLow('P8_8'))
+        gpio.setActiveLow('P8_8', True)
+        self.assertTrue(self.fake.read(67, 'active_low') == '1')
+        self.assertTrue(gpio.getActiveLow('P8_8'))
+        # The shadowed value is dropped when active_low flips.
+        gpio.setValue('P8_7', 1)
+        gpio.setActiveLow('P8_7', True)
+        self.fake.write(66, 'value', '0')
+        gpio.setValue('P8_7', 1)
+        self.assertTrue(self.fake.read(66, 'value') == '1')
+        gpio.cleanup('P8_8')
+        self.assertTrue(gpio._shadow.get(67, 'active_low') is None)
+        gpio.cleanup()
+
+    def test_coalesce(self):
+        """
+        Test that outputs set faster than the tick write the latest value.
+        """
+        gpio = GPIO(coalesce=0.05)
+        gpio.setMode('P8_7', direction=GPIO.OUT)
+        gpio.setValue('P8_7', 1)
+        self.assertTrue(self.fake.read(66, 'value') == '1')
+        cached = len(gpio._fdCache)
+
+        for value in (0, 1, 0):
+            gpio.setValue('P8_7', value)
+
+        self.assertTrue(self.fake.read(66, 'value') == '1')
+        self.assertTrue(gpio.getValue('P8_7') == 0)
+        time.sleep(0.15)
+        self.assertTrue(self.fake.read(66, 'value') == '0')
+        # The flusher thread does not use the shared descriptor cache.
+        self.assertTrue(len(gpio._fdCache) == cached)
+        gpio.setValue('P8_7', 1)
+        gpio.flush()
+        self.assertTrue(self.fake.read(66, 'value') == '1')
+        gpio.setValue('P8_7', 0)
+        gpio.cleanup()
+        self.assertTrue(gpio._flusher is None and not gpio._pending)
+
+
+class TestPinSet(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestPinSet, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67)).__enter__()
+
+    def tearDown(self):
+        self.fake.__exit__(None, None, None)
+
+    def test_handles(self):
+        """
+        Test that handles read values and cached attributes without a dict.
+        """
+        with PinSet(('P8_7', 'P8_8', 66)) as pins:
+            self.assertTrue(len(pins) == 3 and list(pins.gpioIds) == [66, 67,
+                                                                      66])
+            self.assertTrue(len(set(pins.fds)) == 3)
+            handle = pins.handle('P8_8')
+            self.assertTrue(handle is pins[1] and handle.gpioId == 67)
+            self.assertFalse(hasattr(handle, '__dict__'))
+            self.fake.write(67, 'value', '1')
+            self.assertTrue(handle.value == 1)
+            self.assertTrue(pins.values() == [0, 1, 0])
+            self.assertTrue(handle.direction == 'in')
+            self.fake.write(67, 'direction', 'out')
+            self.assertTrue(handle.direction == 'in')
+
+        self.assertTrue(pins.isClosed and handle.isClosed)
+        self.assertTrue(len(pins.fds) == 0)
+
+    def test_register(self):
+        """
+        Test that the handles are registered with an Event in bulk.
+        """
+        sim = SimBackend(16)
+
+        for gpioId in range(16):
+            sim.setMode(gpioId, direction='in', edge='both')
+
+        with PinSet(range(16), backend=sim) as pins, Event() as event:
+            pins.register(event, filterFactory=lambda: FixedWindowFilter(0))
+            sim.drive(5, 1)
+            ready = event.eventWait(timeout=0)
+            self.assertTrue(len(ready) == 1 and ready[0][0] is pins[5],
+                            msg=u"Invalid ready, found: {}".format(ready))
+            self.assertTrue(pins[5].value == 1 and pins[5].edge == 'both')
+            self.assertTrue(event.getFilter(pins[5]) is not
+                            event.getFilter(pins[6]))
+            pins.unregister(event)
+
+        sim.close()
+
+    def test_drain(self):
+        """
+        Test that the backend edge queue of a handle is drained each time
+        the Event wakes for it.
+        """
+        fake = FakeChardev()
+        backend = ChardevBackend(chips=fake.paths, io=fake)
+        backend.request((66,), edge=GPIO.BOTH)
+
+        with PinSet((66,), backend=backend) as pins, Event() as event:
+            pins.register(event)
+
+            # More edges than the pipe of a fake request holds.
+            for idx in range(3000):
+                self.assertTrue(fake.drive(66, idx & 1 ^ 1))
+                ready = event.eventWait(timeout=0)
+                self.assertTrue(len(ready) == 1 and ready[0][0] is pins[0])
+
+            pins.unregister(event)
+
+        backend.close()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestMetrics, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66,)).__enter__()
+
+    def tearDown(self):
+        disableMetrics()
+        self.fake.__exit__(None, None, None)
+
+    def test_histogram(self):
+        """
+        Test that observations land in the right buckets and snapshots.
+        """
+        metrics = Metrics(numPins=8, buckets=(1000, 10000))
+        metrics.observe(METRIC_READ, 3, 500)
+        metrics.observe(METRIC_READ, 3, 5000)
+        metrics.observe(METRIC_READ, 3, 50000)
+        metrics.observe(METRIC_READ, 99, 10)
+        series = metrics.snapshot()['read']['3']
+        self.assertTrue(series['buckets'] == {'1000': 1, '10000': 2,
+                                              'inf': 3},
+                        msg=u"Invalid buckets, found: {}".format(series))
+        self.assertTrue(series['count'] == 3 and series['sum_ns'] == 55500)
+        self.assertTrue(metrics.count('read', metrics.NO_PIN) == 1)
+        self.assertTrue(metrics.count('read') == 4)
+        metrics.reset()
+        self.assertTrue(metrics.snapshot() == {})
+        self.assertRaises(InvalidArgumentsException, Metrics,
+                          buckets=(10, 5))
+
+    def test_threads(self):
+        """
+        Test that observations from several threads are all counted.
+        """
+        metrics = Metrics(numPins=8)
+
+        def observe():
+            for ns in range(20000):
+                metrics.observe(METRIC_READ, 3, ns)
+
+        threads = [threading.Thread(target=observe) for idx in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        series = metrics.snapshot()['read']['3']
+        self.assertTrue(series['count'] == 80000,
+                        msg=u"Invalid count, found: {}".format(series))
+        self.assertTrue(series['sum_ns'] == 4 * sum(range(20000)))
+
+    def test_disabled(self):
+        """
+        Test that objects made while metrics are off run the plain methods.
+        """
+        gpio = GPIO()
+        self.assertTrue(gpio._metrics is None)
+        self.assertFalse('setValue' in vars(gpio))
+        gpio.cleanup()
+
+    def test_enabled(self):
+        """
+        Test that GPIO, Pin and Event operations are counted and dumped.
+        """
+        metrics = enableMetrics()
+        gpio = GPIO()
+        gpio.setMode('P8_7', direction=GPIO.OUT)
+        gpio.setValue('P8_7', 1)
+        gpio.setValue('P8_7', 0)
+        self.assertTrue(gpio.getValue('P8_7') == 0)
+        self.assertRaises(InvalidPinNomenclatureException, gpio.setValue,
+                          'P10_1', 1)
+        pin = Pin('P8_7')
+        self.assertTrue(pin.value == 0)
+
+        with PipeContainer() as cont, Event() as event:
+            event.register(cont)
+            event.eventWait(timeout=0)
+            cont.fire()
+            event.eventWait(timeout=0)
+
+        counts = [metrics.count(op, 66)
+                  for op in ('setMode', 'write', 'read')]
+        self.assertTrue(counts == [1, 2, 2],
+                        msg=u"Invalid counts, found: {}".format(counts))
+        self.assertTrue(metrics.count('eventWait') == 1)
+
+        with tempfile.TemporaryDirectory() as path:
+            name = os.path.join(path, 'gpio.json')
+            metrics.dump(name)
+
+            with open(name) as f:
+                data = json.load(f)
+
+            self.assertTrue(data['ops']['write']['66']['count'] == 2)
+            name = os.path.join(path, 'gpio.prom')
+            metrics.dump(name, format='prometheus')
+
+            with open(name) as f:
+                text = f.read()
+
+            self.assertTrue(
+                '# TYPE gpio_op_duration_seconds histogram' in text)
+            self.assertTrue('gpio_op_duration_seconds_count{op="write",'
+                            'pin="66"} 2' in text, msg=text)
+            self.assertTrue('le="+Inf"' in text)
+            self.assertRaises(InvalidArgumentsException, metrics.dump, name,
+                              format='xml')
+
+        pin.close()
+        gpio.cleanup()
+
+
+class TestBroker(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestBroker, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67)).__enter__()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'gpio.sock')
+
+    def tearDown(self):
+        self.fake.__exit__(None, None, None)
+        shutil.rmtree(self.tmp)
+
+    def _start(self, **kwargs):
+        broker = GPIOBroker(self.path, **kwargs)
+        broker.start()
+        return broker
+
+    def test_requests(self):
+        """
+        Test that requests through a proxy act on the broker's pins.
+        """
+        broker = self._start()
+
+        with GPIOProxy(self.path) as proxy:
+            self.assertTrue(proxy.ping() == 0)
+            proxy.setMode('P8_7', direction=GPIO.OUT)
+            proxy.setValue('P8_7', 1)
+            self.assertTrue(self.fake.read(66, 'value') == '1')
+            self.assertTrue(proxy.getValue('P8_7') == 1)
+            self.assertTrue(proxy.getDirection('P8_7') == GPIO.OUT)
+            proxy.setEdge('P8_8', GPIO.FALLING)
+            self.assertTrue(proxy.getEdge('P8_8') == GPIO.FALLING)
+            self.assertRaises(InvalidDirectionException, proxy.setDirection,
+                              'P8_7', 'up')
+            os.remove(self.fake.pinPath(67, 'direction'))
+            self.assertRaises(OSError, proxy.getDirection, 'P8_8')
+            # The connection survives a failed request.
+            self.assertTrue(proxy.getValue('P8_7') == 1)
+
+        broker.close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_pipeline(self):
+        """
+        Test that pipelined requests are answered together in order.
+        """
+        broker = self._start()
+
+        with GPIOProxy(self.path) as proxy:
+            with proxy.pipeline() as pipe:
+                pipe.setMode('P8_7', direction=GPIO.OUT)
+                pipe.setValue('P8_7', 1).getValue('P8_7')
+                pipe.getDirection('P8_7')
+                self.assertTrue(len(pipe) == 4)
+
+            self.assertTrue(pipe.results == [True, None, 1, GPIO.OUT],
+                            msg=u"Invalid results, found: {}".format(
+                                pipe.results))
+            pipe.getValue('P8_7')
+            pipe.getValue('P8_9')
+
+            with self.assertRaises(OSError):
+                pipe.execute()
+
+            self.assertTrue(pipe.results[0] == 1)
+
+        broker.close()
+
+    def test_subscribe(self):
+        """
+        Test that edges are pushed to every subscriber and a closed client
+        is dropped.
+        """
+        sim = SimBackend(68)
+        sim.setMode(67, direction=GPIO.IN, edge=GPIO.BOTH)
+        broker = self._start(backend=sim)
+        first, second = GPIOProxy(self.path), GPIOProxy(self.path)
+        seen = []
+        self.assertTrue(first.subscribe(
+            'P8_8', lambda *event: seen.append(event)) == 0)
+        self.assertTrue(second.subscribe('P8_8') == 0)
+        sim.drive(67, 1)
+        events = first.readEvents(timeout=1)
+        self.assertTrue([e[:2] for e in events] == [(67, 1)],
+                        msg=u"Invalid events, found: {}".format(events))
+        self.assertTrue(seen == events)
+        # Events arriving during a request are kept for readEvents.
+        sim.drive(67, 0)
+        time.sleep(0.05)
+        self.assertTrue(second.getValue('P8_8') == 0)
+        self.assertTrue([e[:2] for e in second.readEvents()] ==
+                        [(67, 1), (67, 0)])
+        first.close()
+        second.unsubscribe('P8_8')
+        second.ping()
+        self.assertTrue(broker._pins == {})
+        second.close()
+        broker.close()
+        sim.close()
+
+    def test_timeout(self):
+        """
+        Test that a pipeline gives up on a timeout and the late responses
+        are dropped.
+        """
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen(1)
+
+        with server, GPIOProxy(self.path, timeout=0.1) as proxy:
+            pipe = proxy.pipeline().getValue('P8_7').getValue('P8_8')
+
+            with self.assertRaises(socket.timeout):
+                pipe.execute()
+
+            conn = server.accept()[0]
+
+            with conn:
+                conn.sendall(b''.join(MESSAGE.pack(
+                    seq, OP_GET_VALUE, 0, 66, seq, 0) for seq in (1, 2, 3)))
+                self.assertTrue(proxy.getValue('P8_7') == 3)
+                self.assertTrue(proxy._responses == {})
+                # Half an event is kept until the rest of it comes.
+                event = MESSAGE.pack(0, OP_EVENT, 0, 67, 1, 1000)
+                conn.sendall(event[:5])
+                self.assertTrue(proxy.readEvents() == [])
+                conn.sendall(event[5:])
+                events = proxy.readEvents(timeout=1)
+                self.assertTrue(events == [(67, 1, 1000)],
+                                msg=u"Invalid events, found: {}".format(
+                                    events))
+
+
+class TestRecorder(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestRecorder, self).__init__(name)
+
+    def setUp(self):
+        self.sim = SimBackend(68)
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'test.edges')
+
+    def tearDown(self):
+        self.sim.close()
+        shutil.rmtree(self.tmp)
+
+    def test_records(self):
+        """
+        Test that records are appended and read back in order.
+        """
+        with EdgeRecorder(self.path, bufferSize=RECORD.size) as recorder:
+            recorder.record(66, 1, 1000)
+            recorder.record(67, 0, 2000)
+
+        with EdgeRecorder(self.path) as recorder:
+            self.assertTrue(recorder.count == 2)
+            recorder.record(66, 0, 3000)
+
+        with open(self.path, 'ab') as f:
+            f.write(b'\0' * 5)
+
+        records = list(readRecords(self.path, chunk=2))
+        self.assertTrue(records == [(1000, 66, 1), (2000, 67, 0),
+                                    (3000, 66, 0)],
+                        msg=u"Invalid records, found: {}".format(records))
+
+        with open(self.path, 'r+b') as f:
+            f.write(b'XXXX')
+
+        self.assertRaises(InvalidArgumentsException, EdgeRecorder, self.path)
+
+    def test_pin(self):
+        """
+        Test that a pin records its value each time an Event wakes for it.
+        """
+        self.sim.setMode(66, direction=GPIO.IN, edge=GPIO.BOTH)
+
+        with EdgeRecorder(self.path) as recorder, \
+                 Pin('P8_7', backend=self.sim) as pin, Event() as event:
+            pin.enableRecording(recorder)
+            event.register(pin)
+
+            for value in (1, 0, 1):
+                self.sim.drive(66, value)
+                event.eventWait(timeout=0)
+
+            pin.disableRecording()
+            self.sim.drive(66, 0)
+            event.eventWait(timeout=0)
+            event.unregister(pin)
+
+        records = list(readRecords(self.path))
+        self.assertTrue([r[1:] for r in records] == [(66, 1), (66, 0),
+                                                     (66, 1)],
+                        msg=u"Invalid records, found: {}".format(records))
+
+    def test_replay(self):
+        """
+        Test that a replay dispatches every record through an Event and
+        keeps the recorded timing.
+        """
+        with EdgeRecorder(self.path) as recorder:
+            for idx in range(20):
+                recorder.record(66, (idx + 1) & 1, idx * 1000000)
+
+        self.sim.setMode(67, direction=GPIO.IN, edge=GPIO.BOTH)
+        seen = []
+
+        with Pin('P8_8', backend=self.sim) as pin, Event() as event:
+            event.register(pin)
+            replayer = EdgeReplayer(self.sim, self.path, speed=0,
+                                    gpioMap={66: 67})
+            self.assertTrue(replayer.play(
+                event, lambda container, mask: seen.append(
+                    container.value)) == 20)
+            event.unregister(pin)
+
+        self.assertTrue(seen == [1, 0] * 10,
+                        msg=u"Invalid values, found: {}".format(seen))
+        replayer = EdgeReplayer(self.sim, self.path, speed=2.0, count=11)
+        start = time.monotonic()
+        replayer.start()
+        self.assertTrue(replayer.join(timeout=5))
+        elapsed = time.monotonic() - start
+        self.assertTrue(replayer.generated == 11)
+        self.assertTrue(0.005 <= elapsed < 1,
+                        msg=u"Invalid elapsed, found: {}".format(elapsed))
+        self.assertRaises(InvalidArgumentsException, EdgeReplayer, self.sim,
+                          self.path, speed=-1)
+
+
+class TestSnapshot(unittest.TestCase):
+
+    class Encoder(object):
+        position = 0
+
+    def __init__(self, name):
+        super(TestSnapshot, self).__init__(name)
+
+    def setUp(self):
+        self.sim = SimBackend(68)
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'snapshot')
+
+    def tearDown(self):
+        self.sim.close()
+        shutil.rmtree(self.tmp)
+
+    def test_publish(self):
+        """
+        Test that a reader sees the pins and encoders of the last publish.
+        """
+        encoder = self.Encoder()
+
+        with SnapshotPublisher(('P8_7', 'P8_8'), encoders={'left': encoder},
+                               path=self.path, backend=self.sim) as pub:
+            reader = SnapshotReader(self.path)
+            self.assertTrue(reader.names == ('P8_7', 'P8_8', 'left'))
+            self.assertTrue(reader.snapshot() ==
+                            {'P8_7': 0, 'P8_8': 0, 'left': 0})
+            self.sim.drive(67, 1)
+            encoder.position = -12
+            self.assertTrue(pub.publish() == 4)
+            sequence, timestamp, values = reader.read()
+            self.assertTrue(sequence == 4 and values == (0, 1, -12),
+                            msg=u"Invalid read, found: {}, {}".format(
+                                sequence, values))
+            self.assertTrue(timestamp <= time.monotonic_ns())
+            self.assertTrue(reader.get('left') == -12)
+            self.assertRaises(InvalidArgumentsException, SnapshotPublisher,
+                              ('P8_7', 'P8_7'), path=self.path,
+                              backend=self.sim)
+
+        # Readers keep the last values after the publisher is closed.
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(reader.values() == (0, 1, -12))
+        reader.close()
+
+    def test_in_progress(self):
+        """
+        Test that a reader retries while a publish is in progress.
+        """
+        with SnapshotPublisher(('P8_7',), path=self.path,
+                               backend=self.sim) as pub:
+            reader = SnapshotReader(self.path, timeout=0.01)
+            SEQUENCE.pack_into(pub._map, pub._offset, pub.sequence + 1)
+            self.assertRaises(TimeoutError, reader.read)
+            self.assertTrue(reader.retries > 0)
+            pub.publish()
+            self.assertTrue(reader.values() == (0,))
+            reader.close()
+
+    def test_processes(self):
+        """
+        Test that another process reads what the publisher thread publishes.
+        """
+        encoder = self.Encoder()
+        encoder.position = 7
+        script = ("from core.utils.snapshot import SnapshotReader\n"
+                  "print(SnapshotReader({!r}).get('right'))").format(
+                      self.path)
+
+        with SnapshotPublisher((), encoders={'right': encoder},
+                               path=self.path) as pub:
+            pub.start(interval=0.001)
+            output = subprocess.check_output(
+                [sys.executable, '-c', script], cwd=os.getcwd())
+
+        self.assertTrue(output.strip() == b'7',
+                        msg=u"Invalid output, found: {}".format(output))
+
+
+class TestConfigLogger(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestConfigLogger, self).__init__(name)
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, name))
+
+        os.rmdir(self.path)
+
+    def _config(self, name, **kwargs):
+        log = ConfigLogger(self.path).config(name, name + '.log',
+                                             level=logging.DEBUG, queued=True,
+                                             **kwargs)
+        log.propagate = False
+        return log
+
+    def _close(self, log):
+        for handler in log.handlers[:]:
+            log.removeHandler(handler)
+            handler.close()
+
+        return handler
+
+    def test_queued(self):
+        """
+        Test that queued records are all written and rotated by size.
+        """
+        log = self._config('queued', maxBytes=4096, backupCount=2)
+
+        for i in range(300):
+            log.debug("record %d", i)
+
+        handler = self._close(log)
+        self.assertTrue(handler.dropped == 0)
+        names = sorted(os.listdir(self.path))
+        self.assertTrue(names == ['queued.log', 'queued.log.1',
+                                  'queued.log.2'],
+                        msg=u"Invalid files, found: {}".format(names))
+
+        for name in names:
+            size = os.path.getsize(os.path.join(self.path, name))
+            self.assertTrue(size <= 4096, msg=u"Invalid size of {}, found: "
+                            u"{}".format(name, size))
+
+        with open(os.path.join(self.path, 'queued.log')) as f:
+            self.assertTrue(f.read().splitlines()[-1].endswith("record 299"))
+
+    def test_dropped(self):
+        """
+        Test that a full queue drops and counts records without blocking.
+        """
+        records = collections.deque(maxlen=2)
+        handler = DroppingQueueHandler(records)
+        log = logging.getLogger('dropped')
+        log.propagate = False
+        log.addHandler(handler)
+
+        for i in range(5):
+            log.warning("record %d", i)
+
+        log.removeHandler(handler)
+        self.assertTrue(handler.dropped == 3 and len(records) == 2)
+        self.assertTrue([r.msg for r in records] == ["record 0", "record 1"])
+
+        with self.assertRaises(InvalidArgumentsException):
+            ConfigLogger(self.path).config('dropped', queued=True)
+
+    def test_batches(self):
+        """
+        Test that every record of several full batches is written and the
+        writer stops, and that args changed after the call are not logged.
+        """
+        records = collections.deque()
+        handler = DroppingQueueHandler(records)
+        handler.writer = BatchFileWriter(
+            os.path.join(self.path, 'batches.log'), records,
+            logging.Formatter('%(message)s'), handler=handler, batchSize=4)
+        log = logging.getLogger('batches')
+        log.propagate = False
+        log.setLevel(logging.DEBUG)
+        log.addHandler(handler)
+        args = [0]
+
+        for i in range(19):
+            log.debug("m%d", i)
+
+        log.debug("args %s", args)
+        args.append(1)
+        # Queue everything before the writer starts so the batches are full.
+        handler.writer.start()
+        stopper = threading.Thread(target=handler.close)
+        stopper.start()
+        stopper.join(timeout=5)
+        self.assertFalse(stopper.is_alive(), msg=u"The writer did not stop.")
+        log.removeHandler(handler)
+
+        with open(os.path.join(self.path, 'batches.log')) as f:
+            lines = f.read().splitlines()
+
+        self.assertTrue(lines == ["m{}".format(i) for i in range(19)] +
+                        ["args [0]"],
+                        msg=u"Invalid lines, found: {}".format(lines))
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_runSuite(self):
+        """
+        Test that the selected benchmarks run and return their results.
+        """
+        results = benchmarks.runSuite(('setMode', 'cleanup_64'), scale=0.01)
+        self.assertEqual(set(results), {'setMode', 'cleanup_64'})
+        self.assertEqual(results['cleanup_64']['pins'], 64)
+        self.assertTrue(results['setMode']['p50_us'] > 0)
+
+    def test_compareResults(self):
+        """
+        Test that only metrics worse than the tolerance are reported.
+        """
+        baseline = {'a': {'x_per_sec': 100.0, 'y_ns': 100.0, 'max_us': 1.0,
+                          'pins': 8}}
+        results = {'a': {'x_per_sec': 95.0, 'y_ns': 120.0, 'max_us': 9.0,
+                         'pins': 1}}
+        self.assertEqual(benchmarks.compareResults(baseline, results, 0.1),
+                         [('a', 'y_ns', 100.0, 120.0)])
+        results['a']['x_per_sec'] = 50.0
+        self.assertEqual(len(benchmarks.compareResults(baseline, results)), 2)
+
+
+class TestFDCache(unittest.TestCase):
+
+    def __init__(self, name):
+        super(TestFDCache, self).__init__(name)
+
+    def setUp(self):
+        self.fake = FakeSysfs(pins=(66, 67, 69)).__enter__()
+        self.gpio = GPIO(cacheSize=2)
+
+    def tearDown(self):
+        self.gpio._fdCache.close()
+        self.fake.__exit__(None, None, None)
+
+    def test_setValue_getValue(self):
+        pin = u'P8_7'
+        self.gpio.setValue(pin, GPIO.HIGH)
+        value = self.fake.read(66, GPIO._VALUE)
+        self.assertTrue(value == u'1', msg=u"Invalid value, found: {}, "
+                        u"should have been: 1".format(value))
+        self.gpio.setValue(pin, GPIO.LOW)
+        value = self.gpio.getValue(pin)
+        self.assertTrue(value == GPIO.LOW, msg=u"Invalid value, found: {}, "
+                        u"should have been: {}".format(value, GPIO.LOW))
+        self.assertTrue(len(self.gpio._fdCache) == 1)
+
+    def test_direction_shorter_value(self):
+        pin = u'P8_7'
+        self.gpio.setDirection(pin, GPIO.OUT)
+        self.gpio.setDirection(pin, GPIO.IN)
+        d = self.gpio.getDirection(pin)
+        self.assertTrue(d == GPIO.IN, msg=u"Invalid direction, found: {}, "
+                        u"should have been: {}.".format(d, GPIO.IN))
+
+    def test_eviction(self):
+        for pin in (u'P8_7', u'P8_8', u'P8_9'):
+            self.gpio.setValue(pin, GPIO.HIGH)
+
+        cache = self.gpio._fdCache
+        self.assertTrue(len(cache) == 2)
+        self.assertTrue(cache.get(66, GPIO._VALUE) is None)
+        self.assertTrue(cache.get(69, GPIO._VALUE) is not None)
+
+    def test_cleanup_invalidates(self):
+        self.gpio.setValue(u'P8_7', GPIO.HIGH)
+        self.gpio.setValue(u'P8_8', GPIO.HIGH)
+        self.gpio.cleanup(u'P8_7')
+        cache = self.gpio._fdCache
+        self.assertTrue(cache.get(66, GPIO._VALUE) is None)
+        self.assertTrue(cache.get(67, GPIO._VALUE) is not None)
+        self.gpio.cleanup()
+        self.assertTrue(len(cache) == 0)
+
+    def test_stale_descriptor(self):
+        self.gpio.setValue(u'P8_7', GPIO.HIGH)
+        fd = self.gpio._fdCache.get(66, GPIO._VALUE)
+        os.close(fd)
+        self.gpio.setValue(u'P8_7', GPIO.LOW)
+        value = self.fake.read(66, GPIO._VALUE)
+        self.assertTrue(value == u'0', msg=u"Invalid value, found: {}, "
+                        u"should have been: 0".format(value))
 
 
 if __name__ == '__main__':
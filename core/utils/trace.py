@@ -0,0 +1,164 @@
+#
+# core/utils/trace.py
+#
+
+"""
+Low overhead tracing of GPIO operations. While tracing is disabled nothing
+is recorded and the GPIO, Pin and Event objects run their normal methods,
+objects constructed after enableTracing() record each operation into a
+binary ring of fixed size records that can be read or dumped on demand.
+
+    tracer = enableTracing()
+    gpio = GPIO()
+    ...
+    tracer.dump('/tmp/gpio.trace')
+    print(tracer.text())
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time, struct, threading
+
+# Operation codes, the index in OPS.
+OPS = ('', 'read', 'write', 'getDirection', 'setDirection', 'getEdge',
+       'setEdge', 'export', 'unexport', 'event')
+(OP_READ, OP_WRITE, OP_GET_DIRECTION, OP_SET_DIRECTION, OP_GET_EDGE,
+ OP_SET_EDGE, OP_EXPORT, OP_UNEXPORT, OP_EVENT) = range(1, len(OPS))
+# Attribute values stored as ints.
+VALUE_CODES = {'0': 0, '1': 1, 'in': 0, 'out': 1, 'none': 0, 'rising': 1,
+               'falling': 2, 'both': 3}
+# timestamp_ns, op, gpioId (the fd for events), value (the mask for events)
+RECORD = struct.Struct('=qB3xii')
+
+_tracer = None
+
+
+class TraceRing(object):
+    """
+    A ring of capacity RECORD sized records in one preallocated bytearray,
+    when full the oldest records are overwritten.
+    """
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._capacity = max(1, capacity)
+        self._buf = bytearray(RECORD.size * self._capacity)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def record(self, op, gpioId, value=0):
+        with self._lock:
+            head = self._head
+            RECORD.pack_into(self._buf, head * RECORD.size,
+                             time.monotonic_ns(), op, gpioId, value)
+            head += 1
+            self._head = 0 if head == self._capacity else head
+
+            if self._count < self._capacity:
+                self._count += 1
+
+    def recordAttr(self, op, gpioId, value):
+        """
+        Record an attribute read or write with its string value.
+        """
+        self.record(op, gpioId, VALUE_CODES.get(value, -1))
+
+    def raw(self):
+        """
+        Return the records oldest first as bytes.
+        """
+        with self._lock:
+            end = self._head * RECORD.size
+            start = end - self._count * RECORD.size
+
+            if start >= 0:
+                return bytes(self._buf[start:end])
+
+            return bytes(self._buf[start:] + self._buf[:end])
+
+    def records(self):
+        """
+        Return the records oldest first as (timestamp_ns, op name, gpioId,
+        value) tuples.
+        """
+        return [(timestamp, OPS[op], gpioId, value)
+                for timestamp, op, gpioId, value
+                in RECORD.iter_unpack(self.raw())]
+
+    def text(self):
+        """
+        The records one per line with the time relative to the first.
+        """
+        records = self.records()
+        start = records[0][0] if records else 0
+        return '\n'.join("{:12.3f} us {:<12} {:>4} {}".format(
+            (timestamp - start) / 1000, op, gpioId, value)
+            for timestamp, op, gpioId, value in records)
+
+    def dump(self, path):
+        """
+        Write the raw records oldest first to path, read them back with
+        readTrace.
+        """
+        with open(path, 'wb') as f:
+            f.write(self.raw())
+
+    def clear(self):
+        with self._lock:
+            self._head = 0
+            self._count = 0
+
+
+def readTrace(path):
+    """
+    Return the records of a file written by TraceRing.dump as (timestamp_ns,
+    op name, gpioId, value) tuples.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    data = data[:len(data) - len(data) % RECORD.size]
+    return [(timestamp, OPS[op], gpioId, value)
+            for timestamp, op, gpioId, value in RECORD.iter_unpack(data)]
+
+
+def enableTracing(capacity=TraceRing.DEFAULT_CAPACITY):
+    """
+    Start tracing objects constructed from now on into a new ring, which is
+    returned.
+    """
+    global _tracer
+    _tracer = TraceRing(capacity)
+    return _tracer
+
+
+def disableTracing():
+    """
+    Stop tracing objects constructed from now on, objects already tracing
+    keep recording into their ring.
+    """
+    global _tracer
+    _tracer = None
+
+
+def getTracer():
+    """
+    Return the current ring or None if tracing is disabled.
+    """
+    return _tracer
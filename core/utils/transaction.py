@@ -0,0 +1,238 @@
+#
+# core/utils/transaction.py
+#
+
+"""
+Configure many pins together. The modes of the pins are staged then on
+commit all the pins are exported, waited on once and their attributes are
+written concurrently, so configuring a robot takes about as long as its
+slowest pin. If any pin fails every pin is put back as it was.
+
+    with gpio.transaction() as txn:
+        txn.stage('P8_7', direction=GPIO.OUT)
+        txn.stage('P8_8', direction=GPIO.IN, edge=GPIO.BOTH)
+
+    print(txn.report)
+
+by Carl J. Nobile
+
+THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .basegpio import BaseGPIO
+from .exceptions import (
+    InvalidDirectionException, InvalidEdgeException, TransactionException)
+
+
+class Transaction(object):
+    """
+    Pin modes staged to be applied together with a GPIO object. Used as a
+    context manager the transaction is committed on leaving the block
+    unless an exception was raised in it.
+
+    gpio    -- The GPIO object the pins are configured with.
+    workers -- The most attribute writes done at the same time.
+    """
+    DEFAULT_WORKERS = 8
+    # The order the attributes are applied in, an edge needs an input.
+    _APPLY_ORDER = (BaseGPIO._ACTIVE_LOW, BaseGPIO._DIRECTION, BaseGPIO._EDGE)
+    _RESTORE_ORDER = (BaseGPIO._DIRECTION, BaseGPIO._EDGE,
+                      BaseGPIO._ACTIVE_LOW)
+    __DIRECTIONS = ('in', 'out')
+    __EDGES = ('none', 'rising', 'falling', 'both')
+
+    def __init__(self, gpio, workers=DEFAULT_WORKERS):
+        self._gpio = gpio
+        self._workers = max(1, workers)
+        self._staged = {}
+        self._saved = {}
+        self.report = {}
+
+    def __len__(self):
+        return len(self._staged)
+
+    def stage(self, pin, direction=None, edge=None, activeLow=None):
+        """
+        Stage the mode of pin, arguments left as None are not changed.
+        Staging a pin again adds to what was staged before. Returns the
+        transaction.
+        """
+        if direction is not None and direction not in self.__DIRECTIONS:
+            raise InvalidDirectionException(pin)
+
+        if edge is not None and edge not in self.__EDGES:
+            raise InvalidEdgeException(pin)
+
+        attrs = self._staged.setdefault(self._gpio._getGpioId(pin), {})
+
+        for attr, value in ((BaseGPIO._DIRECTION, direction),
+                            (BaseGPIO._EDGE, edge),
+                            (BaseGPIO._ACTIVE_LOW, activeLow)):
+            if value is not None:
+                attrs[attr] = int(bool(value)) if attr == \
+                              BaseGPIO._ACTIVE_LOW else value
+
+        return self
+
+    def discard(self):
+        self._staged = {}
+
+    def commit(self):
+        """
+        Apply the staged modes and return a report of the seconds taken to
+        export, wait, configure and in total, and the seconds taken by each
+        pin keyed by gpioId. Raises TransactionException after rolling
+        back if any pin failed.
+        """
+        staged, self._staged = self._staged, {}
+        self._saved = {}
+        self.report = report = {'pins': {}}
+        start = time.perf_counter()
+
+        try:
+            if self._gpio._configures:
+                self._commitBackend(staged, report)
+            else:
+                self._commitSysfs(staged, report)
+        finally:
+            if self._gpio._shadow is not None:
+                for gpioId in staged:
+                    self._gpio._shadow.invalidate(gpioId)
+
+            report['total'] = time.perf_counter() - start
+
+        return report
+
+    def _commitSysfs(self, staged, report):
+        gpio = self._gpio
+        exported = []
+        start = time.perf_counter()
+
+        for gpioId in staged:
+            try:
+                if gpio._export(gpioId):
+                    exported.append(gpioId)
+            except OSError as e:
+                self._rollback(exported)
+                raise TransactionException({gpioId: e})
+
+        report['export'] = time.perf_counter() - start
+        start = time.perf_counter()
+        gpio._waitForExport(list(staged))
+        report['wait'] = time.perf_counter() - start
+        start = time.perf_counter()
+        fresh = set(exported)
+        errors = {}
+
+        with ThreadPoolExecutor(min(self._workers, max(1, len(staged))),
+                                thread_name_prefix='Transaction') as pool:
+            futures = [(gpioId, pool.submit(self._apply, gpioId, attrs,
+                                            gpioId not in fresh))
+                       for gpioId, attrs in staged.items()]
+
+            for gpioId, future in futures:
+                try:
+                    report['pins'][gpioId] = future.result()
+                except Exception as e:
+                    errors[gpioId] = e
+
+        report['configure'] = time.perf_counter() - start
+
+        if errors:
+            self._rollback(exported)
+            raise TransactionException(errors)
+
+    def _apply(self, gpioId, attrs, save):
+        """
+        Write the attributes of one pin through its own descriptors, the
+        values being replaced are saved first if the pin was already
+        exported.
+        """
+        gpio = self._gpio
+        paths = gpio._getPinPaths(gpioId)
+        start = time.perf_counter()
+
+        if save:
+            self._saved[gpioId] = saved = {}
+
+        for attr in self._APPLY_ORDER:
+            if attr in attrs:
+                if save:
+                    saved[attr] = gpio._readPin(paths[attr])
+
+                gpio._writePin(paths[attr], '{}\n'.format(attrs[attr]))
+
+        return time.perf_counter() - start
+
+    def _rollback(self, exported):
+        """
+        Put back the saved attributes and unexport the pins exported by
+        this transaction. Outputs put back come back low.
+        """
+        gpio = self._gpio
+
+        for gpioId, saved in self._saved.items():
+            paths = gpio._getPinPaths(gpioId)
+
+            for attr in self._RESTORE_ORDER:
+                if attr in saved:
+                    try:
+                        gpio._writePin(paths[attr],
+                                       '{}\n'.format(saved[attr]))
+                    except OSError as e:
+                        gpio._log.error("Could not restore gpio%s %s to %s, "
+                                        "%s", gpioId, attr, saved[attr], e)
+
+        for gpioId in exported:
+            try:
+                gpio._unexport(gpioId)
+            except OSError as e:
+                gpio._log.error("Could not unexport gpio%s, %s", gpioId, e)
+
+    def _commitBackend(self, staged, report):
+        """
+        Backends configure in process, the pins are done in turn and a
+        rollback releases the pins this transaction claimed.
+        """
+        backend = self._gpio._backend
+        claimed = []
+        start = time.perf_counter()
+
+        for gpioId, attrs in staged.items():
+            pinStart = time.perf_counter()
+
+            try:
+                if backend.setMode(gpioId,
+                                   direction=attrs.get(BaseGPIO._DIRECTION),
+                                   edge=attrs.get(BaseGPIO._EDGE)):
+                    claimed.append(gpioId)
+
+                if BaseGPIO._ACTIVE_LOW in attrs:
+                    backend.setActiveLow(gpioId, attrs[BaseGPIO._ACTIVE_LOW])
+            except Exception as e:
+                for claimedId in claimed:
+                    backend.release(claimedId)
+
+                raise TransactionException({gpioId: e})
+
+            report['pins'][gpioId] = time.perf_counter() - pinStart
+
+        report['configure'] = time.perf_counter() - start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()